@@ -1,72 +1,132 @@
 import json
 import re
-import openai
-from .cart_logic import cart_summary
-from .config import PIZZERIA
-from .rule_kb import classify as rule_classify
+from .rule_kb import classify as rule_classify, parse_order
+from .prompts import build_messages, cart_text, order_text
+from .llm import chat_completion, achat_completion, llm_available
+from .intent_cache import intent_cache, cache_key
+from .intent_model import predict_intents
+from .utils import trace
+from .metrics import timed
+from .tenants import current_tenant
 
-def understand(text, state):
-    """
-    Use an LLM to parse user text into structured intents and items.
-    """
-    # First, try rule-based classification from KB
-    rule_res = rule_classify(text)
-    if rule_res:
-        return rule_res
-    # Keep a rolling window of the last 6 messages (user and bot)
-    recent_msgs = state.get("history", [])[-6:]
-    chat_history = []
-    for msg in recent_msgs:
-        if isinstance(msg, dict):
-            # New-style entry with role/content
-            role = "Bot" if msg.get("role") == "assistant" else "User"
-            content = msg.get("content", "")
-        else:
-            # Legacy string entry: assume assistant message
-            role = "Bot"
-            content = msg
-        chat_history.append(f"{role}: {content}")
-    cart, _ = cart_summary(state.get("cart", []))
-    cart_text = "\n".join([f"{k} x{v}" for k, v in cart.items()]) or "Carrello vuoto"
-
-    # Build system prompt for intent parsing
-    last_order = state.get("last_order", {})
-    system_prompt = f"""
-Sei Mario, un assistente virtuale italiano per {PIZZERIA}. Il tuo compito è analizzare il messaggio dell'utente
+# Same for every message of a tenant, so the API can cache it as the prompt
+# prefix; {pizzeria} is the tenant's name
+INTENT_INSTRUCTIONS = """
+Sei Mario, un assistente virtuale italiano per {pizzeria}. Il tuo compito è analizzare il messaggio dell'utente
 e restituire *una lista JSON* con tutte le intenzioni riconosciute e gli articoli menzionati.
 
 Formato di output JSON:
-[
-  {{
-    "intent": "add_to_cart",
-    "items": [{{"name": "Coca-Cola", "quantity": 1}}]
-  }},
-  {{
-    "intent": "remove",
-    "items": [{{"name": "Diavola", "quantity": 1}}]
-  }}
-]
+[{"intent": "add_to_cart", "items": [{"name": "Coca-Cola", "quantity": 1}]}, {"intent": "remove", "items": [{"name": "Diavola", "quantity": 1}]}]
 
 Valori validi per 'intent':
 ["add_to_cart", "remove", "order", "menu", "checkout", "greet", "info", "track", "staff", "other"]
 
 Rispondi solo con un JSON valido. Nessuna spiegazione.
-Contesto:
-Carrello attuale:\n{cart_text}
-Conversazione recente:\n{chr(10).join(chat_history)}
-Ultimo ordine:\n{last_order}
-Messaggio utente:\n{text}
+""".strip()
+
+def _intent_messages(text, state):
+    """Messages asking the LLM for a JSON list of intents: instructions, then cart, last order and recent turns."""
+    context = f"Carrello attuale: {cart_text(state.get('cart'))}"
+    last_order = order_text(state.get("last_order"))
+    if last_order:
+        context += f"\nUltimo ordine: {last_order}"
+    return build_messages(
+        "understand_llm", current_tenant().prompt("intent", INTENT_INSTRUCTIONS), text, state, context=context, turns=6, transcript=True,
+    )
+
+def _parse_intents(response):
+    content = response.choices[0].message.content.strip()
+    print("LLM raw response:", content)
+    match = re.search(r"(\[.*\])", content, re.DOTALL)
+    return json.loads(match.group(1)) if match else []
+
+def _intent_names(intents):
+    return [i.get("intent") for i in intents if isinstance(i, dict)]
+
+def _local_intents(text):
+    """
+    Intents found without the LLM: plain orders with quantities, then the
+    rule KB, then the local classifier when it is confident.
+    """
+    with timed("slot_parse"):
+        slots = parse_order(text)
+    if slots:
+        trace("slots", intents=_intent_names(slots))
+        return slots
+    with timed("rule_classify"):
+        rule_res = rule_classify(text)
+    if rule_res:
+        trace("rules", intents=_intent_names(rule_res))
+        return rule_res
+    with timed("intent_model"):
+        predicted = predict_intents(text)
+    if predicted:
+        trace("intent_model", intents=_intent_names(predicted))
+        return predicted
+    return None
+
+def understand(text, state):
+    """
+    Use an LLM to parse user text into structured intents and items.
+    """
+    local = _local_intents(text)
+    if local:
+        return local
+    # Near-identical messages in the same context parse the same way
+    key = cache_key(text, state, current_tenant().id)
+    with timed("intent_cache"):
+        cached = intent_cache.get(key)
+    if cached is not None:
+        trace("intent_cache", intents=_intent_names(cached))
+        return cached
+    # Rule-only while the API is down: respond() sends the degraded reply
+    if not llm_available():
+        return []
+    try:
+        with timed("understand_llm"):
+            response = chat_completion(
+                stage="understand_llm",
+                messages=_intent_messages(text, state),
+                temperature=0.2
+            )
+        intents = _parse_intents(response)
+        # An empty parse may be a malformed reply: ask again next time
+        if intents:
+            intent_cache.set(key, intents)
+        trace("llm_intent", intents=_intent_names(intents))
+        return intents
+    except Exception as e:
+        print("LLM error:", e)
+        return []
+
+async def understand_async(text, state):
+    """
+    Same as understand(), awaiting the LLM instead of blocking the worker.
     """
+    local = _local_intents(text)
+    if local:
+        return local
+    key = cache_key(text, state, current_tenant().id)
+    with timed("intent_cache"):
+        cached = intent_cache.get(key)
+    if cached is not None:
+        trace("intent_cache", intents=_intent_names(cached))
+        return cached
+    if not llm_available():
+        return []
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4-1106-preview",
-            messages=[{"role": "system", "content": system_prompt}],
-            temperature=0.2
-        )
-        content = response.choices[0].message.content.strip()
-        print("LLM raw response:", content)
-        match = re.search(r"(\[.*\])", content, re.DOTALL)
-        return json.loads(match.group(1)) if match else []
+        with timed("understand_llm"):
+            response = await achat_completion(
+                stage="understand_llm",
+                messages=_intent_messages(text, state),
+                temperature=0.2
+            )
+        intents = _parse_intents(response)
+        # An empty parse may be a malformed reply: ask again next time
+        if intents:
+            intent_cache.set(key, intents)
+        trace("llm_intent", intents=_intent_names(intents))
+        return intents
     except Exception as e:
         print("LLM error:", e)
-        return []
\ No newline at end of file
+        return []
@@ -1,44 +1,102 @@
-import openai
+from .kb import get_embedding, get_embedding_async
+from .llm import LLMUnavailable, chat_completion, achat_completion, stream_completion
+from .prompts import build_messages
+from .utils import trace
+from .metrics import timed, timed_stream
+from .budget import BudgetExceeded, exceeded, remaining
+from .tenants import current_tenant
 
-from .config import PIZZERIA
-from .kb import kb
+# Default instructions; {pizzeria} is the tenant's name
+RAG_INSTRUCTIONS = (
+    "Sei Mario, un assistente virtuale per {pizzeria}. "
+    "Usa le informazioni seguenti se pertinenti per rispondere."
+)
+
+def _rag_messages(text, state, docs):
+    """Build the chat messages: instructions, KB documents (best first), recent history, user text."""
+    return build_messages(
+        "rag_completion", current_tenant().prompt("rag", RAG_INSTRUCTIONS), text, state,
+        docs=[d['text'] for d in docs], turns=10,
+    )
+
+def _index():
+    """The tenant's KB, waiting for its warm-up at most what is left of the budget."""
+    try:
+        return current_tenant().kb.get(timeout=remaining())
+    except RuntimeError as e:
+        raise exceeded("rag_index") from e
+
+async def _index_async():
+    try:
+        return await current_tenant().kb.get_async(timeout=remaining())
+    except RuntimeError as e:
+        raise exceeded("rag_index") from e
+
+def _retrieve(text):
+    """Top documents of the tenant's KB for the text (none while the KB is empty or not ready)."""
+    try:
+        kb = _index()
+        if not kb.docs:
+            return []
+        with timed("rag_embedding"):
+            q_emb = get_embedding(text, stage="rag_embedding")
+    except LLMUnavailable:
+        raise
+    except BudgetExceeded:
+        # Answer without KB context rather than not at all
+        return []
+    with timed("rag_search"):
+        return kb.search(q_emb, top_k=3)
 
 def rag_response(text, state):
     """
     Retrieval-Augmented Generation fallback: retrieve relevant KB docs and generate answer.
     """
+    trace("rag")
     # Retrieve top docs
-    docs = kb.query(text, top_k=3)
-    context = "\n\n".join([d['text'] for d in docs])
-
-    # Build recent conversation context (last 10 messages)
-    # Build recent conversation context (last 10 messages)
-    recent = state.get("history", [])[-10:]
-    messages = []
-    for msg in recent:
-        # Support both new dict entries and legacy string entries
-        if isinstance(msg, dict):
-            r = msg.get('role', 'assistant')
-            role = 'assistant' if r == 'assistant' else 'user'
-            content = msg.get('content', '')
-        else:
-            # Legacy string entry: assume assistant message
-            role = 'assistant'
-            content = msg
-        messages.append({"role": role, "content": content})
-
-    # Prepend system prompt with KB context
-    system_prompt = (
-        f"Sei Mario, un assistente virtuale per {PIZZERIA}. "
-        "Usa le seguenti informazioni se pertinenti per rispondere:\n" + context
-    )
-    all_messages = [{"role": "system", "content": system_prompt}] + messages + [
-        {"role": "user", "content": text}
-    ]
+    docs = _retrieve(text)
+    with timed("rag_completion"):
+        response = chat_completion(
+            stage="rag_completion",
+            messages=_rag_messages(text, state, docs),
+            temperature=0.3
+        )
+    return response.choices[0].message.content.strip()
 
-    response = openai.chat.completions.create(
-        model="gpt-4-1106-preview",
-        messages=all_messages,
+def rag_response_stream(text, state):
+    """
+    Same as rag_response(), retrieving now and returning an iterator over the
+    answer as it is generated.
+    """
+    trace("rag")
+    docs = _retrieve(text)
+    return timed_stream("rag_completion", stream_completion(
+        stage="rag_completion",
+        messages=_rag_messages(text, state, docs),
         temperature=0.3
-    )
-    return response.choices[0].message.content.strip()
\ No newline at end of file
+    ))
+
+async def rag_response_async(text, state):
+    """
+    Same as rag_response(), awaiting the embedding and completion calls.
+    """
+    trace("rag")
+    docs = []
+    try:
+        index = await _index_async()
+        if index.docs:
+            with timed("rag_embedding"):
+                q_emb = await get_embedding_async(text, stage="rag_embedding")
+            with timed("rag_search"):
+                docs = index.search(q_emb, top_k=3)
+    except LLMUnavailable:
+        raise
+    except BudgetExceeded:
+        pass
+    with timed("rag_completion"):
+        response = await achat_completion(
+            stage="rag_completion",
+            messages=_rag_messages(text, state, docs),
+            temperature=0.3
+        )
+    return response.choices[0].message.content.strip()
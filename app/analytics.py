@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Streaming analytics over the chat logs and the order store.
+
+Reads chat.log and its gzipped rotated segments line by line, so memory stays
+bounded whatever the log size, and reports the message volume, intent mix,
+which stage handled each message (dialog flow, rule KB, intent cache or the
+LLM paths), conversion from first message to checkout, and items ordered.
+Legacy orders.log files are counted as checkouts.
+
+With --state the totals and the position reached in every file are saved, and
+the next run only reads what was appended since. --jobs spreads the files
+across a process pool.
+
+    python -m app.analytics [LOG_DIR or files...] [--state analytics.json] [--jobs 4] [--json]
+"""
+import os
+import sys
+import gzip
+import json
+import sqlite3
+import hashlib
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+if __name__ == '__main__' and __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = 'app'
+
+from .config import LOG_DIR, ORDER_STORE_PATH
+
+# Stages that cost at least one LLM round-trip
+LLM_STAGES = ("llm_intent", "function_call", "rag")
+# Counters merged across files and runs
+COUNTERS = ("stages", "handled_by", "intents", "functions", "days", "items", "legacy_items")
+TOTALS = ("messages", "llm_messages", "sessions", "checkouts", "converted", "legacy_orders")
+
+def new_stats():
+    stats = {name: Counter() for name in COUNTERS}
+    stats.update({name: 0 for name in TOTALS})
+    return stats
+
+def merge(into, other):
+    for name in COUNTERS:
+        into[name].update(other.get(name, {}))
+    for name in TOTALS:
+        into[name] += other.get(name, 0)
+    return into
+
+def _open(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+def fingerprint(path):
+    """Identity of a log file that survives rotation: hash of its first line."""
+    with _open(path) as f:
+        first = f.readline()
+    if not first.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first).hexdigest()
+
+def read_records(path, offset=0):
+    """
+    Yield (record, end offset) for every complete JSON line after offset.
+    Offsets count uncompressed bytes, so a live file's position stays valid
+    once it is rotated and gzipped. A trailing partial line is left for the
+    next run.
+    """
+    with _open(path) as f:
+        if offset:
+            f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            try:
+                yield json.loads(line), offset
+            except ValueError:
+                continue
+
+def add_record(stats, record):
+    if "main_item" in record:
+        # orders.log line written before the order store existed
+        stats["legacy_orders"] += 1
+        stats["legacy_items"][record["main_item"]] += record.get("total_items") or 0
+        return
+    if "user" not in record:
+        return
+    stats["messages"] += 1
+    stats["days"][(record.get("timestamp") or "")[:10]] += 1
+    stages = record.get("stages") or ["untracked"]
+    stats["stages"].update(set(stages))
+    stats["handled_by"][stages[-1]] += 1
+    if any(s in LLM_STAGES for s in stages):
+        stats["llm_messages"] += 1
+    stats["intents"].update(i for i in record.get("intents") or () if i)
+    if record.get("function"):
+        stats["functions"][record["function"]] += 1
+    if record.get("new_session"):
+        stats["sessions"] += 1
+    if record.get("order"):
+        stats["checkouts"] += 1
+        if record.get("first_order"):
+            stats["converted"] += 1
+
+def scan_file(path, offset=0):
+    """Aggregate one file from offset; return (stats, new offset)."""
+    stats = new_stats()
+    for record, offset in read_records(path, offset):
+        add_record(stats, record)
+    return stats, offset
+
+def find_logs(paths):
+    """Chat and legacy order logs under the given files or directories, oldest first."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                if name.startswith(("chat.log", "orders.log")) and not name.endswith((".lock", ".tmp")):
+                    found.append(os.path.join(path, name))
+        elif os.path.isfile(path):
+            found.append(path)
+    return sorted(found, key=lambda p: (os.path.getmtime(p), p))
+
+def scan_orders(path, after_id=0):
+    """Items sold in orders with id > after_id; return (items, last id)."""
+    items, last = Counter(), after_id
+    if not os.path.exists(path):
+        return items, last
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        last = conn.execute("SELECT MAX(id) FROM orders").fetchone()[0] or after_id
+        for name, qty in conn.execute(
+            "SELECT name, SUM(quantity) FROM order_items WHERE order_id > ? AND order_id <= ? GROUP BY name",
+            (after_id, last),
+        ):
+            items[name] += qty
+    return items, last
+
+def load_state(path):
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+        state["stats"] = merge(new_stats(), state.get("stats", {}))
+        state.setdefault("sealed", [])
+        return state
+    return {"files": {}, "sealed": [], "orders_after": 0, "stats": new_stats()}
+
+def save_state(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def run(paths, state, jobs=1, orders_path=ORDER_STORE_PATH):
+    """Fold everything new in the logs and order store into state."""
+    positions, sealed = state["files"], set(state["sealed"])
+    work = []
+    for path in find_logs(paths):
+        fp = fingerprint(path)
+        if fp is None or fp in sealed:
+            continue
+        start = positions.get(fp, 0)
+        if path.endswith(".gz") or start < os.path.getsize(path):
+            work.append((fp, path, start))
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(scan_file, [w[1] for w in work], [w[2] for w in work]))
+    else:
+        results = [scan_file(path, start) for _, path, start in work]
+    for (fp, path, _), (stats, offset) in zip(work, results):
+        merge(state["stats"], stats)
+        positions[fp] = offset
+        if path.endswith(".gz"):
+            # Rotated segments never change again
+            sealed.add(fp)
+            positions.pop(fp)
+    state["sealed"] = sorted(sealed)
+    items, state["orders_after"] = scan_orders(orders_path, state["orders_after"])
+    state["stats"]["items"].update(items)
+    return state
+
+def _share(n, total):
+    return f"{n:>8}  {n / total:6.1%}" if total else f"{n:>8}"
+
+def report(stats, out=sys.stdout):
+    messages = stats["messages"]
+    print(f"Messages: {messages}  (LLM involved: {_share(stats['llm_messages'], messages).strip()})", file=out)
+    print(f"Sessions: {stats['sessions']}  checkouts: {stats['checkouts']}  "
+          f"converted sessions: {_share(stats['converted'], stats['sessions']).strip()}", file=out)
+    if stats["legacy_orders"]:
+        print(f"Legacy orders.log checkouts: {stats['legacy_orders']}", file=out)
+    sections = (
+        ("Handled by (last stage)", "handled_by", messages),
+        ("Stages touched", "stages", messages),
+        ("Intent mix", "intents", sum(stats["intents"].values())),
+        ("Function calls", "functions", sum(stats["functions"].values())),
+        ("Items ordered", "items", sum(stats["items"].values())),
+        ("Legacy main items", "legacy_items", sum(stats["legacy_items"].values())),
+    )
+    for title, name, total in sections:
+        if not stats[name]:
+            continue
+        print(f"\n{title}:", file=out)
+        for key, n in stats[name].most_common():
+            print(f"  {key:<24}{_share(n, total)}", file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chat and order analytics")
+    parser.add_argument("paths", nargs="*", default=[LOG_DIR], help="log files or directories (default LOG_DIR)")
+    parser.add_argument("--state", help="JSON file with saved totals and offsets for incremental runs")
+    parser.add_argument("--orders", default=ORDER_STORE_PATH, help="order store (SQLite)")
+    parser.add_argument("--jobs", type=int, default=1, help="processes to spread files across")
+    parser.add_argument("--json", action="store_true", help="print the totals as JSON")
+    args = parser.parse_args(argv)
+
+    state = run(args.paths, load_state(args.state), jobs=args.jobs, orders_path=args.orders)
+    if args.state:
+        save_state(args.state, state)
+    if args.json:
+        json.dump(state["stats"], sys.stdout, indent=2)
+        print()
+    else:
+        report(state["stats"])
+
+if __name__ == "__main__":
+    main()
@@ -3,36 +3,108 @@
 Entrypoint for running the Flask app.
 Supports both module and script execution.
 """
-import os, sys
+import os, sys, time
+# Start of the cold-start clock: module import to first served response
+BOOT_TIME = time.time()
 if __name__ == '__main__' and __package__ is None:
     # when run as script, add project root to path and set package context
     pkg_root = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(pkg_root)
     sys.path.insert(0, project_root)
     __package__ = 'app'
-from flask import Flask, request, render_template, session, jsonify
+from flask import Flask, Response, request, render_template, session, jsonify, g, request_finished, stream_with_context
 from flask_session import Session
+from collections import defaultdict
 import os
+import json
 import stripe
 
-from .config import SECRET_KEY, PIZZERIA, INFO, STRIPE_WEBHOOK_SECRET
-from .rule_kb import responses_template
-from .openai_funcs import handle_function_call
-from .state_handler import get_state, set_state
+from .config import SECRET_KEY, SESSION_LIFETIME, STRIPE_WEBHOOK_SECRET, KB_WARMUP
+from .openai_funcs import handle_function_call, handle_function_call_async, handle_function_call_stream
+from .state_handler import get_state, set_state, flush_state, persist_state
 from .menu_helpers import format_menu, best_match
-from .ai_intent import understand
+from .ai_intent import understand, understand_async
 from .ai_rag import rag_response
-from .cart_logic import cart_summary, confirm_order, do_checkout
-from .utils import log_chat
+from .cart_logic import cart_summary, confirm_order, do_checkout, find_order
+from .utils import log_chat, trace
+from .history import remember
+from .tenants import tenants, current_tenant, split_tenant_path
+from .metrics import registry, timed, begin_request, end_request
+from .budget import BudgetExceeded, begin_budget
+from .llm import LLMUnavailable, llm_available
+from .breaker import breaker
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
 app.config["SESSION_TYPE"] = "filesystem"
+app.config["PERMANENT_SESSION_LIFETIME"] = SESSION_LIFETIME
+# Only write sessions that changed (see state_handler.StateContext for expiry)
+app.config["SESSION_REFRESH_EACH_REQUEST"] = False
 Session(app)
+# Session state is written back once per request, after the handler returns
+app.after_request(flush_state)
+
+# Routes are also served under /t/<tenant>/ for the tenants of TENANTS_DIR
+_wsgi_app = app.wsgi_app
+def _tenant_wsgi_app(environ, start_response):
+    return _wsgi_app(split_tenant_path(environ), start_response)
+app.wsgi_app = _tenant_wsgi_app
+
+@app.before_request
+def load_tenant():
+    """Load the request's restaurant (on its first request in this worker); 404 if there is none."""
+    tenant_id = tenants.resolve(request.environ)
+    tenant = tenants.get(tenant_id)
+    if tenant is None:
+        return jsonify({"error": f"Ristorante '{tenant_id}' non trovato"}), 404
+    g.tenant = tenant
+
+# Per-stage /chat metrics, labelled by the stage that produced the reply
+@app.before_request
+def start_metrics():
+    if request.endpoint in ("chat", "chat_stream"):
+        begin_request(current_tenant().id)
+        begin_budget()
+
+def _reply_path():
+    stages = (g.get("chat_trace") or {}).get("stages")
+    return stages[-1] if stages else "none"
+
+def finish_metrics(sender, response, **extra):
+    # Streamed replies are still running here; their generator ends the request
+    if not g.get("streaming"):
+        end_request(_reply_path())
+
+request_finished.connect(finish_metrics, app)
+
+# Time the Flask-Session write, which happens after the after_request hooks
+_save_session = app.session_interface.save_session
+def _timed_save_session(*args, **kwargs):
+    with timed("session_save"):
+        return _save_session(*args, **kwargs)
+app.session_interface.save_session = _timed_save_session
+
+# Cold-start timings in seconds since BOOT_TIME
+cold_start = {"import": round(time.time() - BOOT_TIME, 3), "first_response": None}
+
+@app.after_request
+def track_first_response(response):
+    if cold_start["first_response"] is None:
+        cold_start["first_response"] = round(time.time() - BOOT_TIME, 3)
+        print(f"Cold start: imported in {cold_start['import']}s, first response after {cold_start['first_response']}s")
+    return response
+
+# Build the RAG index off the request path; rule/menu/cart replies never wait for
+# it. Other tenants' indexes are built when the tenant is loaded
+if KB_WARMUP:
+    tenants.default.kb.warm_up()
 
 # Chat handler
-def respond(text):
-    state = get_state()
+def _dialog_step(text, state):
+    """
+    Handle the order flow steps, welcome and pending upsell answers.
+    Return the reply, or None when the message needs intent parsing.
+    """
     # If in the middle of detailed order flow, handle steps sequentially
     step = state.get('step')
     if step == 'await_name':
@@ -119,7 +191,9 @@ __Confermi l'ordine?___ (sì / no)"""
     if text == "!welcome" or state.get("step") == "start":
         state["step"] = "ordering"
         set_state(state)
-        return f"👋 Benvenuto in *{PIZZERIA}*! Vuoi vedere il menu o ordinare subito? La Diavola oggi è 🔥"
+        return current_tenant().response(
+            'welcome', "👋 Benvenuto in *{name}*! Vuoi vedere il menu o ordinare subito?"
+        )
 
     # Intercept pending upsell suggestions before intent parsing
     if state.get('step') == 'ordering' and state.get('pending_suggestion'):
@@ -131,7 +205,7 @@ __Confermi l'ordine?___ (sì / no)"""
         if text_low in yes_values:
             match = best_match(suggestion_name)
             if match:
-                state['cart'].append(match)
+                state['cart'].add(match)
                 items_added = [(match['name'], 1)]
                 # clear previous suggestion
                 state.pop('pending_suggestion', None)
@@ -153,14 +227,13 @@ __Confermi l'ordine?___ (sì / no)"""
         # Unrelated response: clear suggestion and continue normal flow
         state.pop('pending_suggestion', None)
         set_state(state)
+    return None
 
-    parsed_intents = understand(text, state)
-
-    # Fallback: if no intent parsed, delegate to function-calling handler
-    if not parsed_intents:
-        return handle_function_call(text, state)
-
-    from collections import defaultdict
+def _apply_intents(text, state, parsed_intents):
+    """
+    Apply parsed intents to the state and build the reply parts.
+    A None part marks where the function-calling fallback reply goes.
+    """
     intent_bucket = defaultdict(list)
 
     for action in parsed_intents:
@@ -175,6 +248,7 @@ __Confermi l'ordine?___ (sì / no)"""
     responses = []
     added = []
     removed = []
+    tenant = current_tenant()
 
     if intent_bucket.get("add_to_cart"):
         combined = defaultdict(int)
@@ -183,8 +257,7 @@ __Confermi l'ordine?___ (sì / no)"""
         for name, qty in combined.items():
             match = best_match(name)
             if match:
-                for _ in range(qty):
-                    state["cart"].append(match)
+                state["cart"].add(match, qty)
                 added.append((match["name"], qty))
             else:
                 responses.append(f"'{name}' non è nel nostro menu. Vuoi che ti mostri le opzioni?")
@@ -193,9 +266,7 @@ __Confermi l'ordine?___ (sì / no)"""
         for i in intent_bucket["remove"]:
             name = i["name"]
             qty = i.get("quantity", 1)
-            matches = [x for x in state["cart"] if x["name"].lower() == name.lower()]
-            for m in matches[:qty]:
-                state["cart"].remove(m)
+            if state["cart"].remove(name, qty):
                 removed.append(name)
 
     set_state(state)
@@ -216,12 +287,12 @@ __Confermi l'ordine?___ (sì / no)"""
             continue
         # Show menu on 'menu' intent
         if intent == "menu":
-            header = responses_template.get('menu', '📋 Ecco il nostro menu completo!')
+            header = tenant.response('menu', '📋 Ecco il nostro menu completo!')
             responses.append(f"{header}\n\n" + format_menu())
         # Acknowledge order intent and show menu
         elif intent == "order":
             # Conversational acknowledgement
-            ack = responses_template.get(
+            ack = tenant.response(
                 'order_start',
                 "Ho capito, desideri fare un ordine. Ecco il nostro menu:"
             )
@@ -229,19 +300,18 @@ __Confermi l'ordine?___ (sì / no)"""
             responses.append(format_menu())
         elif intent in ["greet", "info"]:
             if intent == 'greet':
-                responses.append(responses_template.get('greet', f"👋 Ciao! Benvenuto in {PIZZERIA}!"))
+                responses.append(tenant.response('greet', "👋 Ciao! Benvenuto in {name}!"))
             else:
-                responses.append(responses_template.get('info', f"📍 {INFO['address']}\n🕒 {INFO['hours']}\n📞 {INFO['phone']}"))
+                responses.append(tenant.response('info', "📍 {address}\n🕒 {hours}\n📞 {phone}"))
         elif intent == "track":
-            lo = state.get("last_order")
+            lo = find_order(state)
             if lo:
-                eta = lo.get('eta', '')
-                tpl = responses_template.get('track', 'Il tuo ordine sarà pronto per il ritiro alle {eta}.')
-                responses.append(tpl.format(eta=eta))
+                eta = lo.get('eta') or ''
+                responses.append(tenant.response('track', 'Il tuo ordine sarà pronto per il ritiro alle {eta}.', eta=eta))
             else:
-                responses.append(responses_template.get('fallback', 'Nessun ordine trovato. Vuoi ordinarne uno?'))
+                responses.append(tenant.response('fallback', 'Nessun ordine trovato. Vuoi ordinarne uno?'))
         elif intent == "staff":
-            responses.append(responses_template.get('other', 'Ti metto in contatto con lo staff... scherzo! Sono ancora io. Dimmi pure.'))
+            responses.append(tenant.response('other', 'Ti metto in contatto con lo staff... scherzo! Sono ancora io. Dimmi pure.'))
         elif intent == "checkout":
             # Begin detailed order flow: collect customer info
             state['step'] = 'await_name'
@@ -250,38 +320,210 @@ __Confermi l'ordine?___ (sì / no)"""
             responses.append("Perfetto, proseguiamo con l'ordine! Prima di tutto, come ti chiami?")
         elif intent == "other":
             # Fallback for miscellaneous queries via function calling
-            responses.append(handle_function_call(text, state))
+            responses.append(None)
     # If still no response, use function-calling fallback
     if not responses:
-        responses.append(handle_function_call(text, state))
+        responses.append(None)
+    return responses
+
+def _budget_fallback():
+    """Reply when the latency budget ran out before an LLM stage could answer."""
+    trace("budget_fallback")
+    return current_tenant().response('fallback', "Non ho capito bene. Vuoi vedere il menu, fare un ordine, o hai bisogno d'aiuto?")
+
+def _degraded_reply():
+    """Reply while the OpenAI API is unavailable (circuit breaker open): what works without it."""
+    trace("degraded")
+    return current_tenant().response('degraded', "Al momento posso aiutarti solo con il menu, il carrello e l'ordine.")
+
+def _fallback(e):
+    return _degraded_reply() if isinstance(e, LLMUnavailable) else _budget_fallback()
+
+def _answer(text, state):
+    """
+    LLM cascade for messages the rules and intents did not settle: function
+    calling, then RAG, each stage within what is left of the latency budget.
+    """
+    if not llm_available():
+        return _degraded_reply()
+    try:
+        return handle_function_call(text, state)
+    except BudgetExceeded as e:
+        return _fallback(e)
+
+async def _answer_async(text, state):
+    if not llm_available():
+        return _degraded_reply()
+    try:
+        return await handle_function_call_async(text, state)
+    except BudgetExceeded as e:
+        return _fallback(e)
+
+def _answer_stream(text, state):
+    if not llm_available():
+        return _degraded_reply()
+    try:
+        reply = handle_function_call_stream(text, state)
+    except BudgetExceeded as e:
+        return _fallback(e)
+    return reply if isinstance(reply, str) else _stream_or_fallback(reply)
+
+def _stream_or_fallback(chunks):
+    # A reply cut short keeps what was sent; one that never started gets the fallback
+    started = False
+    try:
+        for chunk in chunks:
+            started = True
+            yield chunk
+    except BudgetExceeded as e:
+        if not started:
+            yield _fallback(e)
+
+def respond(text):
+    state = get_state()
+    reply = _dialog_step(text, state)
+    if reply is not None:
+        trace("dialog")
+        return reply
+
+    parsed_intents = understand(text, state)
+
+    # Fallback: if no intent parsed, delegate to function-calling handler
+    if not parsed_intents:
+        return _answer(text, state)
+
+    responses = _apply_intents(text, state, parsed_intents)
+    return "\n\n".join(
+        r if r is not None else _answer(text, state) for r in responses
+    )
+
+async def respond_async(text):
+    """
+    Same as respond(), awaiting the LLM stages so the event loop can serve
+    other conversations meanwhile.
+    """
+    state = get_state()
+    reply = _dialog_step(text, state)
+    if reply is not None:
+        trace("dialog")
+        return reply
+
+    parsed_intents = await understand_async(text, state)
+    if not parsed_intents:
+        return await _answer_async(text, state)
 
+    responses = _apply_intents(text, state, parsed_intents)
+    for i, r in enumerate(responses):
+        if r is None:
+            responses[i] = await _answer_async(text, state)
     return "\n\n".join(responses)
 
+def respond_stream(text):
+    """
+    Same as respond(), returning the reply as a list of parts: strings for the
+    deterministic replies and iterators over the LLM-written ones. Every state
+    change is applied before returning; only the final completions are lazy.
+    """
+    state = get_state()
+    reply = _dialog_step(text, state)
+    if reply is not None:
+        trace("dialog")
+        return [reply]
+
+    parsed_intents = understand(text, state)
+    if not parsed_intents:
+        return [_answer_stream(text, state)]
+
+    responses = _apply_intents(text, state, parsed_intents)
+    return [r if r is not None else _answer_stream(text, state) for r in responses]
+
 
 @app.route("/")
 def index():
-    return render_template("chat.html")
+    return render_template("chat.html", tenant=current_tenant())
 
 
-@app.route("/chat", methods=["POST"])
-def chat():
+def _record_user_message():
     user_input = request.json.get("message", "")
     # Log user message
     state = get_state()
-    state.setdefault("history", []).append({"role": "user", "content": user_input})
+    remember(state, "user", user_input)
     set_state(state)
-    # Generate response
-    reply = respond(user_input)
+    return user_input
+
+def _finish_reply(user_input, reply):
     # Log assistant message
     state = get_state()
-    state.setdefault("history", []).append({"role": "assistant", "content": reply})
+    remember(state, "assistant", reply)
     set_state(state)
     # Persist chat to file for analytics
     try:
         log_chat(user_input, reply)
     except Exception:
         pass
-    return jsonify({"response": reply, "cart": state.get("cart", [])})
+    return {"response": reply, "cart": state["cart"].to_dict()}
+
+def _chat_response(user_input, reply):
+    return jsonify(_finish_reply(user_input, reply))
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    user_input = _record_user_message()
+    # Generate response
+    reply = respond(user_input)
+    return _chat_response(user_input, reply)
+
+async def chat_async():
+    """
+    /chat for the ASGI entrypoint (app.asgi): same request and response,
+    with the reply generated by respond_async().
+    """
+    user_input = _record_user_message()
+    reply = await respond_async(user_input)
+    return _chat_response(user_input, reply)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    /chat with the reply sent as server-sent events while the LLM writes it:
+    "delta" events carry the text as it arrives, then a "done" event the whole
+    reply and the cart ("error" if the LLM failed half-way).
+    """
+    user_input = _record_user_message()
+    parts = respond_stream(user_input)
+    g.streaming = True
+
+    def generate():
+        reply = ""
+        try:
+            for i, part in enumerate(parts):
+                # Deterministic parts go out whole, LLM parts as they arrive
+                chunks = [part] if isinstance(part, str) else part
+                for j, chunk in enumerate(chunks):
+                    if i and not j:
+                        chunk = "\n\n" + chunk
+                    reply += chunk
+                    yield _sse("delta", {"text": chunk})
+        except Exception as e:
+            print(f"Streaming error: {e}")
+            persist_state()
+            end_request(_reply_path())
+            yield _sse("error", {"response": reply})
+            return
+        payload = _finish_reply(user_input, reply)
+        # The session was saved when the response started; save what changed since
+        persist_state()
+        end_request(_reply_path())
+        yield _sse("done", payload)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/stripe-webhook", methods=["POST"])
@@ -303,6 +545,24 @@ def stripe_webhook():
 def health():
     return "OK", 200
 
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics, summed over all workers."""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/ready")
+def ready():
+    """
+    Readiness: 200 once the tenant's RAG index is warm, 503 while it is still
+    loading. Starts the warm-up if nothing has (KB_WARMUP=0) or it failed.
+    """
+    kb = current_tenant().kb
+    kb.warm_up()
+    status = {"ready": kb.ready, "kb": kb.status(), "llm": breaker.state, "cold_start": cold_start}
+    return jsonify(status), 200 if kb.ready else 503
+
 if __name__ == "__main__":
     # Allow the port to be configured via the PORT env var (default 5000)
     port = int(os.environ.get("PORT", 5000))
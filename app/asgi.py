@@ -0,0 +1,144 @@
+"""
+ASGI entrypoint for the async /chat pipeline.
+
+POST /chat runs respond_async() on the event loop, so one process can keep
+hundreds of conversations waiting on the LLM (bounded by LLM_CONCURRENCY).
+Every other route is served by the regular Flask app in a worker thread,
+its body forwarded chunk by chunk (so /chat/stream events are not buffered).
+Sessions, after_request hooks and cookies go through Flask as usual.
+
+    uvicorn app.asgi:app
+    gunicorn app.asgi:app -k uvicorn.workers.UvicornWorker
+"""
+import asyncio
+import io
+import sys
+
+from .app import app as flask_app, chat_async
+from .log_writer import close_logs
+from .tenants import split_tenant_path
+
+ASYNC_ROUTES = {("POST", "/chat"): chat_async}
+
+
+def _environ(scope, body):
+    """Build a WSGI environ from an ASGI HTTP scope and its request body."""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _dispatch_async(view, environ):
+    """Run an async view inside a full Flask request context."""
+    with flask_app.request_context(environ):
+        try:
+            rv = flask_app.preprocess_request()
+            if rv is None:
+                rv = await view()
+            response = flask_app.finalize_request(rv)
+        except Exception as e:
+            response = flask_app.handle_exception(e)
+        return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+
+def _dispatch_sync(environ, loop, queue):
+    """
+    Run the Flask WSGI app for routes without an async handler, in this
+    (worker) thread, handing the status and each body chunk to the event loop
+    as they are produced so streamed responses are not buffered.
+    """
+    def put(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def start_response(status, headers, exc_info=None):
+        put(("start", int(status.split(" ", 1)[0]), headers))
+
+    try:
+        result = flask_app.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    put(("body", chunk))
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+    finally:
+        put(("end",))
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.to_thread(close_logs)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    # Routes under /t/<tenant>/ match once the prefix is split off
+    environ = split_tenant_path(_environ(scope, await _read_body(receive)))
+    view = ASYNC_ROUTES.get((scope["method"], environ["PATH_INFO"]))
+    if view is not None:
+        status, headers, body = await _dispatch_async(view, environ)
+        await _send_start(send, status, headers)
+        await send({"type": "http.response.body", "body": body})
+        return
+    queue = asyncio.Queue()
+    worker = asyncio.ensure_future(asyncio.to_thread(_dispatch_sync, environ, asyncio.get_running_loop(), queue))
+    while True:
+        item = await queue.get()
+        if item[0] == "start":
+            await _send_start(send, item[1], item[2])
+        elif item[0] == "body":
+            await send({"type": "http.response.body", "body": item[1], "more_body": True})
+        else:
+            break
+    # Raises if the Flask app failed before starting the response
+    await worker
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _send_start(send, status, headers):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
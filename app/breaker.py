@@ -0,0 +1,71 @@
+import time
+import threading
+
+from .config import BREAKER_FAILURES, BREAKER_COOLDOWN
+from .metrics import registry
+
+class CircuitBreaker:
+    """
+    Circuit breaker in front of the OpenAI API, one per worker. After
+    BREAKER_FAILURES failed calls in a row it opens: LLM calls are refused at
+    once and /chat answers from the rules, menu and cart only. After
+    BREAKER_COOLDOWN seconds a single trial call goes through (half-open); it
+    closes the breaker if it succeeds and reopens it if it fails or ends
+    without an answer.
+    """
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._failed = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Whether an LLM call would be let through now (without claiming the trial call)."""
+        with self._lock:
+            return self.state == "closed" or (
+                self.state == "open" and time.monotonic() - self._opened >= self.cooldown
+            )
+
+    def allow(self):
+        """Permission for one call: always while closed, only the trial call once the cooldown is over."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened >= self.cooldown:
+                self._set("half_open")
+                return True
+            return False
+
+    def succeeded(self):
+        with self._lock:
+            self._failed = 0
+            if self.state != "closed":
+                self._set("closed")
+
+    def failed(self):
+        with self._lock:
+            self._failed += 1
+            if self.state == "half_open" or (self.state == "closed" and self._failed >= self.failures):
+                self._opened = time.monotonic()
+                self._set("open")
+
+    def abandoned(self):
+        """
+        The call ended without telling whether the API works (timeout cut short
+        by the budget, cancelled): a trial call reopens the breaker for another cooldown.
+        """
+        with self._lock:
+            if self.state == "half_open":
+                self._opened = time.monotonic()
+                self._set("open")
+
+    def _set(self, state):
+        if state == "open":
+            print(f"OpenAI circuit breaker open after {self._failed} failed calls; rule-only replies for {self.cooldown}s")
+        self.state = state
+        registry.inc("hungergod_llm_breaker_transitions_total", {"state": state})
+        registry.set("hungergod_llm_breaker_open", {}, 0 if state == "closed" else 1)
+
+breaker = CircuitBreaker()
@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+
+import openai
+from flask import g, has_request_context
+
+from .config import CHAT_BUDGET, CHAT_MIN_STAGE_SECONDS, STAGE_DEADLINES
+from .metrics import registry
+from .utils import trace
+
+class BudgetExceeded(Exception):
+    """An LLM stage could not start, or finish, within the request's latency budget."""
+    def __init__(self, stage):
+        super().__init__(f"latency budget exhausted at {stage}")
+        self.stage = stage
+
+class Budget:
+    """
+    Latency budget of one /chat message: CHAT_BUDGET seconds in total, each LLM
+    stage capped by its own deadline and by what is left of the total.
+    """
+    def __init__(self, total=CHAT_BUDGET, deadlines=STAGE_DEADLINES, min_stage=CHAT_MIN_STAGE_SECONDS):
+        self.total = total
+        self.deadlines = deadlines
+        self.min_stage = min_stage
+        self.start = time.monotonic()
+        # LLM stages started for this message, in order
+        self.ran = []
+
+    def remaining(self):
+        return self.total - (time.monotonic() - self.start)
+
+    def timeout(self, stage):
+        """Seconds the stage may take; raise BudgetExceeded when too little is left to start it."""
+        left = self.remaining()
+        if left < self.min_stage:
+            raise exceeded(stage)
+        self.ran.append(stage)
+        trace(llm_stages=self.ran)
+        return min(left, self.deadlines.get(stage, left))
+
+def begin_budget():
+    """Start the latency budget of the current /chat request."""
+    g.budget = Budget()
+
+def remaining():
+    """Seconds left of the current request's budget (None outside a budgeted request)."""
+    budget = g.get("budget") if has_request_context() else None
+    return None if budget is None else max(budget.remaining(), 0)
+
+def exceeded(stage):
+    """BudgetExceeded for a stage that ran out of time, counted and traced."""
+    registry.inc("hungergod_budget_exhausted_total", {"stage": stage})
+    trace(budget_exhausted=stage)
+    return BudgetExceeded(stage)
+
+@contextmanager
+def deadline(stage):
+    """
+    Yield the timeout for one LLM call of this stage (its deadline alone outside
+    a budgeted request, the client's default for calls without a stage) and
+    turn a timed-out call into BudgetExceeded.
+    """
+    budget = g.get("budget") if has_request_context() else None
+    if stage is None:
+        timeout = openai.NOT_GIVEN
+    elif budget is not None:
+        timeout = budget.timeout(stage)
+    else:
+        timeout = STAGE_DEADLINES.get(stage, openai.NOT_GIVEN)
+    try:
+        yield timeout
+    except openai.APITimeoutError as e:
+        raise exceeded(stage) from e
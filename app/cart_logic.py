@@ -1,30 +1,150 @@
 import random
 from datetime import datetime, timedelta
 
-from .config import menu, PIZZERIA, INFO
-from .utils import save_order
+from .tenants import tenants, get_catalog, current_tenant
+from .order_store import order_store
+from .utils import session_id, trace
+
+class Cart:
+    """
+    Cart stored as item name -> quantity, with unit prices and the running total
+    kept up to date on every change. Pickles into the session as the bare
+    name -> quantity mapping and its tenant, and is priced from that tenant's
+    current menu on first use, so a session holding several tenants' carts
+    never prices one against another's menu. Items the menu no longer has are
+    kept aside in `unavailable` rather than dropped.
+    """
+    def __init__(self, counts=None, tenant=None):
+        self.tenant = tenant
+        self._counts = {}
+        self._prices = {}
+        self._total = 0
+        self._keys = {}
+        self._unavailable = {}
+        # Saved counts, priced by _load() the first time the cart is used
+        self._saved = dict(counts or {})
+
+    def __reduce__(self):
+        saved = self._saved if self._saved is not None else {**self._unavailable, **self._counts}
+        return (Cart, (saved, self.tenant))
+
+    def _load(self):
+        if self._saved is None:
+            return
+        saved, self._saved = self._saved, None
+        if self.tenant is None:
+            self.tenant = current_tenant().id
+        if not saved:
+            return
+        tenant = tenants.get(self.tenant)
+        items = tenant.catalog().items if tenant else {}
+        for name, qty in saved.items():
+            item = items.get(name)
+            if item:
+                self.add(item, qty)
+            else:
+                self._unavailable[name] = qty
+
+    @property
+    def counts(self):
+        self._load()
+        return self._counts
+
+    @property
+    def prices(self):
+        self._load()
+        return self._prices
+
+    @property
+    def total(self):
+        self._load()
+        return self._total
+
+    @property
+    def unavailable(self):
+        """Saved items (name -> quantity) missing from the tenant's menu; not priced or ordered."""
+        self._load()
+        return self._unavailable
+
+    def __bool__(self):
+        return bool(self.counts)
+
+    def __len__(self):
+        """Number of units in the cart."""
+        return sum(self.counts.values())
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def add(self, item, qty=1):
+        """Add qty units of a menu item."""
+        self._load()
+        if qty <= 0:
+            return
+        name = item["name"]
+        self._counts[name] = self._counts.get(name, 0) + qty
+        self._prices[name] = item["price"]
+        self._keys[name.lower()] = name
+        self._total += item["price"] * qty
+
+    def remove(self, name, qty=1):
+        """Remove up to qty units of the named item (case-insensitive). Return units removed."""
+        self._load()
+        key = self._keys.get(name.lower())
+        if key is None or qty <= 0:
+            return 0
+        removed = min(qty, self._counts[key])
+        self._counts[key] -= removed
+        self._total -= self._prices[key] * removed
+        if not self._counts[key]:
+            del self._counts[key], self._prices[key], self._keys[name.lower()]
+        if not self._counts:
+            self._total = 0
+        return removed
+
+    def subtotal(self, name):
+        return self.prices[name] * self.counts[name]
+
+    def to_dict(self):
+        """JSON-friendly view for the web UI."""
+        return {
+            "items": [
+                {"name": n, "price": self.prices[n], "quantity": q, "subtotal": self.subtotal(n)}
+                for n, q in self.counts.items()
+            ],
+            "unavailable": [{"name": n, "quantity": q} for n, q in self.unavailable.items()],
+            "count": len(self),
+            "total": self.total,
+        }
+
+def as_cart(value):
+    """Coerce a session cart (Cart, name -> qty mapping or legacy list of item dicts) to a Cart."""
+    if isinstance(value, Cart):
+        return value
+    if isinstance(value, dict):
+        return Cart(value)
+    cart = Cart()
+    for item in value or []:
+        cart.add(item)
+    return cart
 
 def cart_summary(cart):
     """Return a summary dict of item counts and the total price."""
-    out = {}
-    total = 0
-    for item in cart:
-        out[item["name"]] = out.get(item["name"], 0) + 1
-        total += item["price"]
-    return out, total
+    cart = as_cart(cart)
+    return dict(cart.counts), cart.total
 
 def confirm_order(user_state, items_added=None):
     """
     Generate a confirmation message after items are added/removed.
     """
-    cart = user_state.get("cart", [])
+    cart = as_cart(user_state.get("cart"))
     if not cart:
         return (
             "🛒 Il tuo carrello è vuoto. "
             "Puoi dire 'menu' per vedere le nostre opzioni deliziose!"
         )
 
-    summary, _ = cart_summary(cart)
+    summary, total = cart_summary(cart)
     message = []
 
     if items_added:
@@ -34,16 +154,16 @@ def confirm_order(user_state, items_added=None):
     message.append("🧾 *Il tuo ordine finora:*\n")
     for name, qty in summary.items():
         message.append(f"• {name} x{qty}")
+    if cart.unavailable:
+        message.append(f"⚠️ Non più nel menu: {', '.join(cart.unavailable)}")
 
-    total = sum(item["price"] for item in cart)
     message.append(f"\n💰 *Totale*: €{total:.2f}")
 
     # Suggestive upsell
-    categories_in_cart = set()
-    for item_name in summary.keys():
-        for cat_name, cat_items in menu.items():
-            if any(ci["name"] == item_name for ci in cat_items):
-                categories_in_cart.add(cat_name.lower())
+    catalog = get_catalog()
+    categories_in_cart = {
+        catalog.categories[name].lower() for name in summary if name in catalog.categories
+    }
 
     missing_cats = []
     if "pizze" in categories_in_cart and "bevande" not in categories_in_cart:
@@ -55,8 +175,8 @@ def confirm_order(user_state, items_added=None):
     suggestion = None
     if missing_cats:
         cat = random.choice(missing_cats)
-        if cat in menu and menu[cat]:
-            suggestion = random.choice(menu[cat])
+        if catalog.menu.get(cat):
+            suggestion = random.choice(catalog.menu[cat])
             # Track pending suggestion in state
             user_state['pending_suggestion'] = suggestion['name']
             message.append(
@@ -74,7 +194,7 @@ def do_checkout(state):
     """
     Generate a beautiful checkout summary and clear the cart.
     """
-    cart = state.get("cart", [])
+    cart = as_cart(state.get("cart"))
     if not cart:
         return "🛒 *Il tuo carrello è vuoto.* Vuoi ordinare qualcosa?"
 
@@ -83,24 +203,48 @@ def do_checkout(state):
 
     lines.append("## Prodotti:")
     for name, qty in c.items():
-        item_price = next(i["price"] for i in cart if i["name"] == name)
-        item_total = qty * item_price
+        item_total = cart.subtotal(name)
         lines.append(f"- **{name}** × {qty} = €{item_total:.2f}")
 
     lines.append("\n---")
     lines.append(f"## *Totale:* €{total:.2f}")
 
+    tenant = current_tenant()
     eta = (datetime.now() + timedelta(minutes=random.randint(15,30))).strftime("%H:%M")
-    order_num = f"#{random.randint(1000,9999)}"
+    # Persist order with its line items; the store allocates the number
+    pending = state.get("pending_order") or {}
+    order = order_store.create(
+        cart.to_dict()["items"], total,
+        customer=pending.get("name"), session_id=session_id(), eta=eta, tenant=tenant.id,
+        delivery=pending.get("delivery"), address=pending.get("address"), payment=pending.get("payment"),
+    )
+    order_num = order["number"]
+    trace(order=order_num, first_order=not state.get("last_order"))
 
     lines.append("\n## Dettagli:")
     lines.append(f"- **Ordine:** {order_num}")
-    lines.append(f"- **Ritiro:** *{eta}* presso {INFO['address']}")
+    lines.append(f"- **Ritiro:** *{eta}* presso {tenant.info['address']}")
 
     lines.append("\n## ✅ *Ordine Confermato!*")
-    lines.append(f"\n*Grazie per aver scelto {PIZZERIA}!* 🍕 *Buon appetito!*")
+    lines.append(f"\n*Grazie per aver scelto {tenant.name}!* 🍕 *Buon appetito!*")
 
-    # Persist order
-    save_order("web_user", next(iter(c)), sum(c.values()))
-    state.update({"cart": [], "last_order": {"number": order_num, "eta": eta, "total": total}, "step": "ordered"})
-    return "\n".join(lines)
\ No newline at end of file
+    state.update({"cart": Cart(), "last_order": {"number": order_num, "eta": eta, "total": total}, "step": "ordered"})
+    return "\n".join(lines)
+
+def find_order(state, number=None):
+    """
+    Look up one of this session's orders (for the tenant) in the order store:
+    by number when given, otherwise the last one it placed. Orders of other
+    sessions are never returned, whatever number or name the user types.
+    """
+    tenant = current_tenant().id
+    sid = session_id()
+    if number:
+        return order_store.get(number, tenant, session_id=sid) if sid else None
+    last = state.get("last_order") or {}
+    if last.get("number"):
+        # Saved in this session's own state when the order was placed
+        order = order_store.get(last["number"], tenant)
+        if order:
+            return order
+    return order_store.latest(session_id=sid, tenant=tenant)
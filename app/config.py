@@ -1,5 +1,4 @@
 import os
-import json
 from dotenv import load_dotenv
 import openai
 import stripe
@@ -9,13 +8,130 @@ load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 
-# Load menu data
+# Menu data (loaded and hot-reloaded by menu_catalog)
 BASE_DIR = os.path.dirname(__file__)
-with open(os.path.join(BASE_DIR, "pizza_menu.json")) as f:
-    menu = json.load(f)
+MENU_PATH = os.getenv("MENU_PATH", os.path.join(BASE_DIR, "pizza_menu.json"))
+# Seconds between checks of the menu file for changes
+MENU_RELOAD_INTERVAL = float(os.getenv("MENU_RELOAD_INTERVAL", "2"))
+
+# Multi-tenant mode: one directory per restaurant under TENANTS_DIR (unset:
+# only the restaurant configured here). A request's tenant comes from its
+# /t/<tenant>/ path prefix or its host (TENANTS_DIR/hosts.json, else the first
+# label of the host name); at most TENANT_CACHE_SIZE tenants stay loaded per
+# worker, the least recently used are unloaded
+TENANTS_DIR = os.getenv("TENANTS_DIR", "")
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "200"))
 
 # Constants
 PIZZERIA = "Pizzeria Da Mario"
 INFO = {"address": "Via Roma 123, Milano", "hours": "11:00 - 23:00", "phone": "+39 02 1234567"}
 SECRET_KEY = os.getenv("SECRET_KEY", "SUPER_SECURE_KEY")
-STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
\ No newline at end of file
+# Sessions expire SESSION_LIFETIME seconds after they were last written. They
+# are written when the state changes, or on any request once their last write
+# is SESSION_REFRESH_AFTER seconds old, so sessions in use do not expire
+SESSION_LIFETIME = int(os.getenv("SESSION_LIFETIME", str(31 * 86400)))
+SESSION_REFRESH_AFTER = int(os.getenv("SESSION_REFRESH_AFTER", "86400"))
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+
+# Conversation memory: recent turns kept verbatim, older ones folded into a summary
+HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", "10"))
+HISTORY_SUMMARY_CHARS = int(os.getenv("HISTORY_SUMMARY_CHARS", "600"))
+
+# Functions whose result is already the reply, sent as is instead of asking
+# the model to rephrase it with a second completion (comma-separated names)
+FINAL_FUNCTIONS = {
+    name.strip() for name in os.getenv(
+        "FINAL_FUNCTIONS", "show_menu,get_info,add_to_cart,remove_from_cart,checkout,track_order"
+    ).split(",") if name.strip()
+}
+
+# Latency budget of one /chat message (seconds). Each LLM stage gets at most
+# its own deadline and never more than what is left of the budget (retries
+# included); with less than CHAT_MIN_STAGE_SECONDS left a stage
+# is not started and the reply degrades to what the earlier stages produced
+CHAT_BUDGET = float(os.getenv("CHAT_BUDGET", "12"))
+CHAT_MIN_STAGE_SECONDS = float(os.getenv("CHAT_MIN_STAGE_SECONDS", "0.5"))
+STAGE_DEADLINES = {
+    stage.strip(): float(seconds) for stage, seconds in (
+        pair.split("=") for pair in os.getenv(
+            "STAGE_DEADLINES",
+            "understand_llm=4,function_call_llm=5,function_result_llm=5,rag_embedding=2,rag_completion=6",
+        ).split(",") if pair.strip()
+    )
+}
+
+# Prompt size of each LLM stage (tokens; estimated when tiktoken is not
+# installed). Older history turns, the summary and retrieved documents are
+# trimmed to fit, and each history turn is cut to PROMPT_TURN_TOKENS so long
+# bot replies (the menu) are not re-sent in full
+PROMPT_TOKEN_BUDGETS = {
+    stage.strip(): int(tokens) for stage, tokens in (
+        pair.split("=") for pair in os.getenv(
+            "PROMPT_TOKEN_BUDGETS", "understand_llm=900,function_call_llm=1200,rag_completion=1600",
+        ).split(",") if pair.strip()
+    )
+}
+PROMPT_TURN_TOKENS = int(os.getenv("PROMPT_TURN_TOKENS", "120"))
+
+# Shared OpenAI clients (one sync client per worker, one async client per
+# event loop): connection pool size, seconds an idle connection is kept alive,
+# connect timeout and the timeout of calls without a stage deadline
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "3"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+# Retries of a call failing with a connection error, 429 or 5xx, after a
+# jittered exponential backoff (seconds: random up to RETRY_BASE * 2^attempt,
+# capped at RETRY_MAX) and only while the stage deadline leaves time for it
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BASE = float(os.getenv("OPENAI_RETRY_BASE", "0.25"))
+OPENAI_RETRY_MAX = float(os.getenv("OPENAI_RETRY_MAX", "2"))
+# Circuit breaker: failed calls in a row that switch a worker to rule-only
+# replies, and seconds before a trial call checks whether the API is back
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+# Maximum number of LLM calls in flight at once on the async (ASGI) path
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "64"))
+
+# Cache of LLM intent parses: entries, time-to-live (seconds) and optional
+# SQLite file shared by all workers (in-process LRU when unset)
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "5000"))
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", "86400"))
+INTENT_CACHE_PATH = os.getenv("INTENT_CACHE_PATH", "")
+
+# Local intent classifier (python -m app.intent_model trains it), asked between
+# the rule KB and the LLM; answers below the threshold go to the LLM. The
+# default, trained on the rule KB, ships with the app
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", os.path.join(BASE_DIR, "intent_model.npz"))
+INTENT_MODEL_THRESHOLD = float(os.getenv("INTENT_MODEL_THRESHOLD", "0.85"))
+
+# Knowledge-base embeddings: on-disk store keyed by content hash and model,
+# documents per embedding request, and cached query embeddings
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", os.path.join(BASE_DIR, "kb_cache", "embeddings.sqlite"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+# Build the RAG index in a background thread at startup (otherwise on first use)
+KB_WARMUP = os.getenv("KB_WARMUP", "1") == "1"
+
+# Chat/order logs: directory, background writer queue (size and what to do
+# when full: "drop", or "block" for at most LOG_BLOCK_TIMEOUT seconds, then
+# drop), batching, and rotation by size and/or day
+LOG_DIR = os.getenv("LOG_DIR", os.path.join(os.path.dirname(BASE_DIR), "logs"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop")
+LOG_BLOCK_TIMEOUT = float(os.getenv("LOG_BLOCK_TIMEOUT", "1"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_ROTATE_DAILY = os.getenv("LOG_ROTATE_DAILY", "1") == "1"
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1") == "1"
+
+# Orders and their line items (SQLite, shared by all workers)
+ORDER_STORE_PATH = os.getenv("ORDER_STORE_PATH", os.path.join(os.path.dirname(BASE_DIR), "data", "orders.sqlite"))
+
+# Per-worker metric snapshots summed by /metrics (clear the directory on
+# deploy; empty disables sharing) and how often each worker writes its own
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(os.path.dirname(BASE_DIR), "data", "metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
@@ -0,0 +1,51 @@
+import re
+
+from .config import HISTORY_SIZE, HISTORY_SUMMARY_CHARS
+
+# Longest excerpt of a single turn kept in the rolling summary
+TURN_CHARS = 80
+
+def entry(msg):
+    """Normalise a history entry (dict or legacy string) to (role, content)."""
+    if isinstance(msg, dict):
+        return msg.get("role", "assistant"), msg.get("content") or ""
+    return "assistant", msg
+
+def _excerpt(content):
+    """First meaningful line of a message, stripped of markdown and truncated."""
+    for line in content.splitlines():
+        line = re.sub(r"[*_#`>]+", "", line).strip(" -•")
+        if line:
+            return line if len(line) <= TURN_CHARS else line[:TURN_CHARS - 1] + "…"
+    return ""
+
+def summarise(summary, turns):
+    """
+    Fold evicted turns into the rolling summary with a cheap local heuristic:
+    one short excerpt per turn, oldest lines dropped past HISTORY_SUMMARY_CHARS.
+    """
+    lines = summary.splitlines() if summary else []
+    for msg in turns:
+        role, content = entry(msg)
+        text = _excerpt(content)
+        if text:
+            lines.append(f"{'Bot' if role == 'assistant' else 'User'}: {text}")
+    while lines and sum(len(l) + 1 for l in lines) > HISTORY_SUMMARY_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+def remember(state, role, content):
+    """
+    Append a turn to the bounded history; turns pushed out of the window
+    are folded into state["history_summary"].
+    """
+    history = state.setdefault("history", [])
+    history.append({"role": role, "content": content})
+    if len(history) > HISTORY_SIZE:
+        evicted = history[:-HISTORY_SIZE]
+        del history[:-HISTORY_SIZE]
+        state["history_summary"] = summarise(state.get("history_summary", ""), evicted)
+
+def history_summary(state):
+    """Summary of the turns older than the history window ('' if none)."""
+    return state.get("history_summary", "")
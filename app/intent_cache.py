@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .config import INTENT_CACHE_SIZE, INTENT_CACHE_TTL, INTENT_CACHE_PATH
+from .metrics import registry
+
+def normalise(text):
+    """Lowercase, collapse whitespace and drop surrounding punctuation."""
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.strip(" .,;:!?¡¿'\"")
+
+def cart_digest(cart):
+    """Short digest of the cart's items and quantities; "empty" for an empty cart."""
+    counts = getattr(cart, "counts", None) or {}
+    if not counts:
+        return "empty"
+    items = ",".join(f"{name}:{qty}" for name, qty in sorted(counts.items()))
+    return hashlib.sha1(items.encode("utf-8")).hexdigest()[:16]
+
+def cache_key(text, state, tenant="default"):
+    """
+    Key for an intent parse: the normalised message plus the context that
+    changes how it is parsed (tenant and so menu, cart contents, current step).
+    """
+    cart = cart_digest(state.get("cart"))
+    return f"{tenant}|{normalise(text)}|{cart}|{state.get('step', '')}"
+
+class IntentCache:
+    """In-process LRU cache with a size cap and time-to-live; hits and misses are counted in /metrics."""
+    def __init__(self, max_size=INTENT_CACHE_SIZE, ttl=INTENT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                registry.inc("hungergod_intent_cache_misses_total", {})
+                return None
+            self._entries.move_to_end(key)
+            registry.inc("hungergod_intent_cache_hits_total", {})
+            return json.loads(entry[1])
+
+    def set(self, key, intents):
+        with self._lock:
+            self._entries[key] = (time.time(), json.dumps(intents))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+class SqliteIntentCache:
+    """
+    On-disk LRU cache in a SQLite file (WAL mode), shared by gunicorn workers.
+    Hits and misses are counted in /metrics.
+    """
+    def __init__(self, path, max_size=INTENT_CACHE_SIZE, ttl=INTENT_CACHE_TTL):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS intents "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS intents_used ON intents (used)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute("SELECT value, created FROM intents WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM intents WHERE key = ?", (key,))
+                registry.inc("hungergod_intent_cache_misses_total", {})
+                return None
+            conn.execute("UPDATE intents SET used = ? WHERE key = ?", (now, key))
+        registry.inc("hungergod_intent_cache_hits_total", {})
+        return json.loads(row[0])
+
+    def set(self, key, intents):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO intents (key, value, created, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(intents), now, now),
+            )
+            conn.execute(
+                "DELETE FROM intents WHERE key IN "
+                "(SELECT key FROM intents ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+def make_cache(path=INTENT_CACHE_PATH):
+    """Shared SQLite cache when a path is configured, in-process LRU otherwise."""
+    if path:
+        return SqliteIntentCache(path)
+    return IntentCache()
+
+# Single shared cache instance
+intent_cache = make_cache()
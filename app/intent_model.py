@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Local intent classifier: character n-gram TF-IDF features and a softmax
+linear model, in NumPy.
+
+Trained from the rule KB (utterances and action keywords) and from the chat
+logs, where every message parsed by the LLM carries the intents it got.
+understand() asks it after the rule KB and before the intent cache and the
+LLM; predictions below INTENT_MODEL_THRESHOLD go on to the LLM as before.
+
+    python -m app.intent_model [LOG_DIR or files...] [--out INTENT_MODEL_PATH] [--epochs 300]
+"""
+import os
+import sys
+import math
+import argparse
+from collections import Counter
+
+import numpy as np
+
+if __name__ == '__main__' and __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = 'app'
+
+from .config import LOG_DIR, INTENT_MODEL_PATH, INTENT_MODEL_THRESHOLD
+from .intent_cache import normalise
+from .rule_kb import utterances, actions, mentioned_items
+
+# Character n-gram sizes, taken over the message padded with spaces
+NGRAMS = (2, 3, 4)
+MAX_FEATURES = 20000
+# Share of a message's n-grams the model must know to be trusted with it
+MIN_COVERAGE = 0.5
+# Log stages whose intents came from the LLM
+LLM_LABEL_STAGES = ("llm_intent", "intent_cache")
+# Intents that need the menu items named in the message
+ITEM_INTENTS = ("add_to_cart", "remove")
+
+def ngrams(text):
+    """Counter of the character n-grams of the normalised text."""
+    padded = f" {normalise(text)} "
+    return Counter(padded[i:i + n] for n in NGRAMS for i in range(len(padded) - n + 1))
+
+class IntentModel:
+    """TF-IDF vocabulary and per-intent weights; predict() scores one message."""
+    def __init__(self, vocab, idf, weights, bias, labels):
+        self.vocab = [str(g) for g in vocab]
+        self.index = {g: i for i, g in enumerate(self.vocab)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        # Stored as (features, intents) so a message's rows are gathered at once
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.labels = [str(l) for l in labels]
+
+    def features(self, text):
+        """(feature indices, L2-normalised TF-IDF values, share of the n-grams known)."""
+        padded = f" {normalise(text)} "
+        index = self.index
+        counts = {}
+        total = 0
+        for n in NGRAMS:
+            for i in range(len(padded) - n + 1):
+                total += 1
+                j = index.get(padded[i:i + n])
+                if j is not None:
+                    counts[j] = counts.get(j, 0) + 1
+        idx = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+        values = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self.idf[idx]
+        norm = np.sqrt(values @ values)
+        return idx, (values / norm if norm else values), sum(counts.values()) / total if total else 0.0
+
+    def predict(self, text):
+        """(intent, probability), or (None, 0.0) when too little of the text is known."""
+        idx, values, coverage = self.features(text)
+        if coverage < MIN_COVERAGE:
+            return None, 0.0
+        scores = values @ self.weights[idx] + self.bias
+        best = int(scores.argmax())
+        # Softmax probability of the best intent only
+        return self.labels[best], float(1.0 / np.exp(scores - scores[best]).sum())
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path, vocab=np.array(self.vocab), idf=self.idf,
+            weights=self.weights.astype(np.float16), bias=self.bias, labels=np.array(self.labels),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["vocab"], data["idf"], data["weights"], data["bias"], data["labels"])
+
+def build_vocab(texts):
+    """Most frequent n-grams (by document frequency) and their smoothed IDF."""
+    df = Counter()
+    for text in texts:
+        df.update(ngrams(text).keys())
+    vocab = [g for g, _ in df.most_common(MAX_FEATURES)]
+    n = len(texts)
+    idf = np.array([math.log((1 + n) / (1 + df[g])) + 1.0 for g in vocab], dtype=np.float32)
+    return vocab, idf
+
+def train(examples, epochs=300, lr=10.0, l2=1e-5, batch_size=256, seed=0):
+    """
+    Fit the model on (text, intent) pairs with mini-batch gradient descent on
+    the softmax cross-entropy; duplicates of a pair count once.
+    """
+    examples = sorted(set(examples))
+    texts = [t for t, _ in examples]
+    labels = sorted({l for _, l in examples})
+    label_index = {l: i for i, l in enumerate(labels)}
+    vocab, idf = build_vocab(texts)
+    model = IntentModel(vocab, idf, np.zeros((len(vocab), len(labels))), np.zeros(len(labels)), labels)
+    rows = [model.features(t)[:2] for t in texts]
+    y = np.array([label_index[l] for _, l in examples])
+    rng = np.random.default_rng(seed)
+    W, b = model.weights, model.bias
+    for _ in range(epochs):
+        order = rng.permutation(len(rows))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            X = np.zeros((len(batch), len(vocab)), dtype=np.float32)
+            for r, i in enumerate(batch):
+                X[r, rows[i][0]] = rows[i][1]
+            scores = X @ W + b
+            probs = np.exp(scores - scores.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            probs[np.arange(len(batch)), y[batch]] -= 1.0
+            W -= lr * (X.T @ probs / len(batch) + l2 * W)
+            b -= lr * probs.mean(axis=0)
+    return model
+
+def kb_examples():
+    """(text, intent) pairs from the rule KB utterances and action keywords."""
+    examples = [(u['utterance'], u['intent']) for u in utterances]
+    examples += [(kw, intent) for intent, kws in actions.items() for kw in kws]
+    return examples
+
+def log_examples(paths):
+    """
+    (text, intent) pairs from chat log messages the LLM parsed into a single
+    intent; an empty parse is labelled "other", which is how respond() treats it.
+    """
+    from .analytics import find_logs, read_records
+    for path in find_logs(paths):
+        if not os.path.basename(path).startswith("chat.log"):
+            continue
+        for record, _ in read_records(path):
+            stages = record.get("stages") or ()
+            if not record.get("user") or not any(s in LLM_LABEL_STAGES for s in stages):
+                continue
+            intents = {i for i in record.get("intents") or () if i}
+            if len(intents) <= 1:
+                yield record["user"], intents.pop() if intents else "other"
+
+def evaluate(model, examples, threshold):
+    """Share of examples answered with confidence, and the accuracy of those answers."""
+    answered = correct = 0
+    for text, label in examples:
+        intent, p = model.predict(text)
+        if intent is not None and p >= threshold:
+            answered += 1
+            correct += intent == label
+    return answered / len(examples) if examples else 0.0, correct / answered if answered else 0.0
+
+def _load(path):
+    if not path:
+        return None
+    if not os.path.exists(path):
+        print(f"Intent model not found at {path}: messages the rules miss go to the LLM")
+        return None
+    try:
+        return IntentModel.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Intent model not loaded from {path}: {e}")
+        return None
+
+intent_model = _load(INTENT_MODEL_PATH)
+
+def predict_intents(text, model=None, threshold=INTENT_MODEL_THRESHOLD):
+    """
+    Intents for the message in the structure understand() returns, or None when
+    the model is missing, unsure, or the intent needs items the text does not name.
+    """
+    model = model or intent_model
+    if model is None:
+        return None
+    intent, p = model.predict(text)
+    if intent is None or p < threshold:
+        return None
+    items = []
+    if intent in ITEM_INTENTS or intent == "order":
+        items = [{"name": name, "quantity": 1} for name in mentioned_items(text)]
+        if intent in ITEM_INTENTS and not items:
+            return None
+        # Same as the rules: an order naming items adds them
+        if intent == "order" and items:
+            intent = "add_to_cart"
+    return [{"intent": intent, "items": items}]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the local intent classifier")
+    parser.add_argument("paths", nargs="*", default=[LOG_DIR], help="chat logs or directories (default LOG_DIR)")
+    parser.add_argument("--out", default=INTENT_MODEL_PATH, help="model file (.npz)")
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--holdout", type=float, default=0.1, help="share of log examples kept for evaluation")
+    args = parser.parse_args(argv)
+
+    kb = kb_examples()
+    logged = sorted(set(log_examples(args.paths)))
+    rng = np.random.default_rng(0)
+    held = set(rng.choice(len(logged), int(len(logged) * args.holdout), replace=False)) if logged else set()
+    train_set = kb + [e for i, e in enumerate(logged) if i not in held]
+    test_set = [e for i, e in enumerate(logged) if i in held]
+    print(f"Training on {len(kb)} KB and {len(train_set) - len(kb)} logged examples, "
+          f"{len(test_set)} held out; intents: {dict(Counter(l for _, l in train_set))}")
+
+    model = train(train_set, epochs=args.epochs)
+    for name, examples in (("train", train_set), ("held out", test_set)):
+        if examples:
+            coverage, accuracy = evaluate(model, examples, INTENT_MODEL_THRESHOLD)
+            print(f"{name}: {coverage:.1%} answered at p >= {INTENT_MODEL_THRESHOLD}, {accuracy:.1%} of them correct")
+    model.save(args.out)
+    print(f"Saved {len(model.vocab)} features x {len(model.labels)} intents to {args.out} "
+          f"({os.path.getsize(args.out) // 1024} KB)")
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,296 @@
 import os
-import openai
-import math
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
 
-from .config import BASE_DIR
+import numpy as np
+
+from .config import BASE_DIR, EMBEDDING_STORE_PATH, EMBEDDING_BATCH_SIZE, QUERY_EMBEDDING_CACHE_SIZE
+from .llm import embed, aembed, EMBEDDING_MODEL
+from .utils import log_event
 
 # Directory containing knowledge base documents (plain text files)
 KB_DIR = os.path.join(BASE_DIR, 'kb_docs')
 
-def load_docs():
-    """Load all text documents from the KB_DIR."""
+def load_docs(directory=KB_DIR):
+    """Load all text documents from the directory (KB_DIR by default)."""
     docs = []
-    if not os.path.isdir(KB_DIR):
+    if not directory or not os.path.isdir(directory):
         return docs
-    for fname in os.listdir(KB_DIR):
-        path = os.path.join(KB_DIR, fname)
+    for fname in sorted(os.listdir(directory)):
+        path = os.path.join(directory, fname)
         if os.path.isfile(path):
             with open(path, 'r', encoding='utf-8') as f:
                 text = f.read()
             docs.append({'id': fname, 'text': text})
     return docs
 
-def get_embedding(text):
-    """Compute embedding for the given text using OpenAI."""
-    response = openai.embeddings.create(
-        model="text-embedding-ada-002",
-        input=[text]
-    )
-    return response['data'][0]['embedding']
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingStore:
+    """
+    Embeddings on disk keyed by (model, content hash), stored as float32 blobs
+    in a SQLite file so restarts and new workers reuse them. The normalised
+    search matrix is saved next to it as a .npy file that workers memory-map.
+    """
+    def __init__(self, path=EMBEDDING_STORE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, hash))"
+            )
+
+    def get_many(self, model, hashes):
+        """Return {hash: vector} for the hashes already stored for model."""
+        found = {}
+        hashes = list(hashes)
+        with sqlite3.connect(self.path, timeout=10) as conn:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? "
+                    f"AND hash IN ({','.join('?' * len(chunk))})",
+                    [model] + chunk,
+                )
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model, items):
+        """Store (hash, vector) pairs for model."""
+        with sqlite3.connect(self.path, timeout=10) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items],
+            )
+
+    def matrix_path(self, model, name=None):
+        suffix = f"-{model}-{name}" if name else f"-{model}"
+        return os.path.splitext(self.path)[0] + f"{suffix}.npy"
+
+    def load_matrix(self, model, hashes, name=None):
+        """Memory-map the saved matrix (of the named KB) if it was built from exactly these hashes."""
+        path = self.matrix_path(model, name)
+        try:
+            with open(path + ".json", encoding="utf-8") as f:
+                if json.load(f) != list(hashes):
+                    return None
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def save_matrix(self, model, hashes, matrix, name=None):
+        """Save the matrix and the row hashes atomically, then return it memory-mapped."""
+        path = self.matrix_path(model, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp, path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(hashes), f)
+        os.replace(tmp, path + ".json")
+        return np.load(path, mmap_mode="r")
+
+def embed_docs(docs, store, batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Attach an embedding to each doc, reusing stored ones and embedding only
+    new or changed texts, batch_size texts per request.
+    """
+    for doc in docs:
+        doc['hash'] = content_hash(doc['text'])
+    known = store.get_many(EMBEDDING_MODEL, {doc['hash'] for doc in docs})
+    missing = {}
+    for doc in docs:
+        if doc['hash'] not in known:
+            missing.setdefault(doc['hash'], doc['text'])
+    pending = list(missing.items())
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        vectors = embed([text for _, text in batch])
+        store.put_many(EMBEDDING_MODEL, [(h, v) for (h, _), v in zip(batch, vectors)])
+        known.update((h, np.asarray(v, dtype=np.float32)) for (h, _), v in zip(batch, vectors))
+    for doc in docs:
+        doc['embedding'] = known[doc['hash']]
+    return len(pending)
+
+# Bounded LRU of query embeddings, shared by the sync and async paths
+_query_embeddings = OrderedDict()
+_query_lock = threading.Lock()
+
+def _cached_query(text):
+    with _query_lock:
+        vec = _query_embeddings.get(text)
+        if vec is not None:
+            _query_embeddings.move_to_end(text)
+        return vec
+
+def _remember_query(text, vec):
+    vec = np.asarray(vec, dtype=np.float32)
+    with _query_lock:
+        _query_embeddings[text] = vec
+        _query_embeddings.move_to_end(text)
+        while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+    return vec
+
+def get_embedding(text, stage=None):
+    """Compute embedding for the given text using OpenAI (cached)."""
+    vec = _cached_query(text)
+    if vec is None:
+        vec = _remember_query(text, embed([text], stage)[0])
+    return vec
+
+async def get_embedding_async(text, stage=None):
+    """Same as get_embedding(), awaiting the embedding request."""
+    vec = _cached_query(text)
+    if vec is None:
+        vec = _remember_query(text, (await aembed([text], stage))[0])
+    return vec
+
+def normalise_rows(matrix):
+    """Scale rows to unit length (zero rows stay zero) so dot products are cosines."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32)
 
 class KnowledgeBase:
     """
-    Simple in-memory KB with embed-and-search functionality.
+    In-memory KB: documents plus a contiguous, row-normalised float32
+    embedding matrix searched with one matrix-vector product. Each tenant's
+    KB saves its matrix under its name; the embeddings store is shared.
     """
-    def __init__(self):
-        self.docs = load_docs()
-        # Pre-compute embeddings
-        for doc in self.docs:
-            doc['embedding'] = get_embedding(doc['text'])
+    def __init__(self, store=None, directory=KB_DIR, name=None):
+        self.docs = load_docs(directory)
+        self.store = store or EmbeddingStore()
+        self.embedded = 0
+        hashes = [content_hash(doc['text']) for doc in self.docs]
+        for doc, h in zip(self.docs, hashes):
+            doc['hash'] = h
+        # Reuse the saved matrix when the documents are unchanged
+        self.matrix = self.store.load_matrix(EMBEDDING_MODEL, hashes, name) if self.docs else None
+        if self.matrix is None and self.docs:
+            # Embed only new or changed documents, then rebuild the matrix
+            self.embedded = embed_docs(self.docs, self.store)
+            matrix = normalise_rows(np.vstack([doc.pop('embedding') for doc in self.docs]))
+            self.matrix = self.store.save_matrix(EMBEDDING_MODEL, hashes, matrix, name)
+
+    @classmethod
+    def from_embeddings(cls, docs, embeddings):
+        """Build a KB from documents and their raw embeddings, without the store."""
+        kb = cls.__new__(cls)
+        kb.docs, kb.store, kb.embedded = docs, None, 0
+        kb.matrix = normalise_rows(np.asarray(embeddings, dtype=np.float32))
+        return kb
 
     def query(self, text, top_k=3):
         """Return top_k most relevant documents for the query."""
         if not self.docs:
             return []
-        q_emb = get_embedding(text)
-        def score(doc):
-            a = doc['embedding']
-            # cosine similarity
-            dot = sum(x * y for x, y in zip(a, q_emb))
-            norm_a = math.sqrt(sum(x * x for x in a))
-            norm_q = math.sqrt(sum(x * x for x in q_emb))
-            return dot / (norm_a * norm_q) if norm_a and norm_q else 0
-        scored = sorted(self.docs, key=score, reverse=True)
-        return scored[:top_k]
-
-# Single shared KB instance
-kb = KnowledgeBase()
\ No newline at end of file
+        return self.search(get_embedding(text), top_k)
+
+    def search(self, q_emb, top_k=3):
+        """Return top_k documents for an already computed query embedding."""
+        if not self.docs or top_k <= 0:
+            return []
+        q = np.asarray(q_emb, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if not norm:
+            return self.docs[:top_k]
+        # Cosine similarity against every document at once
+        scores = self.matrix @ (q / norm)
+        if top_k < len(scores):
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.docs[i] for i in top]
+
+class LazyKnowledgeBase:
+    """
+    Builds the KnowledgeBase in a background thread so importing the app never
+    waits on embedding calls. Only callers that need the index wait for it.
+    """
+    def __init__(self, factory=KnowledgeBase):
+        self._factory = factory
+        self._kb = None
+        self._error = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.started_at = None
+        self.ready_at = None
+
+    def _build(self):
+        try:
+            self._kb = self._factory()
+            self._error = None
+            self.ready_at = time.time()
+        except Exception as e:
+            log_event("kb_warmup_failed", error=str(e))
+            self._error = e
+        finally:
+            self._ready.set()
+
+    def warm_up(self):
+        """Start building in the background (again, if a previous attempt failed)."""
+        with self._lock:
+            if self._kb is not None or (self._thread and self._thread.is_alive()):
+                return
+            self._ready.clear()
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._build, name="kb-warmup", daemon=True)
+            self._thread.start()
+
+    @property
+    def ready(self):
+        return self._kb is not None
+
+    def get(self, timeout=None):
+        """Return the KB, waiting for the warm-up if needed."""
+        if self._kb is None:
+            self.warm_up()
+            self._ready.wait(timeout)
+            if self._kb is None:
+                raise RuntimeError(f"knowledge base not ready: {self._error or 'timeout'}")
+        return self._kb
+
+    async def get_async(self, timeout=None):
+        """Same as get(), waiting in a thread so the event loop keeps running."""
+        if self._kb is not None:
+            return self._kb
+        return await asyncio.to_thread(self.get, timeout)
+
+    def status(self):
+        if self._kb is not None:
+            state = "ready"
+        elif self._thread and self._thread.is_alive():
+            state = "warming"
+        else:
+            state = "failed" if self._error else "cold"
+        status = {"state": state, "docs": len(self._kb.docs) if self._kb else None}
+        if self.started_at:
+            status["warmup_seconds"] = round((self.ready_at or time.time()) - self.started_at, 3)
+        if self._error:
+            status["error"] = str(self._error)
+        return status
+
+    # KnowledgeBase interface, waiting for the index on first use
+    @property
+    def docs(self):
+        return self.get().docs
+
+    def query(self, text, top_k=3):
+        return self.get().query(text, top_k)
+
+    def search(self, q_emb, top_k=3):
+        return self.get().search(q_emb, top_k)
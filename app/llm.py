@@ -0,0 +1,218 @@
+import os
+import time
+import random
+import asyncio
+import weakref
+
+import httpx
+import openai
+from openai import NOT_GIVEN, APIConnectionError, APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+
+from .config import (
+    LLM_CONCURRENCY, CHAT_MIN_STAGE_SECONDS, OPENAI_MAX_CONNECTIONS, OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_CONNECT_TIMEOUT, OPENAI_TIMEOUT, OPENAI_MAX_RETRIES, OPENAI_RETRY_BASE, OPENAI_RETRY_MAX,
+    STAGE_DEADLINES,
+)
+from .metrics import record_llm, registry
+from .budget import BudgetExceeded, deadline
+from .breaker import breaker
+
+CHAT_MODEL = "gpt-4-1106-preview"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# Failures of the API or the network, worth another attempt (timeouts are not:
+# the stage deadline is spent)
+RETRYABLE = (APIConnectionError, RateLimitError, InternalServerError)
+
+_LIMITS = httpx.Limits(
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+)
+_TIMEOUT = httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+class LLMUnavailable(BudgetExceeded):
+    """
+    The OpenAI API is failing: the circuit breaker is open, or a call still
+    failed after its retries. /chat degrades as for a stage out of budget.
+    """
+    def __init__(self, stage):
+        super().__init__(stage)
+        self.args = (f"OpenAI API unavailable at {stage}",)
+
+# Sync client of this worker (pid, client), created after any fork
+_sync_client = (None, None)
+# Async client and concurrency limit, one pair per event loop
+_loop_resources = weakref.WeakKeyDictionary()
+
+def client():
+    """The worker's shared sync client; its pooled connections stay open between messages."""
+    global _sync_client
+    if _sync_client[0] != os.getpid():
+        _sync_client = (os.getpid(), openai.OpenAI(
+            api_key=openai.api_key, max_retries=0, timeout=_TIMEOUT,
+            http_client=openai.DefaultHttpxClient(limits=_LIMITS, timeout=_TIMEOUT),
+        ))
+    return _sync_client[1]
+
+def llm_available():
+    """Whether LLM stages should be tried (False while the circuit breaker is open)."""
+    return breaker.available()
+
+def _backoff(attempt):
+    # Full jitter: spreads out the retries of workers that failed together
+    return random.uniform(0, min(OPENAI_RETRY_MAX, OPENAI_RETRY_BASE * 2 ** attempt))
+
+def _timed_out(stage, timeout, attempt=0):
+    """
+    Count a timed-out call against the breaker only if it had its whole time:
+    the stage's deadline (OPENAI_TIMEOUT without one). Shorter timeouts, clamped
+    by the message's latency budget or a retry, say nothing about the API
+    (but still end a half-open trial).
+    """
+    full = STAGE_DEADLINES.get(stage, OPENAI_TIMEOUT) if stage else OPENAI_TIMEOUT
+    if attempt == 0 and (timeout is NOT_GIVEN or timeout >= full):
+        breaker.failed()
+    else:
+        breaker.abandoned()
+
+def _retry_pause(kind, stage, error, attempt, end):
+    """Seconds to wait before retrying after a failed attempt, or raise LLMUnavailable."""
+    breaker.failed()
+    registry.inc("hungergod_llm_errors_total", {"kind": kind, "error": type(error).__name__})
+    pause = _backoff(attempt)
+    if attempt > OPENAI_MAX_RETRIES or (end is not None and end - time.monotonic() - pause < CHAT_MIN_STAGE_SECONDS):
+        raise LLMUnavailable(stage) from error
+    registry.inc("hungergod_llm_retries_total", {"kind": kind})
+    return pause
+
+def _call(kind, stage, timeout, create, **kwargs):
+    """
+    One API request through the circuit breaker, retried on RETRYABLE errors
+    while the stage's timeout leaves time; every attempt shares that timeout.
+    """
+    end = None if timeout is NOT_GIVEN else time.monotonic() + timeout
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise LLMUnavailable(stage)
+        try:
+            response = create(timeout=timeout if end is None else end - time.monotonic(), **kwargs)
+        except APITimeoutError:
+            _timed_out(stage, timeout, attempt)
+            raise
+        except RETRYABLE as e:
+            attempt += 1
+            time.sleep(_retry_pause(kind, stage, e, attempt, end))
+            continue
+        except APIStatusError:
+            # The API answered (bad request, auth): not an outage
+            breaker.succeeded()
+            raise
+        except BaseException:
+            # Anything else (cancelled, interrupted) must not hold the trial call
+            breaker.abandoned()
+            raise
+        breaker.succeeded()
+        return response
+
+async def _acall(kind, stage, timeout, create, **kwargs):
+    """Same as _call(), awaiting the request and the backoff."""
+    end = None if timeout is NOT_GIVEN else time.monotonic() + timeout
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise LLMUnavailable(stage)
+        try:
+            response = await create(timeout=timeout if end is None else end - time.monotonic(), **kwargs)
+        except APITimeoutError:
+            _timed_out(stage, timeout, attempt)
+            raise
+        except RETRYABLE as e:
+            attempt += 1
+            await asyncio.sleep(_retry_pause(kind, stage, e, attempt, end))
+            continue
+        except APIStatusError:
+            breaker.succeeded()
+            raise
+        except BaseException:
+            breaker.abandoned()
+            raise
+        breaker.succeeded()
+        return response
+
+def chat_completion(stage=None, **kwargs):
+    """Blocking chat completion, used by the sync (WSGI) path, within the stage's deadline."""
+    kwargs.setdefault("model", CHAT_MODEL)
+    with deadline(stage) as timeout:
+        response = _call("chat", stage, timeout, client().chat.completions.create, **kwargs)
+    record_llm("chat", response.usage, stage)
+    return response
+
+def stream_completion(stage=None, **kwargs):
+    """Blocking chat completion yielding the reply text as it is generated."""
+    kwargs.setdefault("model", CHAT_MODEL)
+    usage = None
+    with deadline(stage) as timeout:
+        stream = _call(
+            "chat", stage, timeout, client().chat.completions.create,
+            stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        try:
+            for chunk in stream:
+                # The last chunk carries only the token usage
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except APITimeoutError:
+            _timed_out(stage, timeout)
+            raise
+        except RETRYABLE as e:
+            # Cut off mid-reply: too late to retry
+            breaker.failed()
+            raise LLMUnavailable(stage) from e
+    record_llm("chat", usage, stage)
+
+def embed(texts, stage=None):
+    """Blocking embedding request for a batch of texts."""
+    with deadline(stage) as timeout:
+        response = _call(
+            "embedding", stage, timeout, client().embeddings.create, model=EMBEDDING_MODEL, input=list(texts)
+        )
+    record_llm("embedding", response.usage, stage)
+    return [d.embedding for d in response.data]
+
+def _resources():
+    loop = asyncio.get_running_loop()
+    res = _loop_resources.get(loop)
+    if res is None:
+        res = _loop_resources[loop] = (
+            openai.AsyncOpenAI(
+                api_key=openai.api_key, max_retries=0, timeout=_TIMEOUT,
+                http_client=openai.DefaultAsyncHttpxClient(limits=_LIMITS, timeout=_TIMEOUT),
+            ),
+            asyncio.Semaphore(LLM_CONCURRENCY),
+        )
+    return res
+
+async def achat_completion(stage=None, **kwargs):
+    """Non-blocking chat completion, limited to LLM_CONCURRENCY calls in flight."""
+    kwargs.setdefault("model", CHAT_MODEL)
+    async_client, limit = _resources()
+    async with limit:
+        with deadline(stage) as timeout:
+            response = await _acall("chat", stage, timeout, async_client.chat.completions.create, **kwargs)
+    record_llm("chat", response.usage, stage)
+    return response
+
+async def aembed(texts, stage=None):
+    """Non-blocking embedding request, sharing the same concurrency limit."""
+    async_client, limit = _resources()
+    async with limit:
+        with deadline(stage) as timeout:
+            response = await _acall(
+                "embedding", stage, timeout, async_client.embeddings.create, model=EMBEDDING_MODEL, input=list(texts)
+            )
+    record_llm("embedding", response.usage, stage)
+    return [d.embedding for d in response.data]
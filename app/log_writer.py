@@ -0,0 +1,202 @@
+import os
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import datetime
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+from .config import (
+    LOG_DIR, LOG_QUEUE_SIZE, LOG_QUEUE_POLICY, LOG_BLOCK_TIMEOUT, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL,
+    LOG_MAX_BYTES, LOG_ROTATE_DAILY, LOG_COMPRESS,
+)
+from .metrics import registry
+
+# /metrics counter of each writer outcome, labelled by log file
+COUNTERS = {
+    "written": "hungergod_log_lines_written_total",
+    "dropped": "hungergod_log_lines_dropped_total",
+    "errors": "hungergod_log_errors_total",
+    "rotations": "hungergod_log_rotations_total",
+}
+
+class LogWriter:
+    """
+    JSON-lines log file written by a background thread.
+
+    write() only puts the entry on a bounded queue; the thread drains it in
+    batches of up to batch_size entries or every flush_interval seconds and
+    appends each batch with a single write, under a lock file shared by all
+    worker processes, so lines never interleave. The file is rotated when it
+    would exceed max_bytes or was last written on an earlier day, and rotated
+    segments are gzipped. When the queue is full the entry is dropped
+    (policy "drop") or the caller waits up to block_timeout seconds for room
+    before dropping it (policy "block"). Lines written and dropped, failed
+    writes and rotations are counted in /metrics.
+    """
+    def __init__(self, path, queue_size=LOG_QUEUE_SIZE, policy=LOG_QUEUE_POLICY,
+                 batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL,
+                 max_bytes=LOG_MAX_BYTES, rotate_daily=LOG_ROTATE_DAILY, compress=LOG_COMPRESS,
+                 block_timeout=LOG_BLOCK_TIMEOUT):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"unknown log queue policy: {policy}")
+        self.path = path
+        self.name = os.path.basename(path)
+        self.queue_size = queue_size
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _start(self):
+        # (Re)start the writer thread in this process; threads do not survive a fork
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.queue_size)
+            self._thread = threading.Thread(target=self._run, name=f"log-writer-{os.path.basename(self.path)}", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def write(self, entry):
+        """Queue one entry; return False if it was dropped."""
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            # A stalled disk may hold up a request, but never indefinitely
+            self._queue.put(entry, block=self.policy == "block", timeout=self.block_timeout)
+            return True
+        except queue.Full:
+            self._count("dropped")
+            return False
+
+    def _count(self, what, amount=1):
+        registry.inc(COUNTERS[what], {"log": self.name}, amount)
+
+    def _run(self):
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(q.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            entries = [e for e in batch if e is not None]
+            try:
+                if entries:
+                    self._write_batch(entries)
+            except Exception as e:
+                # Whatever went wrong, the thread must keep draining the queue
+                self._count("errors")
+                print(f"Error writing {self.path}: {type(e).__name__}: {e}")
+            finally:
+                for _ in batch:
+                    q.task_done()
+            if stop:
+                return
+
+    def _serialise(self, entries):
+        lines = []
+        for entry in entries:
+            try:
+                lines.append(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            except (TypeError, ValueError) as e:
+                self._count("dropped")
+                print(f"Log entry for {self.path} not written: {e}")
+        return "".join(lines).encode("utf-8"), len(lines)
+
+    def _write_batch(self, entries):
+        data, written = self._serialise(entries)
+        if not written:
+            return
+        rotated = None
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".lock", "a") as lock:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                rotated = self._rotate_if_needed(len(data))
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            self._count("written", written)
+        except OSError as e:
+            self._count("errors")
+            self._count("dropped", written)
+            print(f"Error writing {self.path}: {e}")
+        if rotated and self.compress:
+            self._compress(rotated)
+
+    def _rotate_if_needed(self, incoming):
+        """Move the current file aside if it is full or from an earlier day; return its new path."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if not st.st_size:
+            return None
+        written = datetime.date.fromtimestamp(st.st_mtime)
+        too_big = self.max_bytes and st.st_size + incoming > self.max_bytes
+        stale = self.rotate_daily and written < datetime.date.today()
+        if not (too_big or stale):
+            return None
+        stamp = datetime.datetime.fromtimestamp(st.st_mtime).strftime("%Y%m%d-%H%M%S")
+        target = base = f"{self.path}.{stamp}-{os.getpid()}"
+        n = 0
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            n += 1
+            target = f"{base}.{n}"
+        os.replace(self.path, target)
+        self._count("rotations")
+        return target
+
+    def _compress(self, path):
+        try:
+            with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+        except OSError as e:
+            print(f"Error compressing {path}: {e}")
+
+    def flush(self):
+        """Wait until everything queued so far is on disk."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self, timeout=5):
+        """Write out the queue and stop the thread."""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+# Chat log writer, shared by the whole process
+chat_log = LogWriter(os.path.join(LOG_DIR, "chat.log"))
+# Operational events (warm-up failures, ...), kept apart from the chat messages
+event_log = LogWriter(os.path.join(LOG_DIR, "events.log"))
+
+def close_logs():
+    """Flush pending log lines; safe to call more than once."""
+    chat_log.close()
+    event_log.close()
+
+atexit.register(close_logs)
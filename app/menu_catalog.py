@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+
+from .config import MENU_RELOAD_INTERVAL, PIZZERIA
+from .menu_index import MenuMatcher
+from .utils import log_event
+
+SECTION_EMOJIS = {"Pizze": "🍕", "Bevande": "🥤", "Dolci": "🍰"}
+
+def render_section(section, items):
+    lines = [f"\n## {SECTION_EMOJIS.get(section, '')} *{section}*"]
+    for item in items:
+        price_str = f"€{item['price']:.2f}"
+        lines.append(f"- **{item['name']}** ─ {price_str}")
+    return lines
+
+def render_menu(menu, sections=None, title=PIZZERIA):
+    """Format the menu (or some of its sections) with improved styling and readability"""
+    lines = [f"# 📋 *Menu di {title}*"]
+    for section, items in menu.items():
+        if sections is None or section in sections:
+            lines.extend(render_section(section, items))
+    lines.append(
+        "\n*Per ordinare, scrivi ad esempio:* _\"Una Margherita e una Coca-Cola\"_"
+    )
+    return "\n".join(lines)
+
+class MenuCatalog:
+    """
+    Immutable snapshot of the menu: items by name, category by item name,
+    the fuzzy matcher and the rendered menus, all built once per menu version.
+    """
+    def __init__(self, menu, mtime=None, title=PIZZERIA):
+        self.menu = menu
+        self.mtime = mtime
+        self.items = {}
+        self.categories = {}
+        for section, items in menu.items():
+            for item in items:
+                self.items.setdefault(item["name"], item)
+                self.categories.setdefault(item["name"], section)
+        self.matcher = MenuMatcher(menu, cutoff=0.55)
+        self.rendered = render_menu(menu, title=title)
+        self.rendered_sections = {section: render_menu(menu, [section], title) for section in menu}
+
+    def render(self, section=None):
+        """Rendered markdown menu, whole or for one section."""
+        if section is None:
+            return self.rendered
+        return self.rendered_sections.get(section, self.rendered)
+
+    @classmethod
+    def load(cls, path, title=PIZZERIA):
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), mtime, title)
+
+class CatalogLoader:
+    """
+    Holds the current MenuCatalog and rebuilds it when the menu file changes,
+    checking at most every `interval` seconds. The new catalog is swapped in
+    with a single assignment, so readers always see a complete snapshot.
+    """
+    def __init__(self, path, interval=MENU_RELOAD_INTERVAL, title=PIZZERIA):
+        self.path = path
+        self.interval = interval
+        self.title = title
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._failed_mtime = None
+        self.catalog = MenuCatalog.load(path, title)
+
+    def current(self):
+        if time.monotonic() - self._checked >= self.interval:
+            self._reload_if_changed()
+        return self.catalog
+
+    def _reload_if_changed(self):
+        with self._lock:
+            if time.monotonic() - self._checked < self.interval:
+                return
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                print(f"Menu reload failed: {e}")
+                return
+            if mtime in (self.catalog.mtime, self._failed_mtime):
+                return
+            try:
+                self.catalog = MenuCatalog.load(self.path, self.title)
+                print(f"Menu reloaded from {self.path}")
+            except Exception as e:
+                # Unreadable, not JSON, or items missing fields: keep serving
+                # the last good menu until the file changes again
+                self._failed_mtime = mtime
+                log_event("menu_reload_failed", path=self.path, error=f"{type(e).__name__}: {e}")
@@ -0,0 +1,86 @@
+import difflib
+from collections import defaultdict
+from functools import lru_cache
+
+
+def trigrams(text):
+    """Character trigrams of text, padded so short names still produce grams."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MenuMatcher:
+    """
+    Fuzzy name/alias lookup built once from the menu.
+    Exact aliases resolve through a hash map. Otherwise the names sharing the most
+    trigrams with the query are scored first, and their best ratio lets the length
+    and quick_ratio bounds skip the rest of the menu. Results match
+    difflib.get_close_matches(n=1) exactly and are kept in an LRU cache.
+    """
+    def __init__(self, menu, cutoff=0.55, cache_size=1024, seeds=16):
+        self.cutoff = cutoff
+        self.seeds = seeds
+        # Lowercase names/aliases in menu order; the first item wins on duplicates
+        self._names = []
+        self._items = {}
+        self._index = defaultdict(list)
+        self._by_length = defaultdict(list)
+        for cat_items in menu.values():
+            for item in cat_items:
+                for term in [item["name"]] + item.get("aliases", []):
+                    term = term.lower()
+                    if term in self._items:
+                        continue
+                    self._items[term] = item
+                    for gram in trigrams(term):
+                        self._index[gram].append(len(self._names))
+                    self._by_length[len(term)].append(len(self._names))
+                    self._names.append(term)
+        self._cached = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def match(self, name):
+        """Return the closest menu item for name, or None below the cutoff."""
+        return self._cached(name.lower())
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+    def _lookup(self, query):
+        item = self._items.get(query)
+        if item is not None:
+            return item
+        s = difflib.SequenceMatcher()
+        s.set_seq2(query)
+        best = None
+        # Seed with the names sharing the most trigrams
+        shared = defaultdict(int)
+        for gram in trigrams(query):
+            for i in self._index.get(gram, ()):
+                shared[i] += 1
+        seeds = sorted(shared, key=shared.get, reverse=True)[:self.seeds]
+        for i in seeds:
+            best = self._score(s, self._names[i], best)
+        seen = set(seeds)
+        # Visit length buckets by their real_quick_ratio bound, best first
+        qlen = len(query)
+        bounds = sorted(
+            ((2.0 * min(qlen, n) / (qlen + n), n) for n in self._by_length),
+            reverse=True,
+        )
+        for bound, length in bounds:
+            if bound < max(self.cutoff, best[0] if best else 0):
+                break
+            for i in self._by_length[length]:
+                if i not in seen:
+                    best = self._score(s, self._names[i], best)
+        return self._items[best[1]] if best else None
+
+    def _score(self, s, name, best):
+        """Same filters and (ratio, name) tie-break as difflib.get_close_matches."""
+        threshold = max(self.cutoff, best[0] if best else 0)
+        s.set_seq1(name)
+        if s.real_quick_ratio() >= threshold and s.quick_ratio() >= threshold:
+            candidate = (s.ratio(), name)
+            if candidate[0] >= self.cutoff and (best is None or candidate > best):
+                return candidate
+        return best
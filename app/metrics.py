@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+from flask import g, has_request_context
+
+from .config import METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+# Latency buckets (seconds), from a rule match to a slow LLM round-trip
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CALLS_BUCKETS = (0, 1, 2, 3, 4, 6, 8)
+TOKENS_BUCKETS = (0, 250, 500, 1000, 2000, 4000, 8000, 16000)
+# Counters and histograms of exited workers, summed, so totals never go down
+ARCHIVE = "archive.json"
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "hungergod_stage_seconds": ("histogram", "Time spent in each /chat pipeline stage, by stage and path", SECONDS_BUCKETS),
+    "hungergod_request_seconds": ("histogram", "End-to-end /chat handling time, by path", SECONDS_BUCKETS),
+    "hungergod_llm_calls_per_request": ("histogram", "LLM API calls made while handling one /chat message", CALLS_BUCKETS),
+    "hungergod_llm_tokens_per_request": ("histogram", "LLM tokens used while handling one /chat message", TOKENS_BUCKETS),
+    "hungergod_requests_total": ("counter", "/chat messages handled, by path", None),
+    "hungergod_llm_calls_total": ("counter", "LLM API calls, by kind", None),
+    "hungergod_llm_tokens_total": ("counter", "LLM tokens reported by the API, by kind, stage and type", None),
+    "hungergod_prompt_tokens": ("histogram", "Prompt tokens sent to the LLM, by stage (estimated before the call)", TOKENS_BUCKETS),
+    "hungergod_prompt_trimmed_total": ("counter", "Prompts trimmed to their stage's token budget, by stage and part dropped", None),
+    "hungergod_llm_errors_total": ("counter", "Failed OpenAI API attempts that are retried or trip the circuit breaker, by kind and error", None),
+    "hungergod_llm_retries_total": ("counter", "OpenAI API calls retried after a failed attempt, by kind", None),
+    "hungergod_llm_breaker_transitions_total": ("counter", "OpenAI circuit breaker state changes, by new state (open, half_open, closed)", None),
+    "hungergod_llm_breaker_open": ("gauge", "Workers whose OpenAI circuit breaker is open or half-open (replying rule-only)", None),
+    "hungergod_budget_exhausted_total": ("counter", "LLM stages skipped or timed out for lack of latency budget, by stage", None),
+    "hungergod_tenant_requests_total": ("counter", "/chat messages handled per tenant, by tenant and path", None),
+    "hungergod_tenant_request_seconds_total": ("counter", "Time spent handling /chat messages, by tenant", None),
+    "hungergod_tenant_llm_calls_total": ("counter", "LLM API calls made for /chat messages, by tenant", None),
+    "hungergod_tenant_llm_tokens_total": ("counter", "LLM tokens used for /chat messages, by tenant", None),
+    "hungergod_tenant_load_seconds": ("histogram", "Time to load a tenant's menu and configuration on first use", SECONDS_BUCKETS),
+    "hungergod_tenant_evictions_total": ("counter", "Tenants unloaded to keep at most TENANT_CACHE_SIZE per worker", None),
+    "hungergod_tenants_loaded": ("gauge", "Tenants loaded, summed over workers", None),
+    "hungergod_log_lines_written_total": ("counter", "Log lines written, by log file", None),
+    "hungergod_log_lines_dropped_total": ("counter", "Log lines lost (queue full, not serialisable or write failed), by log file", None),
+    "hungergod_log_errors_total": ("counter", "Failed log batch writes, by log file", None),
+    "hungergod_log_rotations_total": ("counter", "Log files rotated, by log file", None),
+    "hungergod_intent_cache_hits_total": ("counter", "LLM intent parses answered from the intent cache", None),
+    "hungergod_intent_cache_misses_total": ("counter", "Intent cache lookups that had to ask the LLM", None),
+    "hungergod_state_flushes_total": ("counter", "Requests whose conversation state changed and was written to the session", None),
+    "hungergod_session_writes_skipped_total": ("counter", "Requests that read the conversation state but left the session unwritten", None),
+}
+
+class Registry:
+    """
+    Process-local counters and histograms. Each worker writes a snapshot to
+    METRICS_DIR/<pid>.json (from a background thread, when something changed)
+    and render() sums the snapshots of every worker, so any worker can answer
+    /metrics for the whole server.
+    """
+    def __init__(self, directory=METRICS_DIR, interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._values = {}
+        self._dirty = False
+        self._pid = None
+
+    def _key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def _start(self):
+        # One flusher thread per process; after a fork the child starts empty
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._values = {}
+            if self.directory:
+                threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def inc(self, name, labels, amount=1):
+        if self._pid != os.getpid():
+            self._start()
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+            self._dirty = True
+
+    def set(self, name, labels, value):
+        if self._pid != os.getpid():
+            self._start()
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = value
+            self._dirty = True
+
+    def observe(self, name, labels, value):
+        if self._pid != os.getpid():
+            self._start()
+        buckets = METRICS[name][2]
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._values.get(key)
+            if hist is None:
+                # One count per bucket plus +Inf, then sum
+                hist = self._values[key] = [0] * (len(buckets) + 1) + [0.0]
+            hist[bisect.bisect_left(buckets, value)] += 1
+            hist[-1] += value
+            self._dirty = True
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, dict(labels), value if isinstance(value, (int, float)) else list(value)]
+                    for (name, labels), value in self._values.items()]
+
+    def write(self):
+        """Save this worker's snapshot for the other workers to read."""
+        if not self.directory or self._pid != os.getpid():
+            return
+        self._dirty = False
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self._pid}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            if self._dirty:
+                try:
+                    self.write()
+                except OSError as e:
+                    print(f"Metrics flush failed: {e}")
+
+    def collect(self):
+        """
+        Values summed over the snapshots of the live workers (this one read
+        live) and the archive of exited ones. An exited worker's counters and
+        histograms are moved into the archive, so the totals keep growing
+        across worker restarts; its gauges are dropped with its snapshot.
+        """
+        snapshots = [self.snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            own = f"{os.getpid()}.json"
+            dead = []
+            for fname in os.listdir(self.directory):
+                if not fname.endswith(".json") or fname == own:
+                    continue
+                pid = fname[:-len(".json")]
+                if not pid.isdigit():
+                    continue
+                if not _alive(int(pid)):
+                    dead.append(os.path.join(self.directory, fname))
+                    continue
+                snapshot = _read(os.path.join(self.directory, fname))
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+            snapshots.append(self._archive(dead))
+        return self._sum(snapshots)
+
+    def _sum(self, snapshots):
+        totals = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot:
+                if name not in METRICS:
+                    continue
+                key = self._key(name, labels)
+                if isinstance(value, list):
+                    prev = totals.get(key)
+                    totals[key] = value if prev is None else [a + b for a, b in zip(prev, value)]
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def _archive(self, dead):
+        """The archived values, after folding the snapshots of the `dead` workers into them."""
+        path = os.path.join(self.directory, ARCHIVE)
+        if not dead:
+            return _read(path) or []
+        # One worker at a time, so a dead snapshot is archived only once
+        with open(path + ".lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            archived = _read(path) or []
+            snapshots = [archived]
+            for snapshot_path in dead:
+                snapshot = _read(snapshot_path)
+                if snapshot is not None:
+                    snapshots.append([v for v in snapshot if v[0] in METRICS and METRICS[v[0]][0] != "gauge"])
+            if len(snapshots) > 1:
+                archived = [[name, dict(labels), value] for (name, labels), value in self._sum(snapshots).items()]
+                tmp = f"{path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(archived, f)
+                os.replace(tmp, path)
+            for snapshot_path in dead:
+                try:
+                    os.remove(snapshot_path)
+                except OSError:
+                    pass
+            return archived
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        totals = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            series = sorted((labels, value) for (n, labels), value in totals.items() if n == name)
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                if kind in ("counter", "gauge"):
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+def _read(path):
+    """A snapshot file's values, or None if it is gone or unreadable."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _alive(pid):
+    if os.name == "nt":
+        # Signal 0 is CTRL_C_EVENT there; the dev server runs a single worker anyway
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user
+        return True
+    return True
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+registry = Registry()
+
+def _current():
+    return g.get("metrics") if has_request_context() else None
+
+def record_stage(stage, seconds):
+    """Time spent in a stage; kept until the request ends so it can be labelled by path."""
+    m = _current()
+    if m is None:
+        registry.observe("hungergod_stage_seconds", {"stage": stage, "path": "none"}, seconds)
+    else:
+        m["stages"].append((stage, seconds))
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def timed_stream(stage, chunks):
+    """
+    Pass a streamed reply through, recording the time to its first chunk as
+    <stage>_first_token and until the end as <stage>.
+    """
+    start = time.perf_counter()
+    first = True
+    try:
+        for chunk in chunks:
+            if first:
+                record_stage(f"{stage}_first_token", time.perf_counter() - start)
+                first = False
+            yield chunk
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def record_llm(kind, usage=None, stage=None):
+    """Count an LLM call and the tokens reported in its usage block."""
+    registry.inc("hungergod_llm_calls_total", {"kind": kind})
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    stage = stage or "none"
+    if prompt:
+        registry.inc("hungergod_llm_tokens_total", {"kind": kind, "stage": stage, "type": "prompt"}, prompt)
+    if completion:
+        registry.inc("hungergod_llm_tokens_total", {"kind": kind, "stage": stage, "type": "completion"}, completion)
+    m = _current()
+    if m is not None:
+        m["llm_calls"] += 1
+        m["tokens"] += prompt + completion
+
+def begin_request(tenant=None):
+    """Start collecting metrics for the current /chat request (of the tenant)."""
+    g.metrics = {"start": time.perf_counter(), "stages": [], "llm_calls": 0, "tokens": 0, "tenant": tenant}
+
+def end_request(path):
+    """Record the collected stage timings and per-request totals under path."""
+    m = g.pop("metrics", None)
+    if m is None:
+        return
+    seconds = time.perf_counter() - m["start"]
+    registry.observe("hungergod_request_seconds", {"path": path}, seconds)
+    registry.inc("hungergod_requests_total", {"path": path})
+    for stage, seconds in m["stages"]:
+        registry.observe("hungergod_stage_seconds", {"stage": stage, "path": path}, seconds)
+    registry.observe("hungergod_llm_calls_per_request", {"path": path}, m["llm_calls"])
+    registry.observe("hungergod_llm_tokens_per_request", {"path": path}, m["tokens"])
+    # Per tenant: counters only, so hundreds of tenants stay a few series each
+    tenant = m.get("tenant")
+    if tenant:
+        registry.inc("hungergod_tenant_requests_total", {"tenant": tenant, "path": path})
+        registry.inc("hungergod_tenant_request_seconds_total", {"tenant": tenant}, seconds)
+        if m["llm_calls"]:
+            registry.inc("hungergod_tenant_llm_calls_total", {"tenant": tenant}, m["llm_calls"])
+        if m["tokens"]:
+            registry.inc("hungergod_tenant_llm_tokens_total", {"tenant": tenant}, m["tokens"])
@@ -1,66 +1,42 @@
 import json
-import openai
+import asyncio
 
-from .config import PIZZERIA, INFO
+from .config import FINAL_FUNCTIONS
 from .menu_helpers import format_menu, best_match
-from .cart_logic import cart_summary, confirm_order, do_checkout
-from .ai_rag import rag_response
+from .cart_logic import cart_summary, confirm_order, do_checkout, find_order
+from .ai_rag import rag_response, rag_response_async, rag_response_stream
 from .state_handler import set_state
+from .prompts import build_messages, cart_text, message_tokens, report_prompt
+from .llm import LLMUnavailable, chat_completion, achat_completion, stream_completion
+from .utils import trace
+from .metrics import timed, timed_stream
+from .budget import BudgetExceeded
+from .tenants import current_tenant
 
-# Define available functions for OpenAI function calling
+# Define available functions for OpenAI function calling. They are sent with
+# every function-calling prompt, so descriptions are short and empty
+# "required" lists are left out
+_ITEM_PARAMETERS = {
+    "type": "object",
+    "properties": {"item": {"type": "string"}, "quantity": {"type": "integer"}},
+    "required": ["item"],
+}
+_NO_PARAMETERS = {"type": "object", "properties": {}}
 function_definitions = [
-    {
-        "name": "show_menu",
-        "description": "Get the formatted restaurant menu",
-        "parameters": {"type": "object", "properties": {}, "required": []},
-    },
-    {
-        "name": "get_info",
-        "description": "Get restaurant address, hours, and phone number",
-        "parameters": {"type": "object", "properties": {}, "required": []},
-    },
-    {
-        "name": "add_to_cart",
-        "description": "Add an item and quantity to the cart",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "item": {"type": "string"},
-                "quantity": {"type": "integer"},
-            },
-            "required": ["item"],
-        },
-    },
-    {
-        "name": "remove_from_cart",
-        "description": "Remove an item and quantity from the cart",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "item": {"type": "string"},
-                "quantity": {"type": "integer"},
-            },
-            "required": ["item"],
-        },
-    },
-    {
-        "name": "checkout",
-        "description": "Finalize the order and provide summary",
-        "parameters": {"type": "object", "properties": {}, "required": []},
-    },
+    {"name": "show_menu", "description": "Restaurant menu", "parameters": _NO_PARAMETERS},
+    {"name": "get_info", "description": "Address, hours and phone number", "parameters": _NO_PARAMETERS},
+    {"name": "add_to_cart", "description": "Add an item to the cart", "parameters": _ITEM_PARAMETERS},
+    {"name": "remove_from_cart", "description": "Remove an item from the cart", "parameters": _ITEM_PARAMETERS},
+    {"name": "checkout", "description": "Finalize the order", "parameters": _NO_PARAMETERS},
     {
         "name": "track_order",
-        "description": "Get the status of the last order",
-        "parameters": {"type": "object", "properties": {}, "required": []},
+        "description": "Order status (the customer's last order if no number is given)",
+        "parameters": {"type": "object", "properties": {"number": {"type": "string"}}},
     },
     {
         "name": "rag_fallback",
-        "description": "Fallback answer via retrieval-augmented generation",
-        "parameters": {
-            "type": "object",
-            "properties": {"query": {"type": "string"}},
-            "required": ["query"],
-        },
+        "description": "Answer other questions from the restaurant's documents",
+        "parameters": {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]},
     },
 ]
 
@@ -69,7 +45,7 @@ def fn_show_menu(args, state):
     return format_menu(), state
 
 def fn_get_info(args, state):
-    info = f"📍 {INFO['address']}\n🕒 {INFO['hours']}\n📞 {INFO['phone']}"
+    info = current_tenant().response("contacts", "📍 {address}\n🕒 {hours}\n📞 {phone}")
     return info, state
 
 def fn_add_to_cart(args, state):
@@ -78,8 +54,7 @@ def fn_add_to_cart(args, state):
     match = best_match(name)
     if not match:
         return f"Mi dispiace, '{name}' non è nel menu.", state
-    for _ in range(qty):
-        state['cart'].append(match)
+    state['cart'].add(match, qty)
     items_added = [(match['name'], qty)]
     reply = confirm_order(state, items_added)
     return reply, state
@@ -87,11 +62,7 @@ def fn_add_to_cart(args, state):
 def fn_remove_from_cart(args, state):
     name = args.get('item', '')
     qty = int(args.get('quantity', 1))
-    removed = []
-    matches = [x for x in state['cart'] if x['name'].lower() == name.lower()]
-    for m in matches[:qty]:
-        state['cart'].remove(m)
-        removed.append(name)
+    removed = [name] * state['cart'].remove(name, qty)
     if removed:
         reply = f"🗑️ Ho rimosso {', '.join(removed)} dal carrello."
     else:
@@ -103,10 +74,10 @@ def fn_checkout(args, state):
     return reply, state
 
 def fn_track_order(args, state):
-    lo = state.get('last_order', {})
-    if lo:
-        eta = lo.get('eta', '')
-        return f"Il tuo ordine {lo.get('number','')} sarà pronto alle {eta}.", state
+    order = find_order(state, args.get('number'))
+    if order:
+        eta = order.get('eta') or ''
+        return f"Il tuo ordine {order['number']} sarà pronto alle {eta}.", state
     return "Nessun ordine recente trovato.", state
 
 def fn_rag_fallback(args, state):
@@ -125,63 +96,211 @@ handlers = {
     'rag_fallback': fn_rag_fallback,
 }
 
-def handle_function_call(text, state):
-    # Build messages: system + history + user
-    messages = [
-        {"role": "system", "content": f"Sei Mario, assistente di {PIZZERIA}. Usa le funzioni disponibili per aiutare l'utente."}
-    ]
-    # Include recent history
-    for msg in state.get('history', [])[-6:]:
-        if isinstance(msg, dict):
-            messages.append({"role": msg.get('role', 'user'), "content": msg.get('content', '')})
+# Result policy: these handlers return finished user-facing text, so their
+# result is the reply; the others are rephrased by a second completion
+final_results = {name for name in handlers if name in FINAL_FUNCTIONS}
+
+# Handlers that call the LLM themselves, awaited on the async path
+async def afn_rag_fallback(args, state):
+    query = args.get('query', '')
+    reply = await rag_response_async(query, state)
+    return reply, state
+
+async_handlers = {
+    'rag_fallback': afn_rag_fallback,
+}
+
+# {pizzeria} is the tenant's name
+FUNCTION_INSTRUCTIONS = "Sei Mario, assistente di {pizzeria}. Usa le funzioni disponibili per aiutare l'utente."
+
+def _function_messages(text, state):
+    """Build messages: instructions + cart + history summary + recent history + user."""
+    return build_messages(
+        "function_call_llm", current_tenant().prompt("functions", FUNCTION_INSTRUCTIONS), text, state,
+        context=f"Carrello attuale: {cart_text(state.get('cart'))}", turns=6, functions=function_definitions,
+    )
+
+def _append_function_result(messages, function_call, result):
+    """Append the function call and its result so the model can answer from them."""
+    messages.append({
+        'role': 'assistant',
+        'content': None,
+        'function_call': {
+            'name': function_call.name,
+            'arguments': function_call.arguments,
+        }
+    })
+    messages.append({
+        'role': 'function',
+        'name': function_call.name,
+        'content': json.dumps(result, ensure_ascii=False),
+    })
+    report_prompt("function_result_llm", message_tokens(messages))
+
+def _is_final(function_call):
+    """Whether the function's result goes to the user without a second completion."""
+    if function_call.name in final_results:
+        trace(final_result=True)
+        return True
+    return False
+
+def _dispatch(function_call):
+    """(name, arguments) of the requested function."""
+    name = function_call.name
+    trace("function_call", function=name)
+    return name, json.loads(function_call.arguments or '{}')
+
+def _unknown(name):
+    return f"Funzione '{name}' non riconosciuta."
+
+def _run_function(function_call, state):
+    """Execute the local handler for the requested function and persist the state."""
+    name, args = _dispatch(function_call)
+    handler = handlers.get(name)
+    if not handler:
+        return _unknown(name)
+    with timed("function_handler"):
+        result, new_state = handler(args, state)
+    # Persist updated state
+    set_state(new_state)
+    return result
+
+async def _run_function_async(function_call, state):
+    """
+    Same as _run_function(), awaiting the handlers that call the LLM and
+    running the blocking ones (order store, KB) in a worker thread, with the
+    request's context, so they do not hold up the event loop.
+    """
+    name, args = _dispatch(function_call)
+    if name not in handlers:
+        return _unknown(name)
+    with timed("function_handler"):
+        if name in async_handlers:
+            result, new_state = await async_handlers[name](args, state)
         else:
-            messages.append({"role": "assistant", "content": msg})
-    # User message
-    messages.append({"role": "user", "content": text})
+            result, new_state = await asyncio.to_thread(handlers[name], args, state)
+    set_state(new_state)
+    return result
+
+def _first_completion(messages):
+    """The completion that may ask for a function call."""
+    with timed("function_call_llm"):
+        return chat_completion(
+            stage="function_call_llm",
+            messages=messages,
+            functions=function_definitions,
+            function_call="auto",
+        )
+
+async def _first_completion_async(messages):
+    with timed("function_call_llm"):
+        return await achat_completion(
+            stage="function_call_llm",
+            messages=messages,
+            functions=function_definitions,
+            function_call="auto",
+        )
+
+def _rephrase_stream(result, chunks):
+    """Stream the rephrased reply, or the function's own result if the budget runs out before it starts."""
+    started = False
+    try:
+        for chunk in chunks:
+            started = True
+            yield chunk
+    except BudgetExceeded:
+        if started:
+            raise
+        yield result
+
+def handle_function_call(text, state):
+    messages = _function_messages(text, state)
 
     # Call OpenAI with function definitions
-    response = openai.chat.completions.create(
-        model="gpt-4-1106-preview",
-        messages=messages,
-        functions=function_definitions,
-        function_call="auto",
-    )
+    try:
+        response = _first_completion(messages)
+    except LLMUnavailable:
+        # The API is down: no point trying RAG, the caller replies rule-only
+        raise
+    except BudgetExceeded:
+        # No time for function calling: answer from the KB with what is left
+        return rag_response(text, state)
     msg = response.choices[0].message
     # Check if the model requested a function call
     function_call = getattr(msg, 'function_call', None)
     if function_call:
-        # Extract function name and arguments
-        name = function_call.name
-        args = json.loads(function_call.arguments or '{}')
-        # Execute local handler
-        handler = handlers.get(name)
-        if handler:
-            result, new_state = handler(args, state)
-            # Persist updated state
-            set_state(new_state)
-        else:
-            result = f"Funzione '{name}' non riconosciuta."
-        # Append function call and result to messages
-        # Append the function call message to the conversation
-        messages.append({
-            'role': 'assistant',
-            'content': None,
-            'function_call': {
-                'name': name,
-                'arguments': function_call.arguments,
-            }
-        })
-        messages.append({
-            'role': 'function',
-            'name': name,
-            'content': json.dumps(result),
-        })
+        result = _run_function(function_call, state)
+        if _is_final(function_call):
+            return result
+        _append_function_result(messages, function_call, result)
         # Ask model to respond after function call
-        second = openai.chat.completions.create(
-            model="gpt-4-1106-preview",
+        try:
+            with timed("function_result_llm"):
+                second = chat_completion(
+                    stage="function_result_llm",
+                    messages=messages,
+                    temperature=0.3,
+                )
+        except BudgetExceeded:
+            # The function's own result is a good enough reply (also with the
+            # API down: the function already ran, its result is rule-only)
+            return result
+        return second.choices[0].message.content
+    # If no function call was made, fallback to RAG
+    return rag_response(text, state)
+
+def handle_function_call_stream(text, state):
+    """
+    Same as handle_function_call(), running the function now and returning the
+    reply: the function's result when final, otherwise an iterator over the
+    reply as the model generates it.
+    """
+    messages = _function_messages(text, state)
+    try:
+        response = _first_completion(messages)
+    except LLMUnavailable:
+        raise
+    except BudgetExceeded:
+        return rag_response_stream(text, state)
+    function_call = getattr(response.choices[0].message, 'function_call', None)
+    if function_call:
+        result = _run_function(function_call, state)
+        if _is_final(function_call):
+            return result
+        _append_function_result(messages, function_call, result)
+        return _rephrase_stream(result, timed_stream("function_result_llm", stream_completion(
+            stage="function_result_llm",
             messages=messages,
             temperature=0.3,
-        )
+        )))
+    return rag_response_stream(text, state)
+
+async def handle_function_call_async(text, state):
+    """
+    Same as handle_function_call(), awaiting every LLM round-trip; blocking
+    handlers run in a worker thread.
+    """
+    messages = _function_messages(text, state)
+    try:
+        response = await _first_completion_async(messages)
+    except LLMUnavailable:
+        raise
+    except BudgetExceeded:
+        return await rag_response_async(text, state)
+    function_call = getattr(response.choices[0].message, 'function_call', None)
+    if function_call:
+        result = await _run_function_async(function_call, state)
+        if _is_final(function_call):
+            return result
+        _append_function_result(messages, function_call, result)
+        try:
+            with timed("function_result_llm"):
+                second = await achat_completion(
+                    stage="function_result_llm",
+                    messages=messages,
+                    temperature=0.3,
+                )
+        except BudgetExceeded:
+            return result
         return second.choices[0].message.content
-    # If no function call was made, fallback to RAG
-    return rag_response(text, state)
\ No newline at end of file
+    return await rag_response_async(text, state)
@@ -0,0 +1,152 @@
+import os
+import time
+import sqlite3
+import threading
+
+from .config import ORDER_STORE_PATH
+
+# First order number handed out, so numbers keep the familiar 4+ digit look
+ORDER_NUMBER_START = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    number TEXT UNIQUE,
+    customer TEXT,
+    session_id TEXT,
+    created_at REAL NOT NULL,
+    eta TEXT,
+    total REAL NOT NULL,
+    delivery TEXT,
+    address TEXT,
+    payment TEXT,
+    status TEXT NOT NULL,
+    tenant TEXT NOT NULL DEFAULT 'default'
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id INTEGER NOT NULL REFERENCES orders (id),
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    quantity INTEGER NOT NULL,
+    subtotal REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_customer ON orders (customer, created_at);
+CREATE INDEX IF NOT EXISTS orders_session ON orders (session_id, created_at);
+CREATE INDEX IF NOT EXISTS orders_created ON orders (created_at);
+CREATE INDEX IF NOT EXISTS order_items_order ON order_items (order_id);
+"""
+
+# Restaurant of the orders saved before tenants existed
+DEFAULT_TENANT = "default"
+
+ORDER_COLUMNS = ("id", "number", "customer", "session_id", "created_at", "eta",
+                 "total", "delivery", "address", "payment", "status", "tenant")
+
+def format_number(order_id):
+    return f"#{ORDER_NUMBER_START + order_id}"
+
+class OrderStore:
+    """
+    Orders and their line items in a SQLite file (WAL mode), shared by
+    gunicorn workers. Order numbers come from the AUTOINCREMENT row id, so
+    they never collide, even across processes or tenants. Lookups by number,
+    session or time go through indexes; the first two only find the given
+    tenant's orders.
+    """
+    def __init__(self, path=ORDER_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            # Files created before orders had a tenant
+            if "tenant" not in {row[1] for row in conn.execute("PRAGMA table_info(orders)")}:
+                conn.execute(f"ALTER TABLE orders ADD COLUMN tenant TEXT NOT NULL DEFAULT '{DEFAULT_TENANT}'")
+                conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def create(self, items, total, customer=None, session_id=None, eta=None,
+               delivery=None, address=None, payment=None, status="confirmed", tenant=DEFAULT_TENANT):
+        """
+        Save an order with its line items ({name, price, quantity, subtotal})
+        and return it as a dict, including the allocated number.
+        """
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO orders (customer, session_id, created_at, eta, total, delivery, address, payment, status, tenant) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (customer, session_id, now, eta, total, delivery, address, payment, status, tenant),
+            )
+            order_id = cur.lastrowid
+            number = format_number(order_id)
+            conn.execute("UPDATE orders SET number = ? WHERE id = ?", (number, order_id))
+            conn.executemany(
+                "INSERT INTO order_items (order_id, name, price, quantity, subtotal) VALUES (?, ?, ?, ?, ?)",
+                [(order_id, i["name"], i["price"], i["quantity"], i["subtotal"]) for i in items],
+            )
+        return {
+            "id": order_id, "number": number, "customer": customer, "session_id": session_id,
+            "created_at": now, "eta": eta, "total": total, "delivery": delivery,
+            "address": address, "payment": payment, "status": status, "tenant": tenant, "items": list(items),
+        }
+
+    def _fetch(self, where, params):
+        conn = self._conn()
+        row = conn.execute(
+            f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE {where} "
+            f"ORDER BY created_at DESC, id DESC LIMIT 1",
+            params,
+        ).fetchone()
+        if row is None:
+            return None
+        order = dict(zip(ORDER_COLUMNS, row))
+        order["items"] = [
+            {"name": n, "price": p, "quantity": q, "subtotal": s}
+            for n, p, q, s in conn.execute(
+                "SELECT name, price, quantity, subtotal FROM order_items WHERE order_id = ? ORDER BY rowid",
+                (order["id"],),
+            )
+        ]
+        return order
+
+    def get(self, number, tenant=DEFAULT_TENANT, session_id=None):
+        """
+        The tenant's order by number ("#1234" or "1234"), or None. With a
+        session_id, only if that session placed it: numbers are sequential,
+        so anyone could guess another customer's.
+        """
+        number = str(number).strip()
+        if not number.startswith("#"):
+            number = f"#{number}"
+        if session_id is not None:
+            return self._fetch("number = ? AND tenant = ? AND session_id = ?", (number, tenant, session_id))
+        return self._fetch("number = ? AND tenant = ?", (number, tenant))
+
+    def latest(self, session_id, tenant=DEFAULT_TENANT):
+        """The tenant's most recent order placed by the session, or None."""
+        if not session_id:
+            return None
+        return self._fetch("session_id = ? AND tenant = ?", (session_id, tenant))
+
+    def between(self, start, end):
+        """Orders created in [start, end) (epoch seconds), oldest first."""
+        conn = self._conn()
+        return [
+            dict(zip(ORDER_COLUMNS, row)) for row in conn.execute(
+                f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders "
+                f"WHERE created_at >= ? AND created_at < ? ORDER BY created_at",
+                (start, end),
+            )
+        ]
+
+# Single shared store; the file is opened on first use
+order_store = OrderStore()
@@ -0,0 +1,159 @@
+import json
+import re
+
+from flask import g, has_request_context
+
+from .config import PROMPT_TOKEN_BUDGETS, PROMPT_TURN_TOKENS
+from .cart_logic import cart_summary
+from .history import entry, history_summary
+from .metrics import registry
+
+try:
+    import tiktoken
+except ImportError:  # token counts are estimated from the text instead
+    tiktoken = None
+
+# Tokens a chat message costs besides its content (role and separators)
+MESSAGE_TOKENS = 4
+# Most recent turns kept until everything else has been trimmed
+MIN_HISTORY_TURNS = 2
+_WORDS = re.compile(r"\w+|[^\w\s]")
+_PIECES = re.compile(r"\S+\s*")
+_encoding = None
+
+def _encoder():
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"Token counts estimated, tiktoken encoding not loaded: {e}")
+    return _encoding
+
+def count_tokens(text):
+    """Tokens in the text: exact with tiktoken, otherwise about one per 4 characters of each word."""
+    if not text:
+        return 0
+    enc = _encoder()
+    if enc:
+        return len(enc.encode(text))
+    return sum((len(w) + 3) // 4 for w in _WORDS.findall(text))
+
+def message_tokens(messages, functions=None):
+    """Prompt tokens of the chat messages and function schemas sent with them."""
+    total = sum(MESSAGE_TOKENS + count_tokens(m.get("content") or "") for m in messages)
+    for m in messages:
+        if m.get("function_call"):
+            total += count_tokens(json.dumps(m["function_call"], ensure_ascii=False))
+    if functions:
+        total += count_tokens(json.dumps(functions, ensure_ascii=False, separators=(",", ":")))
+    return total
+
+def clip(text, tokens):
+    """The text cut to about `tokens` tokens at a word boundary, ending in "…" when cut."""
+    if count_tokens(text) <= tokens:
+        return text
+    kept, used = [], 0
+    for piece in _PIECES.findall(text):
+        used += count_tokens(piece)
+        if used > tokens:
+            break
+        kept.append(piece)
+    return "".join(kept).rstrip() + "…"
+
+def cart_text(cart):
+    """Compact cart for a prompt: "Margherita x2, Coca-Cola x1", or "vuoto"."""
+    counts, _ = cart_summary(cart)
+    return ", ".join(f"{name} x{qty}" for name, qty in counts.items()) or "vuoto"
+
+def order_text(order):
+    """Compact last order for a prompt: "n. 1042, pronto alle 20:15, €23.50", or "" without one."""
+    if not order or not order.get("number"):
+        return ""
+    parts = [f"n. {order['number']}"]
+    if order.get("eta"):
+        parts.append(f"pronto alle {order['eta']}")
+    if order.get("total") is not None:
+        parts.append(f"€{float(order['total']):.2f}")
+    return ", ".join(parts)
+
+def build_messages(stage, instructions, text, state, context="", docs=(), turns=6,
+                   transcript=False, functions=None):
+    """
+    Chat messages for one LLM call, always in the same order so that the
+    instructions, identical for every user, open the prompt as a prefix the
+    API can cache: instructions; context, documents and history summary;
+    recent history; user text.
+
+    The prompt is fitted to the stage's PROMPT_TOKEN_BUDGETS entry by dropping,
+    in order: history turns beyond the last MIN_HISTORY_TURNS, the summary,
+    documents after the first, the remaining turns; then by cutting the first
+    document. Each turn is cut to PROMPT_TURN_TOKENS. With transcript=True the
+    history goes into the context message as "User:"/"Bot:" lines.
+    """
+    history = []
+    for msg in state.get("history", [])[-turns:] if turns else []:
+        role, content = entry(msg)
+        history.append(("assistant" if role == "assistant" else "user", clip(content, PROMPT_TURN_TOKENS)))
+    summary = history_summary(state)
+    docs = list(docs)
+
+    def assemble():
+        parts = [context] if context else []
+        if docs:
+            parts.append("Informazioni:\n" + "\n\n".join(docs))
+        if summary:
+            parts.append(f"Riassunto conversazione precedente:\n{summary}")
+        if transcript and history:
+            lines = "\n".join(f"{'Bot' if role == 'assistant' else 'User'}: {content}" for role, content in history)
+            parts.append(f"Conversazione recente:\n{lines}")
+        messages = [{"role": "system", "content": instructions}]
+        if parts:
+            messages.append({"role": "system", "content": "\n\n".join(parts)})
+        if not transcript:
+            messages += [{"role": role, "content": content} for role, content in history]
+        messages.append({"role": "user", "content": text})
+        return messages
+
+    budget = PROMPT_TOKEN_BUDGETS.get(stage)
+    messages = assemble()
+    tokens = message_tokens(messages, functions)
+    trimmed = []
+    if budget and tokens > budget:
+        def over():
+            return message_tokens(assemble(), functions) > budget
+        while len(history) > MIN_HISTORY_TURNS and over():
+            history.pop(0)
+            trimmed.append("history")
+        if summary and over():
+            summary = ""
+            trimmed.append("summary")
+        while len(docs) > 1 and over():
+            docs.pop()
+            trimmed.append("docs")
+        while history and over():
+            history.pop(0)
+            trimmed.append("history")
+        if docs and over():
+            excess = message_tokens(assemble(), functions) - budget
+            docs[0] = clip(docs[0], max(count_tokens(docs[0]) - excess, 0))
+            trimmed.append("docs")
+        messages = assemble()
+        tokens = message_tokens(messages, functions)
+    report_prompt(stage, tokens, sorted(set(trimmed)))
+    return messages
+
+def report_prompt(stage, tokens, trimmed=()):
+    """Record the prompt size of an LLM call per stage, in /metrics and the chat log."""
+    registry.observe("hungergod_prompt_tokens", {"stage": stage}, tokens)
+    for part in trimmed:
+        registry.inc("hungergod_prompt_trimmed_total", {"stage": stage, "part": part})
+    if has_request_context():
+        t = g.get("chat_trace")
+        if t is None:
+            t = g.chat_trace = {"stages": []}
+        t.setdefault("prompt_tokens", {})[stage] = tokens
+        if trimmed:
+            t.setdefault("prompt_trimmed", {})[stage] = list(trimmed)
@@ -0,0 +1,115 @@
+from collections import deque
+
+# Intents whose rule matches should carry the menu items mentioned in the text
+ITEM_INTENTS = ('order', 'add_to_cart', 'remove')
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over lowercase patterns.
+    Each pattern carries an integer payload; a scan returns the set of payloads
+    whose pattern occurs anywhere in the text, in a single pass.
+    """
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        # Empty patterns match every text (same as `'' in text`)
+        self._always = []
+        for pattern, payload in patterns:
+            if not pattern:
+                self._always.append(payload)
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(payload)
+        # Breadth-first pass to wire failure links and merge suffix outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+
+    def findall(self, text):
+        """Return the set of payloads whose pattern occurs in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(self._always)
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+
+class RuleIndex:
+    """
+    Rule KB (utterances, action keywords and menu names/aliases) compiled into
+    one automaton, so a message is scanned once for intents and item mentions.
+    """
+    def __init__(self, utterances, actions, menu):
+        patterns = []
+        # Payload ranges: [0, n_utt) utterances, then keywords, then menu items
+        self._utt_intents = []
+        for u in utterances:
+            patterns.append((u['utterance'].lower(), len(self._utt_intents)))
+            self._utt_intents.append(u['intent'])
+        self._kw_base = len(self._utt_intents)
+        self._kw_intents = []
+        for intent, kws in actions.items():
+            for kw in kws:
+                patterns.append((kw.lower(), self._kw_base + len(self._kw_intents)))
+                self._kw_intents.append(intent)
+        self._item_base = self._kw_base + len(self._kw_intents)
+        self._item_names = []
+        for cat_items in menu.values():
+            for item in cat_items:
+                payload = self._item_base + len(self._item_names)
+                self._item_names.append(item['name'])
+                for term in [item['name']] + item.get('aliases', []):
+                    patterns.append((term.lower(), payload))
+        self._automaton = Automaton(patterns)
+
+    def scan(self, text):
+        """
+        Scan text once and return (utterance intents, first keyword intent, item names),
+        each in KB / menu order.
+        """
+        hits = sorted(self._automaton.findall(text.lower()))
+        kw_base, item_base = self._kw_base, self._item_base
+        utt = [self._utt_intents[h] for h in hits if h < kw_base]
+        kw = next((self._kw_intents[h - kw_base] for h in hits if kw_base <= h < item_base), None)
+        items = [self._item_names[h - item_base] for h in hits if h >= item_base]
+        return utt, kw, items
+
+    def classify(self, text):
+        """
+        Returns a list of dicts: [{"intent": intent, "items": [{name, quantity} ...]}]
+        """
+        utt_intents, kw_intent, item_names = self.scan(text)
+        intents = utt_intents or ([kw_intent] if kw_intent else [])
+        results = []
+        for intent in intents:
+            items = []
+            if intent in ITEM_INTENTS:
+                items = [{"name": name, "quantity": 1} for name in item_names]
+                # Treat 'order' with items as add_to_cart
+                if intent == 'order' and items:
+                    intent = 'add_to_cart'
+            results.append({"intent": intent, "items": items})
+        return results
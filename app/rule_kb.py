@@ -1,74 +1,27 @@
-import os
-import json
+from .tenants import default_rules, current_tenant
 
-from .config import BASE_DIR, menu
-
-# Path to the Italian KB file
-KB_PATH = os.path.join(BASE_DIR, 'italian_kb.json')
-
-# Load the KB JSON, which is an array: first items are utterance-intent pairs, last element is config
-with open(KB_PATH, 'r', encoding='utf-8') as f:
-    raw = json.load(f)
-
-# Separate utterances and config
-utterances = []
-categories = {}
-actions = {}
-quantifiers = []
-responses_template = {}
-for entry in raw:
-    if isinstance(entry, dict) and 'intent' in entry and 'utterance' in entry:
-        utterances.append(entry)
-    elif isinstance(entry, dict) and 'categories' in entry:
-        # config block
-        categories = entry.get('categories', {})
-        actions = entry.get('actions', {})
-        quantifiers = entry.get('quantifiers', [])
-        responses_template = entry.get('responses_template', {})
+# Rule KB of the default tenant (the local intent classifier is trained on it);
+# each request uses its own tenant's rules and menu
+utterances = default_rules.utterances
+actions = default_rules.actions
+quantifiers = default_rules.quantifiers
 
 def classify(text):
     """
-    Simple rule-based classifier using the Italian KB.
+    Simple rule-based classifier using the tenant's KB (the Italian KB by default).
     Returns a list of dicts: [{"intent": intent, "items": [{name, quantity} ...]}]
+    Utterance matches win; otherwise the first matching action keyword is used.
+    """
+    return current_tenant().rule_index().classify(text)
+
+def mentioned_items(text):
+    """Names of the menu items the text mentions (by name or alias), in menu order."""
+    return current_tenant().rule_index().scan(text)[2]
+
+def parse_order(text):
+    """
+    Items and quantities to add and/or remove when the message is an order
+    ("due margherite e tre coca", "togli una diavola"), in classify()'s format;
+    None otherwise.
     """
-    text_l = text.lower()
-    results = []
-    # Check utterance patterns first
-    for u in utterances:
-        utt = u['utterance'].lower()
-        if utt == text_l or utt in text_l:
-            intent = u['intent']
-            items = []
-            # Extract items if relevant
-            if intent in ('order', 'add_to_cart', 'remove'):
-                for cat_items in menu.values():
-                    for item in cat_items:
-                        terms = [item['name']] + item.get('aliases', [])
-                        for term in terms:
-                            if term.lower() in text_l:
-                                items.append({"name": item['name'], "quantity": 1})
-                                break
-                # Treat 'order' with items as add_to_cart
-                if intent == 'order' and items:
-                    intent = 'add_to_cart'
-            results.append({"intent": intent, "items": items})
-    if results:
-        return results
-    # Fallback: check simple action keywords
-    for intent, kws in actions.items():
-        for kw in kws:
-            if kw in text_l:
-                items = []
-                if intent in ('order', 'add_to_cart', 'remove'):
-                    for cat_items in menu.values():
-                        for item in cat_items:
-                            terms = [item['name']] + item.get('aliases', [])
-                            for term in terms:
-                                if term.lower() in text_l:
-                                    items.append({"name": item['name'], "quantity": 1})
-                                    break
-                    if intent == 'order' and items:
-                        intent = 'add_to_cart'
-                return [{"intent": intent, "items": items}]
-    # No rule-based match
-    return []
\ No newline at end of file
+    return current_tenant().slot_parser().parse(text)
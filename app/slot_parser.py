@@ -0,0 +1,155 @@
+import re
+
+from .menu_index import MenuMatcher
+
+# Values of the number words the KB lists as quantifiers
+NUMBER_WORDS = {
+    "un": 1, "uno": 1, "una": 1, "due": 2, "tre": 3, "quattro": 4, "cinque": 5,
+    "sei": 6, "sette": 7, "otto": 8, "nove": 9, "dieci": 10,
+}
+MAX_QUANTITY = 50
+# Verb forms that switch the following items to adding or removing; whole
+# words, so nouns sharing a stem ("l'ordine", "il conto") are not verbs
+ADD_VERBS = {
+    "vorrei", "vorremmo", "voglio", "vogliamo", "volevo", "volevamo",
+    "prendo", "prendiamo", "prendere", "prenderei", "prenderemmo", "prendimi",
+    "aggiungi", "aggiungo", "aggiungere", "aggiungimi", "aggiungici", "aggiungete",
+    "metti", "metto", "mettere", "mettimi", "mettici", "mettete",
+    "ordino", "ordiniamo", "ordinare", "ordinerei", "ordineremmo",
+    "dammi", "dacci", "datemi", "dateci", "fammi", "fatemi",
+}
+# "portami il conto": these add only when an item follows
+CARRY_VERBS = {"porta", "portami", "portaci", "porti", "portate", "portatemi", "portateci"}
+REMOVE_VERBS = {
+    "togli", "toglimi", "togliere", "tolgo", "tolga", "rimuovi", "rimuovere", "rimuovo",
+    "cancella", "cancellare", "cancello", "elimina", "eliminare", "elimino",
+    "leva", "levami", "levare", "scarta", "scartare",
+}
+VERBS = ADD_VERBS | CARRY_VERBS | REMOVE_VERBS
+# Words an order can contain besides items and quantities
+FILLERS = {
+    "e", "ed", "poi", "anche", "pure", "ancora", "con", "più", "per", "favore", "piacere", "grazie",
+    "ok", "allora", "ciao", "mi", "me", "ci", "ne", "a", "al", "la", "le", "il", "lo", "i", "gli", "l",
+    "di", "del", "della", "delle", "dei", "degli", "dell", "x", "altra", "altre", "altro", "altri",
+    "pizza", "pizze", "bottiglia", "bottiglie", "lattina", "lattine", "porzione", "porzioni",
+}
+# Unrelated words an order with a verb may contain ("vorrei stasera due napoli")
+MAX_OTHER_WORDS = 2
+# Typos are matched more strictly than in best_match(), since any word may be tried
+FUZZY_CUTOFF = 0.8
+TOKEN = re.compile(r"\d+|[^\W\d_]+(?:-[^\W\d_]+)*")
+
+def tokens(text):
+    return TOKEN.findall(text.lower())
+
+def plural(word):
+    """Regular Italian plural of a word (margherita -> margherite, cannolo -> cannoli)."""
+    if len(word) <= 3 or "-" in word:
+        return word
+    if word.endswith(("ca", "ga")):
+        return word[:-1] + "he"
+    if word.endswith("a"):
+        return word[:-1] + "e"
+    if word.endswith(("o", "e")):
+        return word[:-1] + "i"
+    return word
+
+class SlotParser:
+    """
+    Deterministic order parser built once per menu: finds the menu items a
+    message names (names, aliases, their plurals, close typos), the quantity
+    before each one ("due", "3", "x2" after it) and whether it is being added
+    or removed, e.g. "due margherite e tre coca" or "togli una diavola".
+    """
+    def __init__(self, menu, quantifiers):
+        self.numbers = {w: NUMBER_WORDS[w] for w in quantifiers if w in NUMBER_WORDS}
+        self.matcher = MenuMatcher(menu, cutoff=FUZZY_CUTOFF)
+        # Token tuples of every name/alias (and plural) -> menu name
+        self.terms = {}
+        for cat_items in menu.values():
+            for item in cat_items:
+                for term in [item["name"]] + item.get("aliases", []):
+                    words = tuple(tokens(term))
+                    for variant in (words, tuple(plural(w) for w in words)):
+                        self.terms.setdefault(variant, item["name"])
+        self.longest = max((len(t) for t in self.terms), default=1)
+
+    def _quantity(self, word):
+        if word.isdigit():
+            n = int(word)
+            return n if 0 < n <= MAX_QUANTITY else None
+        return self.numbers.get(word)
+
+    def _item_at(self, words, i):
+        """(menu name, words used) for the item starting at words[i], or (None, 0)."""
+        for n in range(min(self.longest, len(words) - i), 0, -1):
+            name = self.terms.get(tuple(words[i:i + n]))
+            if name:
+                return name, n
+        # Typos: one or two words that are not part of the order grammar
+        for n in (2, 1):
+            chunk = words[i:i + n]
+            if len(chunk) < n or any(w in FILLERS or w in VERBS or self._quantity(w) for w in chunk):
+                continue
+            query = " ".join(chunk)
+            if len(query) >= 4:
+                item = self.matcher.match(query)
+                if item:
+                    return item["name"], n
+        return None, 0
+
+    def _item_follows(self, words, i):
+        """Whether an item comes after words[i], past quantities and fillers."""
+        i += 1
+        while i < len(words) and (words[i] in FILLERS or self._quantity(words[i])):
+            i += 1
+        return i < len(words) and self._item_at(words, i)[0] is not None
+
+    def parse(self, text):
+        """
+        [{"intent": "add_to_cart" | "remove", "items": [{name, quantity}]}], or
+        None when the message is not (only) an order. Questions are never orders
+        ("quando arriva la diavola?"). Without an add/remove verb, every word
+        must be an item, a quantity or a filler; with one, at most
+        MAX_OTHER_WORDS may be something else.
+        """
+        if "?" in text:
+            return None
+        words = tokens(text)
+        found = {"add_to_cart": [], "remove": []}
+        mode = "add_to_cart"
+        negated = has_verb = False
+        other_words = 0
+        qty = None
+        i = 0
+        while i < len(words):
+            word = words[i]
+            name, used = self._item_at(words, i)
+            if name:
+                item = {"name": name, "quantity": qty or 1}
+                i += used
+                # "diavola x2"
+                if i + 1 < len(words) and words[i] == "x" and self._quantity(words[i + 1]):
+                    item["quantity"] = self._quantity(words[i + 1])
+                    i += 2
+                found[mode].append(item)
+                qty = None
+                continue
+            if self._quantity(word):
+                qty = self._quantity(word)
+            elif word == "non":
+                negated = True
+            elif word in REMOVE_VERBS:
+                mode, has_verb = "remove", True
+            elif word in ADD_VERBS or (word in CARRY_VERBS and self._item_follows(words, i)):
+                # "non voglio più la diavola"
+                mode, has_verb = ("remove" if negated else "add_to_cart"), True
+                negated = False
+            elif word not in FILLERS:
+                other_words += 1
+            i += 1
+        if not (found["add_to_cart"] or found["remove"]):
+            return None
+        if other_words > (MAX_OTHER_WORDS if has_verb else 0):
+            return None
+        return [{"intent": intent, "items": items} for intent, items in found.items() if items]
@@ -1,26 +1,98 @@
-from flask import session
-from datetime import datetime
+from flask import session, g, current_app
+from datetime import datetime, timedelta
+
+from .cart_logic import Cart, as_cart
+from .utils import trace
+from .metrics import timed, registry
+from .config import SESSION_REFRESH_AFTER
+from .tenants import DEFAULT_TENANT, current_tenant
+
+def session_key():
+    """Session entry of the state: the session cookie is shared by every tenant on the host."""
+    tenant = current_tenant().id
+    return "user_state" if tenant == DEFAULT_TENANT else f"user_state:{tenant}"
+
+class StateContext:
+    """
+    Request-scoped unit of work for the user's session state.
+    The state is loaded once, set_state() only marks it dirty, and flush()
+    writes it back to the session once at the end of the request. Sessions
+    are stored only when modified (SESSION_REFRESH_EACH_REQUEST is off), so a
+    state last written SESSION_REFRESH_AFTER seconds ago is written again to
+    push back its expiry.
+    """
+    def __init__(self):
+        self.dirty = False
+        self.key = session_key()
+        self.state = session.get(self.key)
+        if self.state is None:
+            self.state = {
+                "step": "start",
+                "cart": Cart(),
+                "history": [],
+                # For conversational flows
+                "pending_order": {},
+                "last_order": {},
+                "last_active": datetime.now(),
+            }
+            self.dirty = True
+            trace(new_session=True)
+        elif datetime.now() - self.state.get("last_active", datetime.min) >= timedelta(seconds=SESSION_REFRESH_AFTER):
+            self.dirty = True
+        # Upgrade carts saved as a list of item dicts by older sessions
+        if not isinstance(self.state.get("cart"), Cart):
+            self.state["cart"] = as_cart(self.state.get("cart"))
+            self.dirty = True
+
+    def set(self, s):
+        self.state = s
+        self.dirty = True
+
+    def flush(self):
+        """Write the state back if it changed or is due a refresh; return whether it was written."""
+        written = self.dirty
+        if written:
+            self.state["last_active"] = datetime.now()
+            session[self.key] = self.state
+            session.modified = True
+            registry.inc("hungergod_state_flushes_total", {})
+        elif not session.modified:
+            registry.inc("hungergod_session_writes_skipped_total", {})
+        self.dirty = False
+        return written
+
+def _context():
+    ctx = g.get("state_ctx")
+    if ctx is None:
+        ctx = g.state_ctx = StateContext()
+    return ctx
 
 def get_state():
     """
     Retrieve or initialize the user's session state.
     """
-    return session.setdefault(
-        "user_state",
-        {
-            "step": "start",
-            "cart": [],
-            "history": [],
-            # For conversational flows
-            "pending_order": {},
-            "last_order": {},
-            "last_active": datetime.now(),
-        },
-    )
+    return _context().state
 
 def set_state(s):
     """
-    Persist the updated state back into the session.
+    Mark the updated state for persistence at the end of the request.
+    """
+    _context().set(s)
+
+def flush_state(response):
+    """
+    after_request hook: persist the state once, only if something changed.
+    """
+    ctx = g.pop("state_ctx", None)
+    if ctx is not None:
+        with timed("session_write"):
+            ctx.flush()
+    return response
+
+def persist_state():
+    """
+    Persist the state and save the session right away, for streamed replies
+    that keep changing the state after Flask has already saved the session.
     """
-    session["user_state"] = s
-    session.modified = True
\ No newline at end of file
+    flush_state(None)
+    current_app.session_interface.save_session(current_app, session, current_app.response_class())
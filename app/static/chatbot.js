@@ -12,7 +12,7 @@ const cartCount = document.getElementById('cartCount');
 const menuButton = document.getElementById('menuButton');
 const checkoutButton = document.getElementById('checkoutButton');
 
-let cart = [];
+let cart = { items: [], count: 0, total: 0 };
 
 window.addEventListener('DOMContentLoaded', () => {
   setTimeout(() => {
@@ -54,38 +54,85 @@ function sendMessage(overrideMessage) {
   }
   messageInput.value = '';
 
-  // Send request and manage tick statuses and typing simulation
-  fetch('/chat', {
+  // Show typing indicator until the first words of the reply arrive
+  const typing = document.createElement('div');
+  typing.className = 'typing-indicator';
+  typing.textContent = 'Mario sta scrivendo...';
+
+  let botMsgEl = null;
+  let text = '';
+  let frame = null;
+  // Re-render the markdown at most once per frame while the reply streams in
+  const render = () => {
+    frame = null;
+    botMsgEl.querySelector('.message-content').innerHTML = marked.parse(text);
+    botMsgEl.scrollIntoView({ block: 'end' });
+  };
+  const handleEvent = (event, data) => {
+    // Read: double blue ticks, once the reply starts
+    if (userMsgEl && !text) updateStatus(userMsgEl, 'read');
+    if (event === 'delta') {
+      text += data.text;
+      if (!botMsgEl) {
+        typing.remove();
+        botMsgEl = addMessage(text, 'bot');
+      } else if (!frame) {
+        frame = requestAnimationFrame(render);
+      }
+    } else if (event === 'done') {
+      typing.remove();
+      text = data.response;
+      if (!botMsgEl) botMsgEl = addMessage(text, 'bot');
+      if (frame) cancelAnimationFrame(frame);
+      render();
+      if (data.cart) {
+        cart = data.cart;
+        updateCartUI();
+      }
+    } else if (event === 'error') {
+      throw new Error('reply interrupted');
+    }
+  };
+
+  // Send request and manage tick statuses while the reply streams in (server-sent events)
+  // Under /t/<tenant>/ the page sets the tenant's URL
+  fetch(window.CHAT_STREAM_URL || '/chat/stream', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ message })
   })
-    .then(res => {
+    .then(async res => {
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
       // Delivered: double gray ticks
       if (userMsgEl) updateStatus(userMsgEl, 'delivered');
-      return res.json();
-    })
-    .then(data => {
-      // Read: double blue ticks
-      if (userMsgEl) updateStatus(userMsgEl, 'read');
-      // Show typing indicator after read ticks
-      const typing = document.createElement('div');
-      typing.className = 'typing-indicator';
-      typing.textContent = 'Mario sta scrivendo...';
       chatBox.appendChild(typing);
       typing.scrollIntoView({ behavior: 'smooth', block: 'end' });
-      // Simulate typing delay
-      setTimeout(() => {
-        chatBox.removeChild(typing);
-        sendBotMessage(data.response);
-        if (data.cart) {
-          cart = data.cart;
-          updateCartUI();
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // Events are separated by a blank line
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+          const raw = buffer.slice(0, end);
+          buffer = buffer.slice(end + 2);
+          let event = 'message';
+          let data = '';
+          raw.split('\n').forEach(line => {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+          });
+          handleEvent(event, JSON.parse(data));
         }
-      }, 800);
+      }
     })
     .catch(err => {
       console.error(err);
+      typing.remove();
       sendBotMessage('Errore di connessione al server. Riprova più tardi.');
     });
 }
@@ -124,18 +171,7 @@ function addMessage(content, sender) {
 }
 
 function updateCartUI() {
-  let count = 0;
-  const groupedItems = {};
-  let total = 0;
-
-  cart.forEach(item => {
-    if (!groupedItems[item.name]) {
-      groupedItems[item.name] = { count: 0, price: item.price };
-    }
-    groupedItems[item.name].count++;
-    count++;
-    total += item.price;
-  });
+  const count = cart.count || 0;
 
   cartCount.textContent = count;
 
@@ -149,14 +185,14 @@ function updateCartUI() {
   cartButton.classList.remove('empty');
   cartItems.innerHTML = '';
 
-  Object.entries(groupedItems).forEach(([name, { count, price }]) => {
+  cart.items.forEach(({ name, quantity, subtotal }) => {
     const itemEl = document.createElement('div');
     itemEl.className = 'cart-item';
-    itemEl.innerHTML = `<span>${name} x${count}</span><span>€${(count * price).toFixed(2)}</span>`;
+    itemEl.innerHTML = `<span>${name} x${quantity}</span><span>€${subtotal.toFixed(2)}</span>`;
     cartItems.appendChild(itemEl);
   });
 
-  cartTotal.textContent = `€${total.toFixed(2)}`;
+  cartTotal.textContent = `€${cart.total.toFixed(2)}`;
 }
 /**
  * Update tick status on user message:
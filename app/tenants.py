@@ -0,0 +1,252 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from flask import g, has_request_context, request
+
+from .config import BASE_DIR, MENU_PATH, PIZZERIA, INFO, KB_WARMUP, TENANTS_DIR, TENANT_CACHE_SIZE
+from .menu_catalog import CatalogLoader
+from .rule_index import RuleIndex
+from .slot_parser import SlotParser
+from .kb import KB_DIR, EmbeddingStore, KnowledgeBase, LazyKnowledgeBase
+from .metrics import registry
+
+# Restaurant configured in config.py, served when no other tenant is named
+DEFAULT_TENANT = "default"
+# Tenant ids are directory names under TENANTS_DIR and URL path segments
+TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+TENANT_PREFIX = "/t/"
+# Rule KB of the default tenant, shared by tenants without their own kb.json
+KB_PATH = os.path.join(BASE_DIR, 'italian_kb.json')
+
+class RuleKB:
+    """Utterance-intent pairs, action keywords, quantifiers and reply templates of a rule KB file."""
+    def __init__(self, raw):
+        self.utterances = []
+        self.categories = {}
+        self.actions = {}
+        self.quantifiers = []
+        self.responses = {}
+        # The KB JSON is an array: utterance-intent pairs, then a config block
+        for entry in raw:
+            if isinstance(entry, dict) and 'intent' in entry and 'utterance' in entry:
+                self.utterances.append(entry)
+            elif isinstance(entry, dict) and 'categories' in entry:
+                self.categories = entry.get('categories', {})
+                self.actions = entry.get('actions', {})
+                self.quantifiers = entry.get('quantifiers', [])
+                self.responses = entry.get('responses_template', {})
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+default_rules = RuleKB.load(KB_PATH)
+
+def fill(template, fields):
+    """The template with each {field} replaced; other braces are left alone."""
+    for field, value in fields.items():
+        template = template.replace("{" + field + "}", str(value))
+    return template
+
+# Embeddings are keyed by content, so every tenant's KB shares one store
+_store = None
+
+def _embedding_store():
+    global _store
+    if _store is None:
+        _store = EmbeddingStore()
+    return _store
+
+class Tenant:
+    """
+    One restaurant: name and details, menu, rule KB, reply templates, LLM
+    instructions and RAG documents. The rule index and slot parser are
+    compiled on first use and again when the menu file changes; the RAG index
+    is built in the background by warm_up() or on the first question needing it.
+    """
+    def __init__(self, tenant_id, name=PIZZERIA, info=INFO, menu_path=MENU_PATH, rules=default_rules,
+                 docs_dir=KB_DIR, responses=None, prompts=None):
+        self.id = tenant_id
+        self.name = name
+        self.info = dict(info)
+        self.rules = rules
+        self.responses = {**rules.responses, **(responses or {})}
+        self.prompts = prompts or {}
+        self._filled = {}
+        self.loader = CatalogLoader(menu_path, title=name)
+        # (catalog, rule index, slot parser) for the catalog they were built from
+        self._compiled = (None, None, None)
+        # The default tenant keeps the single-restaurant matrix file
+        kb_name = None if tenant_id == DEFAULT_TENANT else tenant_id
+        self.kb = LazyKnowledgeBase(lambda: KnowledgeBase(_embedding_store(), docs_dir, kb_name))
+
+    @classmethod
+    def load(cls, tenant_id, directory):
+        """
+        Tenant from its directory: menu.json, and optionally tenant.json (name,
+        info, responses, prompts), kb.json (rule KB) and kb_docs/ (RAG documents).
+        """
+        config = {}
+        path = os.path.join(directory, "tenant.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                config = json.load(f)
+        kb_path = os.path.join(directory, "kb.json")
+        return cls(
+            tenant_id,
+            name=config.get("name", tenant_id),
+            info={**dict.fromkeys(INFO, ""), **config.get("info", {})},
+            menu_path=os.path.join(directory, "menu.json"),
+            rules=RuleKB.load(kb_path) if os.path.exists(kb_path) else default_rules,
+            docs_dir=os.path.join(directory, "kb_docs"),
+            responses=config.get("responses"),
+            prompts=config.get("prompts"),
+        )
+
+    def catalog(self):
+        """Current menu catalog; take one snapshot per operation."""
+        return self.loader.current()
+
+    def _indexes(self):
+        catalog = self.catalog()
+        compiled = self._compiled
+        if compiled[0] is not catalog:
+            compiled = self._compiled = (
+                catalog,
+                RuleIndex(self.rules.utterances, self.rules.actions, catalog.menu),
+                SlotParser(catalog.menu, self.rules.quantifiers),
+            )
+        return compiled
+
+    def rule_index(self):
+        return self._indexes()[1]
+
+    def slot_parser(self):
+        return self._indexes()[2]
+
+    def response(self, key, default, **fields):
+        """Reply template `key` (or the default) with {name}, the info fields and the given fields filled in."""
+        return fill(self.responses.get(key, default), {"name": self.name, **self.info, **fields})
+
+    def prompt(self, key, default):
+        """LLM instructions `key` (the tenant's own or the default) with {pizzeria} filled in."""
+        text = self._filled.get(key)
+        if text is None:
+            text = self._filled[key] = fill(self.prompts.get(key, default), {"pizzeria": self.name})
+        return text
+
+class TenantRegistry:
+    """
+    Tenants of TENANTS_DIR, loaded on first use and kept in an LRU of at most
+    `size`; loading one more unloads the least recently used, indexes
+    included. The default tenant is always loaded and not counted.
+    """
+    def __init__(self, directory=TENANTS_DIR, size=TENANT_CACHE_SIZE):
+        self.directory = directory
+        self.size = size
+        self.default = Tenant(DEFAULT_TENANT)
+        self._tenants = OrderedDict()
+        self._lock = threading.Lock()
+        self._hosts = None
+
+    def exists(self, tenant_id):
+        return bool(
+            self.directory and TENANT_ID.match(tenant_id)
+            and os.path.isfile(os.path.join(self.directory, tenant_id, "menu.json"))
+        )
+
+    def get(self, tenant_id):
+        """The tenant, loaded on first use; None if there is no such tenant."""
+        if tenant_id == DEFAULT_TENANT:
+            return self.default
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                self._tenants.move_to_end(tenant_id)
+                return tenant
+        if not self.exists(tenant_id):
+            return None
+        # Loaded outside the lock: other tenants keep being served meanwhile
+        start = time.perf_counter()
+        try:
+            tenant = Tenant.load(tenant_id, os.path.join(self.directory, tenant_id))
+        except (OSError, ValueError) as e:
+            print(f"Tenant {tenant_id} not loaded: {e}")
+            return None
+        registry.observe("hungergod_tenant_load_seconds", {}, time.perf_counter() - start)
+        with self._lock:
+            # Keep the copy another request may have loaded first
+            tenant = self._tenants.setdefault(tenant_id, tenant)
+            self._tenants.move_to_end(tenant_id)
+            while len(self._tenants) > self.size:
+                self._tenants.popitem(last=False)
+                registry.inc("hungergod_tenant_evictions_total", {})
+            registry.set("hungergod_tenants_loaded", {}, len(self._tenants) + 1)
+        if KB_WARMUP:
+            tenant.kb.warm_up()
+        return tenant
+
+    def _host_map(self):
+        if self._hosts is None:
+            hosts = {}
+            path = os.path.join(self.directory, "hosts.json")
+            try:
+                with open(path, encoding="utf-8") as f:
+                    hosts = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                print(f"Tenant hosts not loaded from {path}: {e}")
+            self._hosts = {host.lower(): tenant_id for host, tenant_id in hosts.items()}
+        return self._hosts
+
+    def resolve(self, environ):
+        """
+        Tenant id of a WSGI request: its /t/<tenant> prefix, else its host
+        (hosts.json, then the first label if it names a tenant), else the default.
+        """
+        tenant_id = environ.get("hungergod.tenant")
+        if tenant_id:
+            return tenant_id
+        if not self.directory:
+            return DEFAULT_TENANT
+        host = (environ.get("HTTP_HOST") or environ.get("SERVER_NAME") or "").split(":")[0].lower()
+        tenant_id = self._host_map().get(host)
+        if tenant_id:
+            return tenant_id
+        label = host.split(".")[0]
+        return label if label in self._tenants or self.exists(label) else DEFAULT_TENANT
+
+tenants = TenantRegistry()
+
+def split_tenant_path(environ):
+    """
+    Move a /t/<tenant> path prefix into SCRIPT_NAME, so the routes (and the
+    URLs built with url_for) work unchanged under it, noting the tenant for resolve().
+    Done once per request.
+    """
+    path = environ.get("PATH_INFO", "")
+    if path.startswith(TENANT_PREFIX) and "hungergod.tenant" not in environ:
+        tenant_id, _, rest = path[len(TENANT_PREFIX):].partition("/")
+        environ["hungergod.tenant"] = tenant_id
+        environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + TENANT_PREFIX + tenant_id
+        environ["PATH_INFO"] = "/" + rest
+    return environ
+
+def current_tenant():
+    """Tenant of the current request (the default one outside requests or for unknown tenants)."""
+    if not has_request_context():
+        return tenants.default
+    tenant = g.get("tenant")
+    if tenant is None:
+        tenant = g.tenant = tenants.get(tenants.resolve(request.environ)) or tenants.default
+    return tenant
+
+def get_catalog():
+    """Current menu catalog of the request's tenant; take one snapshot per operation."""
+    return current_tenant().catalog()
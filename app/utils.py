@@ -1,47 +1,49 @@
 import datetime
 import os
-import json
 
-def save_order(user_id, main_item, item_count):
+from flask import has_request_context, session, g
+
+from .log_writer import chat_log, event_log
+
+def session_id():
+    """Server-side session id of the current request, or None outside one."""
+    return getattr(session, "sid", None) if has_request_context() else None
+
+def trace(stage=None, **fields):
     """
-    Simple function to save order data for demo purposes
+    Note a pipeline stage (rules, llm_intent, rag, ...) and/or details for the
+    message being handled; they are written with its chat log line.
     """
-    try:
-        # Create logs directory if it doesn't exist
-        if not os.path.exists("logs"):
-            os.makedirs("logs")
-            
-        # Prepare order data
-        order_data = {
-            "user_id": user_id,
-            "main_item": main_item,
-            "total_items": item_count,
-            "timestamp": datetime.datetime.now().isoformat()
-        }
-        
-        # Save to a log file
-        with open("logs/orders.log", "a") as f:
-            f.write(json.dumps(order_data) + "\n")
-            
-        return True
-    except Exception as e:
-        print(f"Error saving order: {e}")
-        return False
-   
+    if not has_request_context():
+        return
+    t = g.get("chat_trace")
+    if t is None:
+        t = g.chat_trace = {"stages": []}
+    if stage:
+        t["stages"].append(stage)
+    t.update(fields)
+
+def _tags():
+    """Session id and worker pid attached to every log line."""
+    return {"session_id": session_id(), "pid": os.getpid()}
+
 def log_chat(user_message, bot_reply):
     """
-    Append a chat entry (user and bot messages with timestamp) to logs/chat.log.
+    Queue a chat entry (user and bot messages with timestamp) for LOG_DIR/chat.log.
     """
     try:
-        # Ensure logs directory exists
-        if not os.path.exists("logs"):
-            os.makedirs("logs")
         entry = {
             "timestamp": datetime.datetime.now().isoformat(),
             "user": user_message,
             "bot": bot_reply,
+            **_tags(),
         }
-        with open("logs/chat.log", "a") as f:
-            f.write(json.dumps(entry) + "\n")
+        if has_request_context():
+            entry.update(g.get("chat_trace", {}))
+        chat_log.write(entry)
     except Exception as e:
-        print(f"Error logging chat: {e}")
\ No newline at end of file
+        print(f"Error logging chat: {e}")
+
+def log_event(event, **fields):
+    """Queue an operational event (name and details) for LOG_DIR/events.log."""
+    event_log.write({"timestamp": datetime.datetime.now().isoformat(), "event": event, "pid": os.getpid(), **fields})
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Throughput of the sync (WSGI) and async (ASGI) /chat paths against the fake
+OpenAI server with injected latency.
+
+The sync run serves the Flask app with a single-threaded server, like one
+sync gunicorn worker; the async run serves app.asgi with uvicorn in one
+process. Every conversation sends messages that miss the rule KB, so each
+one waits on several LLM round-trips.
+
+Run from the project root (needs the app requirements plus uvicorn):
+    python -m benchmarks.bench_async [--conversations 50] [--latency 0.2]
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+MESSAGES = ["!welcome", "raccontami la storia della pizzeria", "avete opzioni senza lattosio?"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def conversation(base_url):
+    """Send one conversation with its own cookie jar; return per-message latencies."""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    latencies = []
+    for message in MESSAGES:
+        req = urllib.request.Request(
+            f"{base_url}/chat", data=json.dumps({"message": message}).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        start = time.perf_counter()
+        with opener.open(req, timeout=600) as resp:
+            json.loads(resp.read())
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def drive(base_url, conversations):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=conversations) as pool:
+        results = list(pool.map(lambda _: conversation(base_url), range(conversations)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(l for r in results for l in r)
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def serve_sync(flask_app, port):
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", port, flask_app, threaded=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+def serve_async(asgi_app, port):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+    def stop():
+        server.should_exit = True
+    return stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async /chat throughput")
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency (s)")
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=args.latency).start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    # Flask-Session files and chat logs go to a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix="hungergod-bench-"))
+
+    from app.app import app as flask_app
+    from app.asgi import app as asgi_app
+
+    for label, serve, target in (("sync (1 worker)", serve_sync, flask_app),
+                                 ("async (1 process)", serve_async, asgi_app)):
+        port = free_port()
+        stop = serve(target, port)
+        wait_for(port)
+        r = drive(f"http://127.0.0.1:{port}", args.conversations)
+        stop()
+        print(f"{label:<18} {r['requests']:>5} req in {r['seconds']:7.2f}s "
+              f"{r['rps']:8.1f} req/s  p50={r['p50'] * 1e3:8.1f}ms  p95={r['p95'] * 1e3:8.1f}ms")
+    print(f"fake LLM calls: {fake.requests}")
+
+
+if __name__ == "__main__":
+    main()
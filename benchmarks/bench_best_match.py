@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark MenuMatcher against the original linear difflib scan in best_match.
+
+Run from the project root:
+    python -m benchmarks.bench_best_match [--per-category 200]
+"""
+import argparse
+import difflib
+import json
+import os
+import random
+import string
+import sys
+import time
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.menu_index import MenuMatcher
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+SYLLABLES = ["ma", "ri", "ta", "na", "po", "li", "ca", "pri", "cio", "sa", "fun", "ghi",
+             "ton", "no", "bu", "fa", "di", "vo", "la", "ra", "gu", "pe", "sto", "mi"]
+
+
+def legacy_best_match(name, menu):
+    """The original best_match: rebuild the alias list and scan it on every call."""
+    if not name or len(name) < 2:
+        return None
+    all_items = []
+    for cat_items in menu.values():
+        for item in cat_items:
+            all_items.append((item["name"].lower(), item))
+            for alias in item.get("aliases", []):
+                all_items.append((alias.lower(), item))
+    names = [n for n, _ in all_items]
+    matches = difflib.get_close_matches(name.lower(), names, n=1, cutoff=0.55)
+    if matches:
+        for n, item in all_items:
+            if n == matches[0]:
+                return item
+    return None
+
+
+def synthetic_menu(per_category, rng):
+    menu = {}
+    for cat in ("Pizze", "Bevande", "Dolci", "Antipasti", "Primi"):
+        items = []
+        for i in range(per_category):
+            name = " ".join(
+                "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+                for _ in range(rng.randint(1, 3))
+            )
+            items.append({"name": name, "price": 5, "aliases": [name.replace(" ", "")]})
+        menu[cat] = items
+    return menu
+
+
+def typo(word, rng):
+    chars = list(word)
+    for _ in range(rng.randint(1, 2)):
+        op = rng.random()
+        pos = rng.randrange(len(chars)) if chars else 0
+        if op < 0.33 and chars:
+            del chars[pos]
+        elif op < 0.66:
+            chars.insert(pos, rng.choice(string.ascii_lowercase))
+        elif chars:
+            chars[pos] = rng.choice(string.ascii_lowercase)
+    return "".join(chars)
+
+
+def sample_queries(menu, rng, n=200):
+    terms = [t for items in menu.values() for i in items for t in [i["name"]] + i.get("aliases", [])]
+    queries = []
+    for _ in range(n):
+        kind = rng.random()
+        term = rng.choice(terms)
+        if kind < 0.3:
+            queries.append(term)
+        elif kind < 0.8:
+            queries.append(typo(term, rng))
+        else:
+            queries.append("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 12))))
+    return queries
+
+
+def bench(fn, queries, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for q in queries:
+            fn(q)
+        best = min(best, time.perf_counter() - start)
+    return best / len(queries) * 1e6
+
+
+def run(label, menu, rng, repeat):
+    queries = sample_queries(menu, rng)
+    matcher = MenuMatcher(menu, cutoff=0.55, cache_size=0)
+    for q in queries:
+        if legacy_best_match(q, menu) is not (matcher.match(q) if len(q) >= 2 else None):
+            raise AssertionError(f"mismatch on {q!r}")
+    n_terms = sum(1 + len(i.get("aliases", [])) for items in menu.values() for i in items)
+    legacy_us = bench(lambda q: legacy_best_match(q, menu), queries, repeat)
+    uncached_us = bench(matcher.match, queries, repeat)
+    cached = MenuMatcher(menu, cutoff=0.55)
+    cached_us = bench(cached.match, queries, repeat)
+    print(f"{label:<22} terms={n_terms:>5} legacy={legacy_us:9.1f}us "
+          f"indexed={uncached_us:8.1f}us cached={cached_us:6.2f}us "
+          f"speedup={legacy_us / uncached_us:5.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--per-category', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    with open(os.path.join(APP_DIR, 'pizza_menu.json'), encoding='utf-8') as f:
+        run("pizza_menu.json", json.load(f), rng, args.repeat)
+    run(f"synthetic ({args.per_category}/cat)", synthetic_menu(args.per_category, rng), rng, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
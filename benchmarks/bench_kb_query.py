@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark KnowledgeBase.search (NumPy matrix-vector product + argpartition)
+against the original pure-Python cosine scan and full sort.
+
+Run from the project root:
+    python -m benchmarks.bench_kb_query [--dim 1536] [--sizes 1000 10000 100000]
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+os.environ.setdefault("EMBEDDING_STORE_PATH", os.path.join(tempfile.mkdtemp(), "embeddings.sqlite"))
+
+from app.kb import KnowledgeBase, EmbeddingStore
+
+
+def legacy_query(docs, q_emb, top_k=3):
+    """The original KnowledgeBase.query scoring: norms recomputed per document."""
+    def score(doc):
+        a = doc['embedding']
+        dot = sum(x * y for x, y in zip(a, q_emb))
+        norm_a = math.sqrt(sum(x * x for x in a))
+        norm_q = math.sqrt(sum(x * x for x in q_emb))
+        return dot / (norm_a * norm_q) if norm_a and norm_q else 0
+    return sorted(docs, key=score, reverse=True)[:top_k]
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=10000, help="skip the Python scan above this size")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    rng = np.random.default_rng(3)
+    store = EmbeddingStore()
+    for n in args.sizes:
+        vectors = rng.standard_normal((n, args.dim), dtype=np.float32)
+        docs = [{'id': f'doc{i}', 'text': ''} for i in range(n)]
+        kb = KnowledgeBase.from_embeddings(docs, vectors)
+        hashes = [d['id'] for d in docs]
+        kb.matrix = store.save_matrix("bench", hashes, kb.matrix)
+        q = rng.standard_normal(args.dim, dtype=np.float32)
+        numpy_ms = timed(lambda: kb.search(q, 3), args.repeat)
+        line = f"n={n:>7} dim={args.dim} numpy(mmap)={numpy_ms:9.3f}ms"
+        if n <= args.legacy_max:
+            py_docs = [{'id': d['id'], 'embedding': v.tolist()} for d, v in zip(docs, vectors)]
+            q_list = q.tolist()
+            expected = [d['id'] for d in legacy_query(py_docs, q_list)]
+            got = [d['id'] for d in kb.search(q, 3)]
+            if expected != got:
+                raise AssertionError(f"top-3 mismatch: {expected} != {got}")
+            legacy_ms = timed(lambda: legacy_query(py_docs, q_list), 1)
+            line += f" python={legacy_ms:10.1f}ms speedup={legacy_ms / numpy_ms:8.0f}x"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
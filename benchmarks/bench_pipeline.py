@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the respond() pipeline and its hot functions.
+
+Replays the recorded conversations in benchmarks/conversations.json through
+app.respond inside a Flask request context, with every OpenAI call answered
+by an in-process deterministic stub (optionally sleeping --llm-latency
+seconds). respond() timings are grouped by the path that produced the reply
+(dialog, slots, rules, intent_cache, llm_intent, function_call, rag); the hot
+functions (rule_kb.classify, best_match, cart_summary, confirm_order,
+format_menu, KnowledgeBase.query, IntentModel.predict, rule_kb.parse_order)
+are timed on their own.
+
+--save writes the results as a JSON baseline; --compare fails (exit 1) when
+a p50 latency got slower than the baseline by more than --tolerance.
+
+Run from the project root:
+    python -m benchmarks.bench_pipeline [--rounds 20] [--save baseline.json]
+    python -m benchmarks.bench_pipeline --compare baseline.json [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import stub_openai
+from benchmarks.fake_openai import fake_embedding
+
+# Baselines are read and written relative to where the benchmark was started
+CWD = os.getcwd()
+CONVERSATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations.json")
+MENU_QUERIES = ["margherita", "margarita", "diavola", "capriciosa", "quatro stagioni", "coca",
+                "birra", "tiramisu", "cannolo", "bufala", "pizza al tonno", "acqua"]
+
+
+def isolate():
+    """
+    Keep logs, orders, sessions and caches out of the working tree; call
+    before anything imports the app.
+    """
+    scratch = tempfile.mkdtemp(prefix="hungergod-bench-")
+    os.environ.update({
+        "OPENAI_API_KEY": "stub",
+        "KB_WARMUP": "0",
+        "LOG_DIR": os.path.join(scratch, "logs"),
+        "ORDER_STORE_PATH": os.path.join(scratch, "orders.sqlite"),
+        "EMBEDDING_STORE_PATH": os.path.join(scratch, "embeddings.sqlite"),
+        "METRICS_DIR": "",
+        "INTENT_CACHE_PATH": "",
+        "INTENT_MODEL_PATH": "",
+    })
+    os.chdir(scratch)
+
+
+def summarise(samples):
+    """ops/sec and latency percentiles (microseconds) of a list of durations."""
+    samples = sorted(samples)
+    n = len(samples)
+
+    def pct(p):
+        return samples[min(int(n * p), n - 1)] * 1e6
+
+    return {
+        "n": n,
+        "ops": n / sum(samples) if sum(samples) else float("inf"),
+        "p50_us": pct(0.50),
+        "p95_us": pct(0.95),
+        "p99_us": pct(0.99),
+    }
+
+
+def time_calls(fn, inputs, rounds, batch=10):
+    """Per-call durations, each averaged over batch calls so sub-microsecond functions are measurable."""
+    samples = []
+    for _ in range(rounds):
+        for arg in inputs:
+            start = time.perf_counter()
+            for _ in range(batch):
+                fn(arg)
+            samples.append((time.perf_counter() - start) / batch)
+    return samples
+
+
+def bench_respond(conversations, rounds):
+    from flask import g, session
+    from app.app import app, respond
+    from app.history import remember
+    from app.state_handler import get_state
+
+    samples = defaultdict(list)
+    for r in range(rounds):
+        # Same upsell suggestions on every run
+        random.seed(r)
+        for conversation in conversations:
+            state = None
+            for text in conversation["messages"]:
+                with app.test_request_context("/chat", method="POST", json={"message": text}):
+                    if state is not None:
+                        session["user_state"] = state
+                    state = get_state()
+                    remember(state, "user", text)
+                    start = time.perf_counter()
+                    reply = respond(text)
+                    elapsed = time.perf_counter() - start
+                    state = get_state()
+                    remember(state, "assistant", reply)
+                    stages = (g.get("chat_trace") or {}).get("stages") or ["none"]
+                samples["respond"].append(elapsed)
+                samples[f"respond[{stages[-1]}]"].append(elapsed)
+    return samples
+
+
+def bench_hot_functions(conversations, rounds):
+    from app.rule_kb import classify, parse_order
+    from app.menu_helpers import best_match, format_menu
+    from app.cart_logic import Cart, cart_summary, confirm_order
+    from app.tenants import get_catalog
+    from app.kb import KnowledgeBase
+    from app.intent_model import kb_examples, train
+
+    messages = [m for c in conversations for m in c["messages"]]
+    catalog = get_catalog()
+    cart = Cart()
+    for name in ("Margherita", "Diavola", "Coca-Cola", "Tiramisù", "Birra artigianale"):
+        cart.add(catalog.items[name], 2)
+    docs = [{"id": f"doc{i}", "text": f"documento {i}"} for i in range(500)]
+    index = KnowledgeBase.from_embeddings(docs, [fake_embedding(d["text"]) for d in docs])
+    model = train(kb_examples(), epochs=50)
+
+    def confirm(_):
+        state = {"cart": Cart(cart.counts)}
+        confirm_order(state, [("Margherita", 1)])
+
+    random.seed(0)
+    return {
+        "rule_kb.classify": time_calls(classify, messages, rounds),
+        "best_match": time_calls(best_match, MENU_QUERIES, rounds * 10),
+        "cart_summary": time_calls(lambda _: cart_summary(cart), range(100), rounds, batch=100),
+        "confirm_order": time_calls(confirm, range(100), rounds),
+        "format_menu": time_calls(lambda _: format_menu(), range(100), rounds, batch=100),
+        "KnowledgeBase.query": time_calls(index.query, messages, rounds),
+        "IntentModel.predict": time_calls(model.predict, messages, rounds),
+        "rule_kb.parse_order": time_calls(parse_order, messages, rounds),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_us):
+    """
+    Print p50 changes against the baseline; return the names that got slower
+    by more than tolerance and by at least min_delta_us.
+    """
+    regressions = []
+    print(f"\n{'vs baseline':<32}{'p50 before':>12}{'p50 now':>12}{'change':>10}")
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = now["p50_us"] / before["p50_us"] - 1 if before["p50_us"] else 0.0
+        flag = ""
+        if change > tolerance and now["p50_us"] - before["p50_us"] >= min_delta_us:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32}{before['p50_us']:>10.1f}us{now['p50_us']:>10.1f}us{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline respond() pipeline benchmark")
+    parser.add_argument("--rounds", type=int, default=20, help="replays of every conversation")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub LLM latency (s)")
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    parser.add_argument("--min-delta-us", type=float, default=1.0, help="ignore p50 slowdowns smaller than this")
+    args = parser.parse_args()
+
+    isolate()
+    stub = stub_openai.install(args.llm_latency)
+    with open(CONVERSATIONS, encoding="utf-8") as f:
+        conversations = json.load(f)
+
+    samples = bench_respond(conversations, args.rounds)
+    samples.update(bench_hot_functions(conversations, args.rounds))
+    results = {name: summarise(s) for name, s in sorted(samples.items())}
+
+    print(f"{'benchmark':<32}{'n':>7}{'ops/s':>12}{'p50':>11}{'p95':>11}{'p99':>11}")
+    for name, r in results.items():
+        print(f"{name:<32}{r['n']:>7}{r['ops']:>12.0f}{r['p50_us']:>9.1f}us{r['p95_us']:>9.1f}us{r['p99_us']:>9.1f}us")
+    print(f"stub LLM calls: {dict(stub.calls)}")
+
+    if args.save:
+        with open(os.path.join(CWD, args.save), "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "rounds": args.rounds,
+                       "llm_latency": args.llm_latency, "results": results}, f, indent=2)
+        print(f"baseline saved to {args.save}")
+    if args.compare:
+        with open(os.path.join(CWD, args.compare), encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_us)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
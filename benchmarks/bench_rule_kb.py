@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark the compiled rule KB against the original per-utterance scan.
+
+Run from the project root:
+    python -m benchmarks.bench_rule_kb [--utterances 5000] [--items 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.rule_index import RuleIndex
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+WORDS = [
+    "pizza", "vorrei", "ciao", "menu", "quando", "aperti", "grazie", "per", "favore",
+    "ordine", "pagare", "bevanda", "dolce", "forno", "impasto", "consegna", "sera",
+    "tavolo", "domani", "piccante", "senza", "glutine", "extra", "mozzarella",
+]
+INTENTS = ["greet", "menu", "order", "add_to_cart", "remove", "checkout", "info", "track", "other"]
+
+
+def legacy_classify(text, utterances, actions, menu):
+    """The original rule_kb.classify: one substring test per utterance, keyword and alias."""
+    text_l = text.lower()
+    results = []
+    for u in utterances:
+        utt = u['utterance'].lower()
+        if utt == text_l or utt in text_l:
+            intent = u['intent']
+            items = []
+            if intent in ('order', 'add_to_cart', 'remove'):
+                for cat_items in menu.values():
+                    for item in cat_items:
+                        terms = [item['name']] + item.get('aliases', [])
+                        for term in terms:
+                            if term.lower() in text_l:
+                                items.append({"name": item['name'], "quantity": 1})
+                                break
+                if intent == 'order' and items:
+                    intent = 'add_to_cart'
+            results.append({"intent": intent, "items": items})
+    if results:
+        return results
+    for intent, kws in actions.items():
+        for kw in kws:
+            if kw in text_l:
+                items = []
+                if intent in ('order', 'add_to_cart', 'remove'):
+                    for cat_items in menu.values():
+                        for item in cat_items:
+                            terms = [item['name']] + item.get('aliases', [])
+                            for term in terms:
+                                if term.lower() in text_l:
+                                    items.append({"name": item['name'], "quantity": 1})
+                                    break
+                    if intent == 'order' and items:
+                        intent = 'add_to_cart'
+                return [{"intent": intent, "items": items}]
+    return []
+
+
+def load_real_kb():
+    with open(os.path.join(APP_DIR, 'italian_kb.json'), encoding='utf-8') as f:
+        raw = json.load(f)
+    with open(os.path.join(APP_DIR, 'pizza_menu.json'), encoding='utf-8') as f:
+        menu = json.load(f)
+    utterances = [e for e in raw if isinstance(e, dict) and 'utterance' in e]
+    config = next(e for e in raw if isinstance(e, dict) and 'categories' in e)
+    return utterances, config.get('actions', {}), menu
+
+
+def synthetic_kb(n_utterances, n_items, rng):
+    """Build a large KB: random utterances, many keywords and a multi-category menu."""
+    utterances = [
+        {"intent": rng.choice(INTENTS),
+         "utterance": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 6))) + f" {i}"}
+        for i in range(n_utterances)
+    ]
+    actions = {
+        intent: [f"{rng.choice(WORDS)} {intent} {k}" for k in range(n_utterances // 50 or 1)]
+        for intent in INTENTS
+    }
+    menu = {}
+    for c in range(10):
+        menu[f"Categoria {c}"] = [
+            {"name": f"Piatto {c}-{i}", "price": 5 + i % 10,
+             "aliases": [f"piatto{c}{i}", f"p {c} {i}"]}
+            for i in range(n_items // 10)
+        ]
+    return utterances, actions, menu
+
+
+def sample_messages(utterances, menu, rng, n=300):
+    names = [item['name'] for items in menu.values() for item in items]
+    msgs = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.4:
+            msgs.append(rng.choice(utterances)['utterance'] + " e " + rng.choice(names))
+        elif kind < 0.7:
+            msgs.append("vorrei " + rng.choice(names) + " e " + rng.choice(names))
+        else:
+            msgs.append(" ".join(rng.choice(WORDS) for _ in range(8)))
+    return msgs
+
+
+def bench(fn, messages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for m in messages:
+            fn(m)
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages) * 1e6
+
+
+def run(label, utterances, actions, menu, rng, repeat):
+    start = time.perf_counter()
+    index = RuleIndex(utterances, actions, menu)
+    build_ms = (time.perf_counter() - start) * 1e3
+    messages = sample_messages(utterances, menu, rng)
+    for m in messages:
+        expected = legacy_classify(m, utterances, actions, menu)
+        got = index.classify(m)
+        if expected != got:
+            raise AssertionError(f"mismatch on {m!r}: {expected} != {got}")
+    legacy_us = bench(lambda m: legacy_classify(m, utterances, actions, menu), messages, repeat)
+    compiled_us = bench(index.classify, messages, repeat)
+    print(f"{label:<28} utterances={len(utterances):>6} build={build_ms:8.1f}ms "
+          f"legacy={legacy_us:10.1f}us/msg compiled={compiled_us:8.1f}us/msg "
+          f"speedup={legacy_us / compiled_us:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--utterances', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    run("italian_kb.json", *load_real_kb(), rng, args.repeat)
+    for n in (args.utterances // 5, args.utterances):
+        run(f"synthetic ({n})", *synthetic_kb(n, args.items, rng), rng, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stand-in for benchmarks and load tests.
+
+Serves /v1/chat/completions (plain, streamed and function-call replies) and
+/v1/embeddings with injected latency and error rate, so the app can be
+driven without real API calls. Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+
+    python -m benchmarks.fake_openai --port 8100 --latency 0.5 [--error-rate 0.02]
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 64
+INTENT_MARKER = "lista JSON"
+DEFAULT_REPLY = "Certo! Sono Mario, come posso aiutarti con il tuo ordine?"
+# Keywords in the user's message -> function the fake model calls, with arguments
+FUNCTION_KEYWORDS = [
+    (("menu", "pizze avete", "cosa avete"), "show_menu", {}),
+    (("dove", "orari", "telefono", "indirizzo"), "get_info", {}),
+    (("ordine", "pronto", "manca"), "track_order", {}),
+    (("storia", "glutine", "lattosio", "allergeni"), "rag_fallback", None),
+]
+
+
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    """Deterministic pseudo-embedding derived from the text hash."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[i % len(digest)] - 128) / 128.0 for i in range(dim)]
+
+
+def chat_reply(body):
+    """Pick a canned reply: an empty intent list for the intent parser, text otherwise."""
+    messages = body.get("messages") or []
+    first = (messages[0].get("content") or "") if messages else ""
+    return "[]" if INTENT_MARKER in first else DEFAULT_REPLY
+
+
+def stream_chunks(content):
+    """Split a reply into word-sized pieces, as a streamed completion sends them."""
+    return re.findall(r"\S+\s*|\s+", content) or [""]
+
+
+def function_call(body):
+    """
+    The function a request offering functions should call, as (name, arguments),
+    picked from keywords in the last user message; None for a plain reply.
+    """
+    if not body.get("functions") or body.get("function_call") == "none":
+        return None
+    messages = body.get("messages") or []
+    if messages and messages[-1].get("role") != "user":
+        # Function result already supplied: answer in text
+        return None
+    text = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "").lower()
+    offered = {f.get("name") for f in body["functions"]}
+    for keywords, name, args in FUNCTION_KEYWORDS:
+        if name in offered and any(k in text for k in keywords):
+            return name, args if args is not None else {"query": text}
+    return None
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, body, content):
+        """Send a completion as server-sent chunk events, then [DONE]."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model", "fake")}
+        pieces = stream_chunks(content)
+        for i, piece in enumerate(pieces):
+            if i and self.server.token_latency:
+                time.sleep(self.server.token_latency)
+            delta = {"content": piece}
+            if not i:
+                delta["role"] = "assistant"
+            last = i == len(pieces) - 1
+            event = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": "stop" if last else None}])
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage = {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)}
+            self.wfile.write(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count(self.path)
+        time.sleep(self.server.latency)
+        if self.server.should_fail():
+            self.server.count("errors")
+            self._send_json({"error": {"message": "injected failure", "type": "server_error"}}, status=500)
+            return
+        if self.path.endswith("/chat/completions"):
+            call = function_call(body)
+            if body.get("stream") and not call:
+                self._send_stream(body, chat_reply(body))
+                return
+            if call:
+                message = {"role": "assistant", "content": None,
+                           "function_call": {"name": call[0], "arguments": json.dumps(call[1])}}
+                finish = "function_call"
+            else:
+                message = {"role": "assistant", "content": chat_reply(body)}
+                finish = "stop"
+            self._send_json({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+        elif self.path.endswith("/embeddings"):
+            inputs = body.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            self._send_json({
+                "object": "list",
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(t)}
+                    for i, t in enumerate(inputs)
+                ],
+                "model": body.get("model", "fake"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+        else:
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.5, error_rate=0.0, seed=None, token_latency=0.0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serve in a daemon thread and return self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    args = parser.parse_args()
+    server = FakeOpenAIServer((args.host, args.port), latency=args.latency, error_rate=args.error_rate,
+                              token_latency=args.token_latency)
+    print(f"Fake OpenAI listening on {server.base_url} (latency {args.latency}s, error rate {args.error_rate:.0%})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test: many concurrent cookie-bearing sessions walking through
+full conversations, against gunicorn started here with the fake OpenAI server.
+
+Each simulated customer sends !welcome, looks at the menu, adds a pizza,
+answers the upsell, asks a question that goes to the LLM, checks out (name,
+delivery, payment, confirmation) and finally the payment is confirmed with a
+signed checkout.session.completed event on /stripe-webhook. Every step is
+timed separately, and every worker count x worker class combination is
+started, warmed up and measured in turn.
+
+Reported per run: throughput, p50/p95/p99 latency and error rate per step,
+plus Flask-Session contention: time spent saving session files (from the
+app's /metrics, summed over workers) and the number of session files.
+
+Run from the project root (needs gunicorn, and uvicorn for the uvicorn class):
+    python -m benchmarks.load_test [--users 50] [--conversations 200]
+        [--workers 1 4] [--worker-class sync gthread uvicorn]
+        [--latency 0.2] [--error-rate 0.01]
+or against a running deployment (its OpenAI settings are left alone):
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --webhook-secret whsec_...
+"""
+import argparse
+import hashlib
+import hmac
+import http.cookiejar
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import free_port
+from benchmarks.fake_openai import FakeOpenAIServer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEBHOOK_SECRET = "whsec_loadtest"
+APPS = {
+    "sync": ("app.app:app", ["-k", "sync"]),
+    "gthread": ("app.app:app", ["-k", "gthread"]),
+    "uvicorn": ("app.asgi:app", ["-k", "uvicorn.workers.UvicornWorker"]),
+}
+PIZZAS = ["Vorrei una Margherita", "Prendo una Diavola", "Mi porti una Vegetariana", "Fammi una Napoli"]
+QUESTIONS = ["avete opzioni senza glutine?", "raccontami la storia della pizzeria", "dove siete?"]
+
+
+def conversation_steps(rng):
+    """(step, message) pairs for one customer; None marks the webhook."""
+    return [
+        ("welcome", "!welcome"),
+        ("menu", "Posso vedere il menu?"),
+        ("add_item", rng.choice(PIZZAS)),
+        ("upsell_answer", rng.choice(["sì", "no"])),
+        ("question", rng.choice(QUESTIONS)),
+        ("checkout", "Voglio pagare"),
+        ("name", rng.choice(["Giulia", "Marco", "Sara", "Luca"])),
+        ("delivery", "ritiro"),
+        ("payment", "online"),
+        ("confirm", "sì"),
+        ("webhook", None),
+    ]
+
+
+def stripe_event(secret, order_ref):
+    """A checkout.session.completed event and its Stripe-Signature header."""
+    payload = json.dumps({
+        "id": f"evt_{order_ref}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {"id": f"cs_{order_ref}", "object": "checkout.session", "payment_status": "paid"}},
+    })
+    ts = int(time.time())
+    sig = hmac.new(secret.encode(), f"{ts}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return payload.encode(), f"t={ts},v1={sig}"
+
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, step, seconds, ok):
+        with self._lock:
+            self.latencies[step].append(seconds)
+            if not ok:
+                self.errors[step] += 1
+
+
+def customer(base_url, results, rng, secret):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    for step, message in conversation_steps(rng):
+        if message is None:
+            data, sig = stripe_event(secret, f"{id(opener):x}{rng.randrange(1 << 30):x}")
+            req = urllib.request.Request(f"{base_url}/stripe-webhook", data=data, method="POST",
+                                         headers={"Content-Type": "application/json", "Stripe-Signature": sig})
+        else:
+            req = urllib.request.Request(f"{base_url}/chat", data=json.dumps({"message": message}).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        start = time.perf_counter()
+        try:
+            with opener.open(req, timeout=120) as resp:
+                resp.read()
+                ok = resp.status < 400
+        except (urllib.error.URLError, OSError):
+            ok = False
+        results.add(step, time.perf_counter() - start, ok)
+
+
+def drive(base_url, users, conversations, secret, seed=0):
+    results = Results()
+    rngs = [random.Random(seed + i) for i in range(conversations)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(lambda rng: customer(base_url, results, rng, secret), rngs))
+    return results, time.perf_counter() - start
+
+
+def percentile(samples, p):
+    return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+
+def scrape_session_saves(base_url):
+    """(count, total seconds, p95 upper bound) of session_save from /metrics, or None."""
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as resp:
+            text = resp.read().decode()
+    except (urllib.error.URLError, OSError):
+        return None
+    buckets, count, total = defaultdict(float), 0.0, 0.0
+    for line in text.splitlines():
+        if 'stage="session_save"' not in line:
+            continue
+        name, value = line.rsplit(" ", 1)
+        if name.startswith("hungergod_stage_seconds_bucket"):
+            buckets[re.search(r'le="([^"]+)"', name).group(1)] += float(value)
+        elif name.startswith("hungergod_stage_seconds_count"):
+            count += float(value)
+        elif name.startswith("hungergod_stage_seconds_sum"):
+            total += float(value)
+    if not count:
+        return None
+    p95 = next((le for le, n in sorted(buckets.items(), key=lambda kv: float(kv[0]))
+                if n >= 0.95 * count), "+Inf")
+    return int(count), total, p95
+
+
+def report(label, results, elapsed, session_saves=None, session_files=None):
+    total = sum(len(v) for v in results.latencies.values())
+    errors = sum(results.errors.values())
+    print(f"\n== {label}: {total} requests in {elapsed:.1f}s = {total / elapsed:.1f} req/s, "
+          f"errors {errors / total:.2%}" if total else f"\n== {label}: no requests")
+    print(f"{'step':<15}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>9}")
+    for step in dict.fromkeys(s for s, _ in conversation_steps(random.Random(0))):
+        samples = sorted(results.latencies.get(step, []))
+        if not samples:
+            continue
+        print(f"{step:<15}{len(samples):>6}"
+              f"{percentile(samples, 0.50) * 1e3:>8.1f}ms{percentile(samples, 0.95) * 1e3:>8.1f}ms"
+              f"{percentile(samples, 0.99) * 1e3:>8.1f}ms{results.errors[step] / len(samples):>9.1%}")
+    if session_saves:
+        count, seconds, p95 = session_saves
+        print(f"session saves: {count}, avg {seconds / count * 1e3:.2f}ms, p95 <= {p95}s"
+              + (f", {session_files} session files" if session_files is not None else ""))
+
+
+def wait_ready(base_url, proc, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/ready", timeout=2):
+                return
+        except urllib.error.HTTPError:
+            pass  # 503 while the KB warms up
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{base_url} not ready after {timeout}s")
+
+
+def run_local(worker_class, workers, args, fake):
+    scratch = tempfile.mkdtemp(prefix="hungergod-load-")
+    port = free_port()
+    app_path, extra = APPS[worker_class]
+    if worker_class == "gthread":
+        extra = extra + ["--threads", str(args.threads)]
+    env = dict(os.environ,
+               PYTHONPATH=PROJECT_ROOT,
+               OPENAI_BASE_URL=fake.base_url,
+               OPENAI_API_KEY="fake",
+               STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+               LOG_DIR=os.path.join(scratch, "logs"),
+               ORDER_STORE_PATH=os.path.join(scratch, "orders.sqlite"),
+               EMBEDDING_STORE_PATH=os.path.join(scratch, "embeddings.sqlite"),
+               METRICS_DIR=os.path.join(scratch, "metrics"),
+               METRICS_FLUSH_INTERVAL="0.5")
+    cmd = [sys.executable, "-m", "gunicorn", app_path, "-w", str(workers), "-b", f"127.0.0.1:{port}",
+           "--timeout", "120", "--log-level", "warning"] + extra
+    proc = subprocess.Popen(cmd, cwd=scratch, env=env, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url, proc)
+        results, elapsed = drive(base_url, args.users, args.conversations, WEBHOOK_SECRET, args.seed)
+        # Let every worker write its latest metrics snapshot
+        time.sleep(1)
+        session_dir = os.path.join(scratch, "flask_session")
+        files = len(os.listdir(session_dir)) if os.path.isdir(session_dir) else 0
+        report(f"{worker_class} x{workers}", results, elapsed, scrape_session_saves(base_url), files)
+    finally:
+        proc.terminate()
+        proc.wait(30)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end /chat load test")
+    parser.add_argument("--url", help="test this running deployment instead of starting gunicorn")
+    parser.add_argument("--webhook-secret", default=WEBHOOK_SECRET, help="STRIPE_WEBHOOK_SECRET of --url")
+    parser.add_argument("--users", type=int, default=50, help="concurrent sessions")
+    parser.add_argument("--conversations", type=int, default=200, help="conversations per run")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--worker-class", nargs="+", default=["sync", "gthread", "uvicorn"], choices=sorted(APPS))
+    parser.add_argument("--threads", type=int, default=8, help="threads per gthread worker")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake LLM HTTP 500 rate")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.url:
+        results, elapsed = drive(args.url.rstrip("/"), args.users, args.conversations, args.webhook_secret, args.seed)
+        report(args.url, results, elapsed, scrape_session_saves(args.url.rstrip("/")))
+        return
+
+    fake = FakeOpenAIServer(latency=args.latency, error_rate=args.error_rate, seed=args.seed).start()
+    for worker_class in args.worker_class:
+        for workers in args.workers:
+            run_local(worker_class, workers, args, fake)
+    print(f"\nfake LLM calls: {fake.requests}")
+
+
+if __name__ == "__main__":
+    main()
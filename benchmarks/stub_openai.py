@@ -0,0 +1,112 @@
+"""
+In-process stand-in for the openai module, for offline benchmarks.
+
+Gives the same deterministic replies, function calls and embeddings as
+fake_openai, with an optional sleep per call, without any HTTP. install() swaps it into app.llm.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from benchmarks.fake_openai import chat_reply, fake_embedding, function_call, stream_chunks
+
+
+def _tokens(text):
+    return max(len(text or "") // 4, 1)
+
+
+class StubOpenAI:
+    """Mimics the openai module's OpenAI and AsyncOpenAI clients."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.api_key = "stub"
+        self.calls = Counter()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    def _chat_response(self, kwargs):
+        self.calls["chat"] += 1
+        call = function_call(kwargs)
+        if call:
+            content, call = None, SimpleNamespace(name=call[0], arguments=json.dumps(call[1]))
+        else:
+            content = chat_reply(kwargs)
+        prompt = sum(_tokens(m.get("content")) for m in kwargs.get("messages") or [])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content, function_call=call))],
+            usage=SimpleNamespace(prompt_tokens=prompt, completion_tokens=_tokens(content)),
+        )
+
+    def _stream_chunks(self, kwargs):
+        self.calls["chat"] += 1
+        pieces = stream_chunks(chat_reply(kwargs))
+        chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+            for piece in pieces
+        ]
+        prompt = sum(_tokens(m.get("content")) for m in kwargs.get("messages") or [])
+        chunks.append(SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=prompt, completion_tokens=len(pieces))))
+        return chunks
+
+    def _embed_response(self, kwargs):
+        self.calls["embedding"] += 1
+        inputs = kwargs.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=fake_embedding(t)) for t in inputs],
+            usage=SimpleNamespace(prompt_tokens=sum(_tokens(t) for t in inputs), completion_tokens=0),
+        )
+
+    def _chat(self, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        if kwargs.get("stream"):
+            return iter(self._stream_chunks(kwargs))
+        return self._chat_response(kwargs)
+
+    def _embed(self, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed_response(kwargs)
+
+    async def _achat(self, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._chat_response(kwargs)
+
+    async def _aembed(self, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._embed_response(kwargs)
+
+    def OpenAI(self, **kwargs):
+        return SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=self._chat)),
+            embeddings=SimpleNamespace(create=self._embed),
+        )
+
+    def DefaultHttpxClient(self, **kwargs):
+        return None
+
+    def DefaultAsyncHttpxClient(self, **kwargs):
+        return None
+
+    def AsyncOpenAI(self, **kwargs):
+        return SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=self._achat)),
+            embeddings=SimpleNamespace(create=self._aembed),
+        )
+
+
+def install(latency=0.0):
+    """Route every app.llm call to a new StubOpenAI and return it."""
+    import app.llm
+    stub = StubOpenAI(latency)
+    app.llm.openai = stub
+    app.llm._sync_client = (None, None)
+    app.llm._loop_resources.clear()
+    return stub
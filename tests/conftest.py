@@ -0,0 +1,31 @@
+"""
+Test settings: the app's logs, orders, sessions, metrics and caches go to a
+scratch directory instead of the working tree, and no KB warm-up or OpenAI
+call is started at import. Set before app.config is first imported.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCRATCH = tempfile.mkdtemp(prefix="hungergod-tests-")
+os.environ.update({
+    "OPENAI_API_KEY": "test",
+    "KB_WARMUP": "0",
+    "LOG_DIR": os.path.join(SCRATCH, "logs"),
+    "ORDER_STORE_PATH": os.path.join(SCRATCH, "orders.sqlite"),
+    "EMBEDDING_STORE_PATH": os.path.join(SCRATCH, "embeddings.sqlite"),
+    "METRICS_DIR": os.path.join(SCRATCH, "metrics"),
+    "INTENT_CACHE_PATH": os.path.join(SCRATCH, "intents.sqlite"),
+    "INTENT_MODEL_PATH": os.path.join(SCRATCH, "intent_model.npz"),
+})
+# Filesystem sessions are written under the working directory
+os.chdir(SCRATCH)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    from app.log_writer import close_logs
+    close_logs()
+    shutil.rmtree(SCRATCH, ignore_errors=True)
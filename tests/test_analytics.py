@@ -0,0 +1,87 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from app import analytics
+from app.order_store import OrderStore
+
+
+def record(user, stages, **fields):
+    return {"timestamp": "2026-10-01T12:00:00", "user": user, "stages": stages, **fields}
+
+
+def append(path, records, partial=""):
+    with open(path, "a", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+        f.write(partial)
+
+
+@pytest.fixture
+def logs(tmp_path):
+    directory = tmp_path / "logs"
+    directory.mkdir()
+    append(directory / "chat.log", [
+        record("ciao", ["dialog"], new_session=True),
+        record("due margherite", ["slots"], intents=["add_to_cart"]),
+        record("che vini avete", ["llm_intent", "function_call", "rag"], function="rag_fallback"),
+        record("confermo", ["dialog"], order="A1", first_order=True),
+    ])
+    return directory
+
+
+def run(paths, state=None, **kwargs):
+    return analytics.run([str(p) for p in paths], state or analytics.load_state(None),
+                         orders_path=kwargs.pop("orders_path", "/nonexistent"), **kwargs)
+
+
+def test_totals(logs):
+    stats = run([logs])["stats"]
+    assert stats["messages"] == 4
+    assert stats["llm_messages"] == 1
+    assert stats["handled_by"] == {"dialog": 2, "slots": 1, "rag": 1}
+    assert (stats["sessions"], stats["checkouts"], stats["converted"]) == (1, 1, 1)
+    assert stats["functions"] == {"rag_fallback": 1}
+
+
+def test_incremental_runs_read_only_what_was_appended(logs, tmp_path):
+    state_path = str(tmp_path / "state.json")
+    state = run([logs])
+    analytics.save_state(state_path, state)
+    # A partial line is left for the next run
+    append(logs / "chat.log", [record("menu", ["rules"])], partial='{"user": "a metà')
+    state = run([logs], analytics.load_state(state_path))
+    assert state["stats"]["messages"] == 5
+    with open(logs / "chat.log", "a", encoding="utf-8") as f:
+        f.write('", "stages": ["rules"]}\n')
+    state = run([logs], state)
+    assert state["stats"]["messages"] == 6
+
+
+def test_rotated_segments_are_read_once(logs):
+    state = run([logs])
+    # Rotate: the live file is gzipped under a new name and a new one starts
+    live = logs / "chat.log"
+    with open(live, "rb") as src, gzip.open(str(live) + ".20261001-120000-1.gz", "wb") as dst:
+        dst.write(src.read())
+    os.remove(live)
+    append(live, [record("ciao di nuovo", ["dialog"], new_session=True)])
+    state = run([logs], state)
+    assert state["stats"]["messages"] == 5
+    assert len(state["sealed"]) == 1
+    assert run([logs], state)["stats"]["messages"] == 5
+
+
+def test_jobs_give_the_same_totals(logs):
+    append(logs / "orders.log", [{"main_item": "Margherita", "total_items": 2}])
+    assert run([logs], jobs=2)["stats"] == run([logs])["stats"]
+
+
+def test_items_come_from_the_order_store(logs, tmp_path):
+    store = OrderStore(str(tmp_path / "orders.sqlite"))
+    store.create([{"name": "Diavola", "price": 7.5, "quantity": 2, "subtotal": 15.0}], 15.0, customer="Ada", session_id="s")
+    state = run([logs], orders_path=str(tmp_path / "orders.sqlite"))
+    assert state["stats"]["items"] == {"Diavola": 2}
+    assert run([logs], state, orders_path=str(tmp_path / "orders.sqlite"))["stats"]["items"] == {"Diavola": 2}
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from app import llm
+from benchmarks import bench_pipeline, stub_openai
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # install() swaps the client module; put the real one back afterwards
+    monkeypatch.setattr(llm, "openai", llm.openai)
+    monkeypatch.setattr(llm, "_sync_client", (None, None))
+    yield stub_openai.install()
+    llm._loop_resources.clear()
+
+
+@pytest.fixture(scope="module")
+def conversations():
+    with open(bench_pipeline.CONVERSATIONS, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_summarise_percentiles():
+    result = bench_pipeline.summarise([0.001 * i for i in range(1, 101)])
+    assert result["n"] == 100
+    assert result["p50_us"] == pytest.approx(51000)
+    assert result["p99_us"] == pytest.approx(100000)
+
+
+def test_compare_flags_only_real_slowdowns():
+    baseline = {"a": {"p50_us": 10.0}, "b": {"p50_us": 10.0}, "c": {"p50_us": 0.1}}
+    results = {"a": {"p50_us": 20.0}, "b": {"p50_us": 11.0}, "c": {"p50_us": 0.5}, "new": {"p50_us": 1.0}}
+    assert bench_pipeline.compare(results, baseline, tolerance=0.25, min_delta_us=1.0) == ["a"]
+
+
+def test_conversations_replay_offline(stub, conversations):
+    samples = bench_pipeline.bench_respond(conversations, rounds=1)
+    assert len(samples["respond"]) == sum(len(c["messages"]) for c in conversations)
+    paths = {name for name in samples if name.startswith("respond[")}
+    assert {"respond[dialog]", "respond[rules]", "respond[slots]", "respond[rag]"} <= paths
+    # The messages that reached the LLM were answered by the stub
+    assert stub.calls["chat"] > 0
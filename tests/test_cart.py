@@ -0,0 +1,68 @@
+import pickle
+
+import pytest
+
+from app.app import app
+from app.cart_logic import Cart, as_cart, cart_summary, confirm_order
+
+MARGHERITA = {"name": "Margherita", "price": 6.0}
+COCA = {"name": "Coca-Cola", "price": 2.5}
+
+
+@pytest.fixture(autouse=True)
+def request_context():
+    with app.test_request_context("/chat", method="POST"):
+        yield
+
+
+def test_counts_and_running_total():
+    cart = Cart()
+    cart.add(MARGHERITA, 2)
+    cart.add(COCA)
+    cart.add(MARGHERITA)
+    assert cart.counts == {"Margherita": 3, "Coca-Cola": 1}
+    assert len(cart) == 4
+    assert cart.total == pytest.approx(20.5)
+    assert cart.subtotal("Margherita") == pytest.approx(18.0)
+    cart.add(COCA, 0)
+    assert len(cart) == 4
+
+
+def test_remove_is_case_insensitive_and_bounded():
+    cart = Cart()
+    cart.add(MARGHERITA, 2)
+    cart.add(COCA)
+    assert cart.remove("margherita") == 1
+    assert cart.remove("COCA-COLA", 5) == 1
+    assert cart.remove("diavola") == 0
+    assert cart.counts == {"Margherita": 1}
+    assert cart.total == pytest.approx(6.0)
+    assert cart.remove("Margherita") == 1
+    assert not cart and cart.total == 0
+
+
+def test_legacy_list_carts_are_converted():
+    cart = as_cart([MARGHERITA, MARGHERITA, COCA])
+    assert cart_summary(cart) == ({"Margherita": 2, "Coca-Cola": 1}, pytest.approx(14.5))
+    assert as_cart(cart) is cart
+    assert as_cart(None).counts == {}
+
+
+def test_pickles_as_counts_and_reprices_from_the_menu():
+    cart = Cart()
+    cart.add({"name": "Margherita", "price": 1.0}, 2)
+    restored = pickle.loads(pickle.dumps(cart))
+    # Priced from the current menu, not the pickled price
+    assert restored.counts == {"Margherita": 2}
+    assert restored.total == pytest.approx(2 * restored.prices["Margherita"])
+    assert restored.prices["Margherita"] != 1.0
+    assert restored.to_dict()["count"] == 2
+
+
+def test_confirm_order_lists_the_cart():
+    cart = Cart()
+    cart.add(MARGHERITA, 2)
+    reply = confirm_order({"cart": cart}, [("Margherita", 2)])
+    assert "Margherita x2" in reply
+    assert "€12.00" in reply
+    assert "vuoto" in confirm_order({"cart": Cart()})
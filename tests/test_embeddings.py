@@ -0,0 +1,65 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from app import kb as kb_module
+from app.kb import EmbeddingStore, KnowledgeBase, content_hash, embed_docs
+
+
+def fake_vector(text, dim=8):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [(digest[i] - 128) / 128.0 for i in range(dim)]
+
+
+@pytest.fixture
+def embed_calls(monkeypatch):
+    calls = []
+
+    def embed(texts, stage=None):
+        calls.append(list(texts))
+        return [fake_vector(t) for t in texts]
+    monkeypatch.setattr(kb_module, "embed", embed)
+    return calls
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / "embeddings.sqlite"))
+
+
+def write_docs(directory, docs):
+    directory.mkdir(exist_ok=True)
+    for name, text in docs.items():
+        (directory / name).write_text(text, encoding="utf-8")
+
+
+def test_only_new_texts_are_embedded_in_batches(store, embed_calls):
+    docs = [{"text": f"documento {i}"} for i in range(5)] + [{"text": "documento 0"}]
+    assert embed_docs(docs, store, batch_size=2) == 5
+    assert [len(c) for c in embed_calls] == [2, 2, 1]
+    assert np.allclose(docs[5]["embedding"], fake_vector("documento 0"))
+    again = [{"text": "documento 3"}, {"text": "nuovo"}]
+    assert embed_docs(again, store, batch_size=2) == 1
+    assert embed_calls[-1] == ["nuovo"]
+
+
+def test_store_is_keyed_by_model_and_content(store):
+    store.put_many("m1", [(content_hash("a"), [1.0, 2.0])])
+    assert list(store.get_many("m1", [content_hash("a"), content_hash("b")])) == [content_hash("a")]
+    assert store.get_many("m2", [content_hash("a")]) == {}
+
+
+def test_knowledge_base_reuses_its_saved_matrix(tmp_path, store, embed_calls):
+    docs_dir = tmp_path / "docs"
+    write_docs(docs_dir, {"a.txt": "orari di apertura", "b.txt": "consegna a domicilio"})
+    first = KnowledgeBase(store, str(docs_dir), "t1")
+    assert first.embedded == 2
+    second = KnowledgeBase(store, str(docs_dir), "t1")
+    assert second.embedded == 0 and len(embed_calls) == 1
+    assert isinstance(second.matrix, np.memmap)
+    assert np.allclose(np.linalg.norm(second.matrix, axis=1), 1)
+    # One document changed: only it is embedded again
+    write_docs(docs_dir, {"b.txt": "consegna gratuita"})
+    third = KnowledgeBase(store, str(docs_dir), "t1")
+    assert third.embedded == 1 and embed_calls[-1] == ["consegna gratuita"]
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from flask import g
+
+from app import openai_funcs
+from app.app import app
+from app.cart_logic import Cart
+
+
+def completion(name, arguments="{}"):
+    message = SimpleNamespace(function_call=SimpleNamespace(name=name, arguments=arguments), content=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    replies = []
+
+    async def achat(stage=None, **kwargs):
+        return replies.pop(0)
+    monkeypatch.setattr(openai_funcs, "achat_completion", achat)
+    monkeypatch.setattr(openai_funcs, "chat_completion", lambda stage=None, **kwargs: replies.pop(0))
+    return replies
+
+
+def state():
+    return {"step": "start", "cart": Cart(), "history": []}
+
+
+def test_async_handlers_run_off_the_event_loop_with_the_request_context(llm, monkeypatch):
+    seen = {}
+
+    def track(args, st):
+        seen["thread"] = threading.current_thread()
+        seen["tenant"] = g.tenant.id
+        return f"Ordine {args['number']}", st
+    monkeypatch.setitem(openai_funcs.handlers, "track_order", track)
+    monkeypatch.setattr(openai_funcs, "final_results", {"track_order"})
+    llm.append(completion("track_order", '{"number": "A1"}'))
+    with app.test_request_context("/chat", method="POST"):
+        tenant = openai_funcs.current_tenant()
+        reply = asyncio.run(openai_funcs.handle_function_call_async("dov'è l'ordine A1", state()))
+        assert g.state_ctx.dirty
+    assert reply == "Ordine A1"
+    assert seen["tenant"] == tenant.id
+    assert seen["thread"] is not threading.main_thread()
+
+
+@pytest.mark.parametrize("run", ["sync", "async"])
+def test_sync_and_async_paths_share_the_dispatch(llm, monkeypatch, run):
+    monkeypatch.setattr(openai_funcs, "final_results", {"add_to_cart", "nope"})
+    with app.test_request_context("/chat", method="POST"):
+        for reply in (completion("add_to_cart", '{"item": "margherita", "quantity": 2}'), completion("nope")):
+            llm.append(reply)
+        st = state()
+        if run == "sync":
+            added = openai_funcs.handle_function_call("due margherite", st)
+            unknown = openai_funcs.handle_function_call("boh", st)
+        else:
+            added = asyncio.run(openai_funcs.handle_function_call_async("due margherite", st))
+            unknown = asyncio.run(openai_funcs.handle_function_call_async("boh", st))
+    assert st["cart"].counts == {"Margherita": 2}
+    assert "Margherita" in added
+    assert unknown == "Funzione 'nope' non riconosciuta."
+
+
+def text(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(function_call=None, content=content))])
+
+
+def answer(run, message, st):
+    if run == "sync":
+        return openai_funcs.handle_function_call(message, st)
+    return asyncio.run(openai_funcs.handle_function_call_async(message, st))
+
+
+def test_final_results_default_to_the_rule_handlers():
+    assert openai_funcs.final_results == set(openai_funcs.handlers) - {"rag_fallback"}
+
+
+@pytest.mark.parametrize("run", ["sync", "async"])
+def test_final_result_is_the_reply(llm, run):
+    with app.test_request_context("/chat", method="POST"):
+        llm.append(completion("get_info"))
+        reply = answer(run, "dove siete?", state())
+        assert g.chat_trace["final_result"] is True
+    assert reply == openai_funcs.fn_get_info({}, state())[0]
+    assert not llm
+
+
+@pytest.mark.parametrize("run", ["sync", "async"])
+def test_other_results_are_rephrased(llm, monkeypatch, run):
+    monkeypatch.setattr(openai_funcs, "final_results", {"show_menu"})
+    with app.test_request_context("/chat", method="POST"):
+        llm.extend([completion("get_info"), text("Siamo in Via Roma!")])
+        reply = answer(run, "dove siete?", state())
+        assert "final_result" not in g.chat_trace
+    assert reply == "Siamo in Via Roma!"
+    assert not llm
@@ -0,0 +1,36 @@
+from app.config import HISTORY_SIZE, HISTORY_SUMMARY_CHARS
+from app.history import TURN_CHARS, entry, history_summary, remember, summarise
+
+
+def test_history_is_bounded_and_evicted_turns_are_summarised():
+    state = {}
+    for i in range(HISTORY_SIZE + 3):
+        remember(state, "user" if i % 2 == 0 else "assistant", f"messaggio {i}")
+    assert len(state["history"]) == HISTORY_SIZE
+    assert state["history"][-1]["content"] == f"messaggio {HISTORY_SIZE + 2}"
+    assert history_summary(state).splitlines() == ["User: messaggio 0", "Bot: messaggio 1", "User: messaggio 2"]
+
+
+def test_summary_keeps_one_clean_excerpt_per_turn():
+    turns = [
+        {"role": "assistant", "content": "\n## 🍕 *Pizze*\n- **Margherita** ─ €6.00"},
+        {"role": "user", "content": "x" * 200},
+        {"role": "user", "content": "   "},
+    ]
+    lines = summarise("", turns).splitlines()
+    assert lines[0] == "Bot: 🍕 Pizze"
+    assert len(lines[1]) == len("User: ") + TURN_CHARS and lines[1].endswith("…")
+    assert len(lines) == 2
+
+
+def test_summary_drops_its_oldest_lines_past_the_limit():
+    summary = ""
+    for i in range(100):
+        summary = summarise(summary, [{"role": "user", "content": f"turno numero {i}"}])
+    assert len(summary) <= HISTORY_SUMMARY_CHARS
+    assert summary.splitlines()[-1] == "User: turno numero 99"
+
+
+def test_legacy_string_entries():
+    assert entry("ciao") == ("assistant", "ciao")
+    assert entry({"role": "user", "content": None}) == ("user", "")
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import ai_intent
+from app.app import app
+from app.cart_logic import Cart
+from app.intent_cache import IntentCache, SqliteIntentCache, cache_key
+from app.metrics import registry
+
+
+def counter(name):
+    return registry.collect().get((name, ()), 0)
+
+
+def reply(content):
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    return IntentCache() if request.param == "memory" else SqliteIntentCache(str(tmp_path / "intents.sqlite"))
+
+
+@pytest.fixture
+def llm(monkeypatch, cache):
+    calls = []
+    replies = []
+    def completion(**kwargs):
+        calls.append(kwargs)
+        return reply(replies.pop(0))
+    monkeypatch.setattr(ai_intent, "intent_cache", cache)
+    monkeypatch.setattr(ai_intent, "_local_intents", lambda text: None)
+    monkeypatch.setattr(ai_intent, "llm_available", lambda: True)
+    monkeypatch.setattr(ai_intent, "chat_completion", completion)
+    return SimpleNamespace(calls=calls, replies=replies)
+
+
+def test_empty_parses_are_not_cached(llm):
+    llm.replies += ["non ho capito", '[{"intent": "menu", "items": []}]']
+    state = {"step": "start", "cart": Cart(), "history": []}
+    with app.test_request_context("/chat", method="POST"):
+        assert ai_intent.understand("fammi vedere", state) == []
+        assert ai_intent.understand("fammi vedere", state) == [{"intent": "menu", "items": []}]
+    assert len(llm.calls) == 2
+
+
+def test_cache_key_depends_on_cart_contents():
+    with app.test_request_context("/chat", method="POST"):
+        one, two = Cart(), Cart()
+        one.add({"name": "Margherita", "price": 6.0}, 1)
+        two.add({"name": "Diavola", "price": 7.5}, 2)
+        state = {"step": "start"}
+        keys = {cache_key("togline una", {**state, "cart": cart}) for cart in (Cart(), one, two)}
+    assert len(keys) == 3
+
+
+def test_other_cart_misses_and_repeat_hits(llm):
+    llm.replies += ['[{"intent": "remove", "items": []}]'] * 2
+    empty = {"step": "start", "cart": Cart(), "history": []}
+    hits, misses = counter("hungergod_intent_cache_hits_total"), counter("hungergod_intent_cache_misses_total")
+    with app.test_request_context("/chat", method="POST"):
+        full = {**empty, "cart": Cart()}
+        full["cart"].add({"name": "Diavola", "price": 7.5}, 1)
+        ai_intent.understand("togline una", empty)
+        ai_intent.understand("togline una", full)
+        ai_intent.understand("Togline una!", full)
+    assert len(llm.calls) == 2
+    assert counter("hungergod_intent_cache_misses_total") == misses + 2
+    assert counter("hungergod_intent_cache_hits_total") == hits + 1
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.config import BASE_DIR
+from app.intent_model import IntentModel, kb_examples, predict_intents, train
+
+EXAMPLES = [
+    ("ciao", "greet"), ("buongiorno", "greet"), ("salve a tutti", "greet"),
+    ("fammi vedere il menu", "menu"), ("cosa avete da mangiare", "menu"), ("il menu per favore", "menu"),
+    ("togli la diavola", "remove"), ("rimuovi una margherita", "remove"), ("levami la coca", "remove"),
+]
+
+
+@pytest.fixture(scope="module")
+def model():
+    return train(EXAMPLES, epochs=200)
+
+
+def test_train_save_load_predict(model, tmp_path):
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+    loaded = IntentModel.load(path)
+    assert loaded.labels == ["greet", "menu", "remove"]
+    for text, label in EXAMPLES:
+        assert loaded.predict(text)[0] == label
+        # Weights are stored as float16: same answer, nearly the same confidence
+        assert np.isclose(loaded.predict(text)[1], model.predict(text)[1], atol=1e-2)
+
+
+def test_predictions_below_threshold_fall_back_to_the_llm(model):
+    assert predict_intents("ciao", model=model, threshold=0.0) == [{"intent": "greet", "items": []}]
+    assert predict_intents("ciao", model=model, threshold=1.01) is None
+    # Mostly unknown n-grams: not trusted at any threshold
+    assert model.predict("xyzzy qwfp") == (None, 0.0)
+    assert predict_intents("xyzzy qwfp", model=model, threshold=0.0) is None
+
+
+def test_item_intents_need_a_menu_item(model):
+    assert predict_intents("togli la diavola", model=model, threshold=0.0) == [
+        {"intent": "remove", "items": [{"name": "Diavola", "quantity": 1}]}
+    ]
+    assert predict_intents("togli quella", model=model, threshold=0.0) is None
+
+
+def test_shipped_model_loads_and_knows_the_kb():
+    shipped = IntentModel.load(os.path.join(BASE_DIR, "intent_model.npz"))
+    examples = kb_examples()
+    correct = sum(shipped.predict(text)[0] == label for text, label in examples)
+    assert correct / len(examples) > 0.9
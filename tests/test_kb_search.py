@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from app.kb import KnowledgeBase, normalise_rows
+
+
+@pytest.fixture
+def kb():
+    rng = np.random.default_rng(1)
+    embeddings = rng.normal(size=(50, 16))
+    docs = [{"id": f"doc{i}", "text": f"documento {i}"} for i in range(50)]
+    return KnowledgeBase.from_embeddings(docs, embeddings), embeddings
+
+
+def brute_force(embeddings, q, top_k):
+    """Cosine similarity one document at a time, as before."""
+    scores = [float(np.dot(e, q) / (np.linalg.norm(e) * np.linalg.norm(q))) for e in embeddings]
+    return sorted(range(len(scores)), key=lambda i: -scores[i])[:top_k]
+
+
+@pytest.mark.parametrize("top_k", [1, 3, 10, 50, 80])
+def test_search_matches_brute_force(kb, top_k):
+    index, embeddings = kb
+    rng = np.random.default_rng(top_k)
+    for _ in range(20):
+        q = rng.normal(size=16)
+        found = [int(d["id"][3:]) for d in index.search(q, top_k)]
+        assert found == brute_force(embeddings, q, top_k)
+
+
+def test_edge_cases(kb):
+    index, _ = kb
+    assert index.search(np.ones(16), 0) == []
+    assert index.search(np.zeros(16), 2) == index.docs[:2]
+    empty = KnowledgeBase.from_embeddings([], np.zeros((0, 16)))
+    assert empty.search(np.ones(16)) == []
+
+
+def test_normalise_rows_keeps_zero_rows():
+    rows = normalise_rows(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    assert rows.dtype == np.float32
+    assert np.allclose(rows, [[0.6, 0.8], [0.0, 0.0]])
@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+from flask import g
+from openai import NOT_GIVEN
+
+from app import llm
+from app.app import app
+from app.breaker import CircuitBreaker
+from app.budget import Budget, BudgetExceeded, deadline
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(failures=3, cooldown=60)
+    monkeypatch.setattr(llm, "breaker", breaker)
+    return breaker
+
+
+def timing_out(timeout, **kwargs):
+    raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def call_within(budget_seconds):
+    with app.test_request_context("/chat", method="POST"):
+        g.budget = Budget(total=budget_seconds)
+        with pytest.raises(BudgetExceeded):
+            with deadline("understand_llm") as timeout:
+                llm._call("chat", "understand_llm", timeout, timing_out)
+
+
+def test_budget_clamped_timeouts_leave_breaker_closed(breaker):
+    # Less budget left than the stage's deadline: the timeout is the budget's
+    for _ in range(5):
+        call_within(llm.STAGE_DEADLINES["understand_llm"] / 2)
+    assert breaker.state == "closed"
+
+
+def test_timeouts_at_full_deadline_open_breaker(breaker):
+    for _ in range(3):
+        call_within(llm.STAGE_DEADLINES["understand_llm"] * 3)
+    assert breaker.state == "open"
+
+
+def test_inconclusive_trial_call_reopens_breaker(breaker):
+    breaker.cooldown = 0
+    for _ in range(3):
+        call_within(llm.STAGE_DEADLINES["understand_llm"] * 3)
+    assert breaker.state == "open" and breaker.available()
+    # The half-open trial times out on a budget-clamped timeout
+    call_within(llm.STAGE_DEADLINES["understand_llm"] / 2)
+    assert breaker.state == "open" and breaker.available()
+    assert breaker.allow() and breaker.state == "half_open"
+    breaker.succeeded()
+    assert breaker.state == "closed"
+
+
+def test_cancelled_trial_call_reopens_breaker(breaker):
+    breaker.cooldown = 0
+    for _ in range(3):
+        breaker.failed()
+
+    async def hanging(timeout, **kwargs):
+        await asyncio.sleep(10)
+
+    async def cancel_trial():
+        task = asyncio.ensure_future(llm._acall("chat", None, NOT_GIVEN, hanging))
+        await asyncio.sleep(0)
+        assert breaker.state == "half_open"
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert breaker.state == "open" and breaker.available()
+
+
+def test_unavailable_api_skips_the_rag_fallback(monkeypatch):
+    from app import app as app_module, openai_funcs
+
+    def unavailable(stage=None, **kwargs):
+        raise llm.LLMUnavailable(stage)
+    rag_calls = []
+    monkeypatch.setattr(openai_funcs, "chat_completion", unavailable)
+    monkeypatch.setattr(openai_funcs, "rag_response", lambda text, state: rag_calls.append(text))
+    with app.test_request_context("/chat", method="POST"):
+        reply = app_module._answer("che vini avete?", {"history": [], "cart": None})
+    assert rag_calls == []
+    assert reply == app_module._degraded_reply()
@@ -0,0 +1,136 @@
+import io
+import json
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+import stripe
+
+from benchmarks import fake_openai, load_test
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+@pytest.fixture
+def server():
+    server = FakeOpenAIServer(latency=0, seed=0).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, body):
+    req = urllib.request.Request(url, data=json.dumps(body).encode(), method="POST",
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return resp.headers.get("Content-Type"), resp.read().decode()
+
+
+def test_plain_and_intent_replies(server):
+    _, text = post(f"{server.base_url}/chat/completions",
+                   {"model": "m", "messages": [{"role": "user", "content": "ciao"}]})
+    assert json.loads(text)["choices"][0]["message"]["content"] == fake_openai.DEFAULT_REPLY
+    _, text = post(f"{server.base_url}/chat/completions",
+                   {"messages": [{"role": "system", "content": "Rispondi con una lista JSON"}]})
+    assert json.loads(text)["choices"][0]["message"]["content"] == "[]"
+
+
+def test_function_call_only_before_the_result(server):
+    functions = [{"name": "show_menu"}, {"name": "rag_fallback"}]
+    body = {"functions": functions, "messages": [{"role": "user", "content": "Posso vedere il menu?"}]}
+    choice = json.loads(post(f"{server.base_url}/chat/completions", body)[1])["choices"][0]
+    assert choice["finish_reason"] == "function_call"
+    assert choice["message"]["function_call"] == {"name": "show_menu", "arguments": "{}"}
+
+    assert fake_openai.function_call(
+        {"functions": functions, "messages": [{"role": "user", "content": "Avete pizze senza glutine?"}]}
+    ) == ("rag_fallback", {"query": "avete pizze senza glutine?"})
+    body["messages"].append({"role": "function", "name": "show_menu", "content": "..."})
+    assert fake_openai.function_call(body) is None
+    assert fake_openai.function_call(dict(body, function_call="none")) is None
+
+
+def test_stream_ends_with_done(server):
+    content_type, text = post(f"{server.base_url}/chat/completions", {
+        "stream": True, "stream_options": {"include_usage": True},
+        "messages": [{"role": "user", "content": "ciao"}],
+    })
+    assert content_type == "text/event-stream"
+    events = [line[len("data: "):] for line in text.split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    assert chunks[-1]["usage"]["completion_tokens"] == len(chunks) - 1
+    deltas = [c["choices"][0]["delta"] for c in chunks[:-1]]
+    assert deltas[0]["role"] == "assistant"
+    assert "".join(d["content"] for d in deltas) == fake_openai.DEFAULT_REPLY
+    assert chunks[-2]["choices"][0]["finish_reason"] == "stop"
+
+
+def test_embeddings_are_deterministic(server):
+    _, text = post(f"{server.base_url}/embeddings", {"input": ["a", "b", "a"]})
+    vectors = [d["embedding"] for d in json.loads(text)["data"]]
+    assert len(vectors[0]) == fake_openai.EMBEDDING_DIM
+    assert vectors[0] == vectors[2] != vectors[1]
+    _, text = post(f"{server.base_url}/embeddings", {"input": "a"})
+    assert json.loads(text)["data"][0]["embedding"] == vectors[0]
+
+
+def test_injected_failures_and_request_counts(server):
+    server.error_rate = 1.0
+    with pytest.raises(urllib.error.HTTPError) as e:
+        post(f"{server.base_url}/chat/completions", {"messages": []})
+    assert e.value.code == 500
+    server.error_rate = 0.0
+    with pytest.raises(urllib.error.HTTPError) as e:
+        post(f"{server.base_url}/nope", {})
+    assert e.value.code == 404
+    assert server.requests == {"/v1/chat/completions": 1, "errors": 1, "/v1/nope": 1}
+
+
+def test_conversation_ends_with_the_webhook():
+    steps = load_test.conversation_steps(random.Random(0))
+    assert steps[0] == ("welcome", "!welcome")
+    assert steps[-1] == ("webhook", None)
+    assert all(message for _, message in steps[:-1])
+    assert steps == load_test.conversation_steps(random.Random(0))
+
+
+def test_stripe_event_signature_verifies():
+    payload, sig = load_test.stripe_event(load_test.WEBHOOK_SECRET, "abc")
+    event = stripe.Webhook.construct_event(payload, sig, load_test.WEBHOOK_SECRET)
+    assert event["type"] == "checkout.session.completed"
+    assert event["data"]["object"]["id"] == "cs_abc"
+    with pytest.raises(stripe.error.SignatureVerificationError):
+        stripe.Webhook.construct_event(payload, sig, "whsec_other")
+
+
+def test_results_and_percentile():
+    results = load_test.Results()
+    results.add("menu", 0.1, True)
+    results.add("menu", 0.2, False)
+    assert results.latencies["menu"] == [0.1, 0.2]
+    assert results.errors == {"menu": 1}
+    samples = list(range(100))
+    assert load_test.percentile(samples, 0.5) == 50
+    assert load_test.percentile(samples, 0.99) == 99
+    assert load_test.percentile([7], 0.99) == 7
+
+
+def test_scrape_session_saves_sums_workers(monkeypatch):
+    metrics = "\n".join([
+        'hungergod_stage_seconds_bucket{stage="session_save",le="0.001"} 90',
+        'hungergod_stage_seconds_bucket{stage="session_save",le="0.01"} 100',
+        'hungergod_stage_seconds_bucket{stage="session_save",le="+Inf"} 100',
+        'hungergod_stage_seconds_count{stage="session_save"} 100',
+        'hungergod_stage_seconds_sum{stage="session_save"} 0.2',
+        'hungergod_stage_seconds_count{stage="llm"} 5',
+    ])
+    monkeypatch.setattr(urllib.request, "urlopen", lambda url, timeout: io.BytesIO(metrics.encode()))
+    count, total, p95 = load_test.scrape_session_saves("http://x")
+    assert (count, p95) == (100, "0.01")
+    assert total == pytest.approx(0.2)
+
+    def unreachable(url, timeout):
+        raise urllib.error.URLError("down")
+    monkeypatch.setattr(urllib.request, "urlopen", unreachable)
+    assert load_test.scrape_session_saves("http://x") is None
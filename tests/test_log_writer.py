@@ -0,0 +1,79 @@
+import json
+import threading
+import time
+
+from app.log_writer import LogWriter
+from app.metrics import registry
+
+
+def counter(name, log):
+    return registry.collect().get((name, (("log", log),)), 0)
+
+
+def lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_batches_are_appended_as_json_lines(tmp_path):
+    log = LogWriter(str(tmp_path / "batched.log"), flush_interval=0.01, compress=False)
+    for i in range(5):
+        assert log.write({"n": i, "text": "ciao è"})
+    log.close()
+    assert [e["n"] for e in lines(tmp_path / "batched.log")] == list(range(5))
+    assert counter("hungergod_log_lines_written_total", "batched.log") == 5
+
+
+def test_bad_entries_are_dropped_and_the_writer_keeps_going(tmp_path):
+    log = LogWriter(str(tmp_path / "bad.log"), flush_interval=0.01, compress=False)
+    circular = {}
+    circular["self"] = circular
+    log.write(circular)
+    log.flush()
+    log.write({"n": 1})
+    log.close()
+    assert lines(tmp_path / "bad.log") == [{"n": 1}]
+    assert counter("hungergod_log_lines_dropped_total", "bad.log") == 1
+
+
+def test_unexpected_errors_do_not_kill_the_thread(tmp_path, monkeypatch):
+    log = LogWriter(str(tmp_path / "crash.log"), flush_interval=0.01, compress=False)
+    write_batch = log._write_batch
+    calls = []
+
+    def crash_once(entries):
+        calls.append(entries)
+        if len(calls) == 1:
+            raise RuntimeError("disk on fire")
+        write_batch(entries)
+    monkeypatch.setattr(log, "_write_batch", crash_once)
+    log.write({"n": 1})
+    log.flush()
+    log.write({"n": 2})
+    log.close()
+    assert lines(tmp_path / "crash.log") == [{"n": 2}]
+    assert counter("hungergod_log_errors_total", "crash.log") == 1
+
+
+def test_blocking_writes_give_up_on_a_stalled_disk(tmp_path, monkeypatch):
+    log = LogWriter(str(tmp_path / "stalled.log"), queue_size=1, policy="block", block_timeout=0.05, flush_interval=0.001)
+    stalled = threading.Event()
+    monkeypatch.setattr(log, "_write_batch", lambda entries: stalled.wait(5))
+    assert log.write({"n": 1})
+    time.sleep(0.05)  # the thread takes it and stalls
+    assert log.write({"n": 2})
+    start = time.monotonic()
+    assert not log.write({"n": 3})
+    assert time.monotonic() - start < 1
+    assert counter("hungergod_log_lines_dropped_total", "stalled.log") == 1
+    stalled.set()
+    log.close()
+
+
+def test_rotation_is_counted(tmp_path):
+    log = LogWriter(str(tmp_path / "small.log"), flush_interval=0.01, max_bytes=40, compress=False)
+    for i in range(3):
+        log.write({"n": i, "pad": "x" * 20})
+        log.flush()
+    log.close()
+    assert counter("hungergod_log_rotations_total", "small.log") == 2
+    assert len(list(tmp_path.glob("small.log.2*"))) == 2
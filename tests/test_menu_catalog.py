@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+from app.menu_catalog import CatalogLoader, MenuCatalog
+
+MENU = {
+    "Pizze": [{"name": "Margherita", "price": 6.0, "aliases": ["margerita"]}],
+    "Bevande": [{"name": "Coca-Cola", "price": 2.5, "aliases": ["coca"]}],
+}
+
+
+def write_menu(path, menu, mtime_ns):
+    path.write_text(json.dumps(menu), encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def menu_file(tmp_path):
+    path = tmp_path / "menu.json"
+    write_menu(path, MENU, 1_000_000_000)
+    return path
+
+
+def test_catalog_indexes_and_renders_once(menu_file):
+    catalog = MenuCatalog.load(str(menu_file), title="Da Mario")
+    assert catalog.items["Coca-Cola"]["price"] == 2.5
+    assert catalog.categories == {"Margherita": "Pizze", "Coca-Cola": "Bevande"}
+    assert "Da Mario" in catalog.render() and "**Margherita** ─ €6.00" in catalog.render()
+    assert "**Margherita**" not in catalog.render("Bevande")
+    assert catalog.render("Dolci") is catalog.render()
+    assert catalog.matcher.match("margerita")["name"] == "Margherita"
+
+
+@pytest.mark.parametrize("broken", [
+    "{not json",
+    json.dumps(["Margherita"]),
+    json.dumps({"Pizze": [{"price": 6.0}]}),
+    json.dumps({"Pizze": [{"name": "Margherita", "price": "sei"}]}),
+])
+def test_bad_menu_keeps_the_last_good_catalog(menu_file, broken):
+    loader = CatalogLoader(str(menu_file), interval=0)
+    good = loader.current()
+    menu_file.write_text(broken, encoding="utf-8")
+    os.utime(menu_file, ns=(2_000_000_000, 2_000_000_000))
+    assert loader.current() is good
+    assert loader._failed_mtime == 2_000_000_000
+    # Fixed: the next check picks it up
+    write_menu(menu_file, {**MENU, "Dolci": [{"name": "Tiramisù", "price": 4.0}]}, 3_000_000_000)
+    assert "Tiramisù" in loader.current().items
@@ -0,0 +1,67 @@
+import difflib
+import json
+import random
+
+import pytest
+
+from app.config import MENU_PATH
+from app.menu_index import MenuMatcher, trigrams
+
+
+@pytest.fixture(scope="module")
+def menu():
+    with open(MENU_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def close_match(menu, query, cutoff):
+    """The difflib scan the matcher replaced."""
+    items = {}
+    for cat_items in menu.values():
+        for item in cat_items:
+            for term in [item["name"]] + item.get("aliases", []):
+                items.setdefault(term.lower(), item)
+    found = difflib.get_close_matches(query.lower(), list(items), n=1, cutoff=cutoff)
+    return items[found[0]] if found else None
+
+
+def typos(word, rng):
+    word = list(word)
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(word))
+        op = rng.choice("sdi")
+        if op == "s":
+            word[i] = rng.choice("aeiourtn")
+        elif op == "d" and len(word) > 2:
+            del word[i]
+        else:
+            word.insert(i, rng.choice("aeiou"))
+    return "".join(word)
+
+
+def test_trigrams_pad_short_names():
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+
+
+def test_exact_names_and_aliases(menu):
+    matcher = MenuMatcher(menu)
+    assert matcher.match("Margherita")["name"] == "Margherita"
+    assert matcher.match("COCA")["name"] == "Coca-Cola"
+    assert matcher.match("qwerty") is None
+
+
+@pytest.mark.parametrize("cutoff", [0.55, 0.8])
+def test_matches_difflib(menu, cutoff):
+    matcher = MenuMatcher(menu, cutoff=cutoff)
+    rng = random.Random(3)
+    names = [term for items in menu.values() for item in items for term in [item["name"]] + item.get("aliases", [])]
+    queries = [typos(rng.choice(names).lower(), rng) for _ in range(300)] + ["pizza", "birra rossa", "xx", "vino bianco"]
+    for query in queries:
+        assert matcher.match(query) == close_match(menu, query, cutoff), query
+
+
+def test_lookups_are_cached(menu):
+    matcher = MenuMatcher(menu)
+    matcher.match("diavolaa")
+    matcher.match("Diavolaa")
+    assert matcher.cache_info().hits == 1
@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+from app.metrics import Registry
+
+REQUESTS = ("hungergod_requests_total", (("path", "rules"),))
+LATENCY = ("hungergod_tenant_load_seconds", ())
+
+
+def write_snapshot(directory, pid, values):
+    path = directory / f"{pid}.json"
+    path.write_text(json.dumps(values), encoding="utf-8")
+    return path
+
+
+def exited_pid():
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    return dead.pid
+
+
+def test_exited_workers_are_archived_without_their_gauges(tmp_path):
+    registry = Registry(directory=str(tmp_path))
+    registry.inc("hungergod_requests_total", {"path": "rules"})
+    stale = write_snapshot(tmp_path, exited_pid(), [
+        ["hungergod_requests_total", {"path": "rules"}, 40],
+        ["hungergod_tenant_load_seconds", {}, [1] + [0] * 15 + [0.0001]],
+        ["hungergod_llm_breaker_open", {}, 1],
+    ])
+    # The parent process stands in for another live worker
+    write_snapshot(tmp_path, os.getppid(), [
+        ["hungergod_requests_total", {"path": "rules"}, 2],
+        ["hungergod_tenants_loaded", {}, 3],
+    ])
+    totals = registry.collect()
+    assert totals[REQUESTS] == 43
+    assert totals[LATENCY][0] == 1
+    assert ("hungergod_llm_breaker_open", ()) not in totals
+    assert totals[("hungergod_tenants_loaded", ())] == 3
+    assert not stale.exists()
+    # Archived once: the next scrape counts it again, but only once
+    assert registry.collect()[REQUESTS] == 43
+
+
+def test_counters_never_go_down_across_worker_restarts(tmp_path):
+    registry = Registry(directory=str(tmp_path))
+    write_snapshot(tmp_path, exited_pid(), [["hungergod_requests_total", {"path": "rules"}, 5]])
+    first = registry.collect()[REQUESTS]
+    write_snapshot(tmp_path, exited_pid(), [["hungergod_requests_total", {"path": "rules"}, 7]])
+    second = registry.collect()[REQUESTS]
+    assert (first, second) == (5, 12)
+    assert "hungergod_requests_total" in registry.render()
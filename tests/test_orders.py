@@ -0,0 +1,33 @@
+import pytest
+
+from app import cart_logic
+from app.order_store import OrderStore
+
+ITEMS = [{"name": "Margherita", "price": 6.0, "quantity": 1, "subtotal": 6.0}]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = OrderStore(str(tmp_path / "orders.sqlite"))
+    monkeypatch.setattr(cart_logic, "order_store", store)
+    return store
+
+
+def test_orders_are_only_found_by_the_session_that_placed_them(store):
+    mine = store.create(ITEMS, 6.0, customer="Luca", session_id="s1", address="Via Roma 1")
+    theirs = store.create(ITEMS, 6.0, customer="Luca", session_id="s2", address="Via Po 2")
+    assert store.latest(session_id="s1")["number"] == mine["number"]
+    assert store.latest(session_id="s3") is None
+    assert store.get(theirs["number"], session_id="s1") is None
+    assert store.get(mine["number"], session_id="s1")["address"] == "Via Roma 1"
+
+
+def test_find_order_ignores_names_and_guessed_numbers(store, monkeypatch):
+    theirs = store.create(ITEMS, 6.0, customer="Luca", session_id="s2", address="Via Po 2")
+    monkeypatch.setattr(cart_logic, "session_id", lambda: "s1")
+    state = {"pending_order": {"name": "Luca"}}
+    assert cart_logic.find_order(state) is None
+    assert cart_logic.find_order(state, theirs["number"]) is None
+    mine = store.create(ITEMS, 6.0, customer="Luca", session_id="s1")
+    assert cart_logic.find_order(state)["number"] == mine["number"]
+    assert cart_logic.find_order(state, mine["number"].lstrip("#"))["number"] == mine["number"]
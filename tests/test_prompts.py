@@ -0,0 +1,119 @@
+import pytest
+from flask import g
+
+from app import prompts
+from app.app import app
+from app.cart_logic import Cart
+from app.metrics import registry
+from app.prompts import (
+    MIN_HISTORY_TURNS, build_messages, cart_text, clip, count_tokens, message_tokens, order_text,
+)
+
+INSTRUCTIONS = "Sei Mario, rispondi in breve."
+DOCS = ["primo documento " * 30, "secondo documento " * 30, "terzo documento " * 30]
+
+
+@pytest.fixture(autouse=True)
+def request_context(monkeypatch):
+    # Estimated counts, with or without tiktoken installed
+    monkeypatch.setattr(prompts, "_encoding", False)
+    with app.test_request_context("/chat", method="POST"):
+        yield
+
+
+def conversation(turns=6):
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turno {i} " + "parola " * 20}
+               for i in range(turns)]
+    return {"cart": Cart(), "history": history, "history_summary": "User: ciao\nBot: benvenuto " * 5}
+
+
+def build(state, stage="test_stage", **kwargs):
+    kwargs.setdefault("docs", DOCS)
+    return build_messages(stage, INSTRUCTIONS, "e la Diavola?", state, context="Carrello: vuoto", **kwargs)
+
+
+def trimmed(part):
+    return registry.collect().get(("hungergod_prompt_trimmed_total", (("part", part), ("stage", "test_stage"))), 0)
+
+
+def test_token_estimates():
+    assert count_tokens("") == 0
+    assert count_tokens("ciao mondo!") == 1 + 2 + 1
+    messages = [{"role": "user", "content": "ciao"}, {"role": "assistant", "content": None,
+                                                      "function_call": {"name": "show_menu", "arguments": "{}"}}]
+    assert message_tokens(messages) > 2 * prompts.MESSAGE_TOKENS + 1
+    assert message_tokens(messages, functions=[{"name": "show_menu"}]) > message_tokens(messages)
+
+
+def test_clip_cuts_at_a_word_boundary():
+    assert clip("breve testo", 10) == "breve testo"
+    clipped = clip("parola " * 50, 10)
+    assert clipped.endswith("parola…")
+    assert count_tokens(clipped[:-1]) <= 10
+
+
+def test_compact_cart_and_order():
+    cart = Cart()
+    assert cart_text(cart) == "vuoto"
+    cart.add({"name": "Margherita", "price": 6.0}, 2)
+    cart.add({"name": "Coca-Cola", "price": 2.5})
+    assert cart_text(cart) == "Margherita x2, Coca-Cola x1"
+    assert order_text(None) == ""
+    assert order_text({"number": 1042, "eta": "20:15", "total": 23.5}) == "n. 1042, pronto alle 20:15, €23.50"
+
+
+def test_instructions_open_the_prompt_then_context_history_and_user():
+    state = conversation()
+    messages = build(state, turns=4)
+    assert messages[0] == {"role": "system", "content": INSTRUCTIONS}
+    context = messages[1]["content"]
+    assert context.startswith("Carrello: vuoto\n\nInformazioni:\n" + DOCS[0])
+    assert "Riassunto conversazione precedente:\nUser: ciao" in context
+    assert [m["content"] for m in messages[2:-1]] == [m["content"] for m in state["history"][-4:]]
+    assert messages[-1] == {"role": "user", "content": "e la Diavola?"}
+    assert g.chat_trace["prompt_tokens"]["test_stage"] == message_tokens(messages)
+
+
+def test_transcript_puts_history_in_the_context():
+    state = conversation(2)
+    messages = build(state, transcript=True)
+    assert len(messages) == 3
+    first, second = (m["content"] for m in state["history"])
+    assert messages[1]["content"].endswith(f"Conversazione recente:\nUser: {first}\nBot: {second}")
+
+
+def test_long_turns_are_cut(monkeypatch):
+    monkeypatch.setattr(prompts, "PROMPT_TURN_TOKENS", 10)
+    messages = build({"history": [{"role": "user", "content": "parola " * 100}]}, docs=())
+    assert messages[2]["content"].endswith("…")
+    assert count_tokens(messages[2]["content"][:-1]) <= 10
+
+
+def test_budget_drops_the_oldest_turns_first(monkeypatch):
+    full = message_tokens(build(conversation()))
+    monkeypatch.setitem(prompts.PROMPT_TOKEN_BUDGETS, "test_stage", full - 10)
+    before = trimmed("history")
+    messages = build(conversation())
+    assert message_tokens(messages) <= full - 10
+    assert messages[2]["content"].startswith("turno 1 ")
+    assert "Riassunto" in messages[1]["content"] and DOCS[2] in messages[1]["content"]
+    assert trimmed("history") == before + 1
+    assert g.chat_trace["prompt_trimmed"]["test_stage"] == ["history"]
+
+
+def test_budget_keeps_recent_turns_over_summary_and_extra_docs(monkeypatch):
+    state = conversation()
+    recent = build({"history": state["history"][-MIN_HISTORY_TURNS:]}, docs=DOCS[:1])
+    monkeypatch.setitem(prompts.PROMPT_TOKEN_BUDGETS, "test_stage", message_tokens(recent))
+    messages = build(state)
+    assert messages == recent
+    assert g.chat_trace["prompt_trimmed"]["test_stage"] == ["docs", "history", "summary"]
+
+
+def test_tight_budget_cuts_the_first_document(monkeypatch):
+    monkeypatch.setitem(prompts.PROMPT_TOKEN_BUDGETS, "test_stage", 60)
+    messages = build(conversation())
+    assert len(messages) == 3
+    assert message_tokens(messages) <= 60
+    assert messages[1]["content"].startswith("Carrello: vuoto\n\nInformazioni:\nprimo documento")
+    assert messages[1]["content"].endswith("…")
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from flask import g
+
+from app import ai_rag
+from app.app import app
+from app.budget import Budget, BudgetExceeded
+from app.kb import LazyKnowledgeBase
+from app.tenants import tenants
+
+
+@pytest.fixture
+def cold_kb(monkeypatch):
+    """A default-tenant KB whose warm-up takes longer than any message's budget."""
+    release = threading.Event()
+    def build():
+        release.wait(10)
+        raise RuntimeError("embedding API down")
+    monkeypatch.setattr(tenants.default, "kb", LazyKnowledgeBase(build))
+    yield tenants.default.kb
+    release.set()
+
+
+@pytest.fixture
+def failed_kb(monkeypatch):
+    def build():
+        raise RuntimeError("embedding API down")
+    kb = LazyKnowledgeBase(build)
+    kb.warm_up()
+    kb._thread.join()
+    monkeypatch.setattr(tenants.default, "kb", kb)
+    return kb
+
+
+def test_cold_kb_waits_no_longer_than_the_budget(cold_kb):
+    with app.test_request_context("/chat", method="POST"):
+        g.budget = Budget(total=0.3)
+        start = time.monotonic()
+        assert ai_rag._retrieve("siete aperti a pranzo?") == []
+        assert time.monotonic() - start < 1
+
+
+def test_failed_kb_degrades_instead_of_raising(failed_kb):
+    with app.test_request_context("/chat", method="POST"):
+        g.budget = Budget(total=0.3)
+        assert ai_rag._retrieve("siete aperti a pranzo?") == []
+        with pytest.raises(BudgetExceeded):
+            asyncio.run(ai_rag._index_async())
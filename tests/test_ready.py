@@ -0,0 +1,42 @@
+import time
+from types import SimpleNamespace
+
+from app import kb as kb_module
+from app.app import app
+from app.kb import LazyKnowledgeBase
+from app.tenants import tenants
+
+
+def poll_ready(client, seconds=2):
+    deadline = time.monotonic() + seconds
+    while True:
+        response = client.get("/ready")
+        if response.status_code == 200 or time.monotonic() > deadline:
+            return response
+        time.sleep(0.02)
+
+
+def test_ready_starts_the_warm_up_when_nothing_did(monkeypatch):
+    # As with KB_WARMUP=0: no warm-up started at import
+    kb = LazyKnowledgeBase(lambda: SimpleNamespace(docs=[]))
+    monkeypatch.setattr(tenants.default, "kb", kb)
+    response = poll_ready(app.test_client())
+    assert response.status_code == 200
+    assert response.get_json()["kb"]["state"] == "ready"
+
+
+def test_failed_warm_up_is_logged_and_retried(monkeypatch):
+    events = []
+    monkeypatch.setattr(kb_module, "log_event", lambda event, **fields: events.append((event, fields)))
+    attempts = []
+    def build():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("embedding API down")
+        return SimpleNamespace(docs=[])
+    kb = LazyKnowledgeBase(build)
+    kb.warm_up()
+    kb._thread.join()
+    monkeypatch.setattr(tenants.default, "kb", kb)
+    assert events == [("kb_warmup_failed", {"error": "embedding API down"})]
+    assert poll_ready(app.test_client()).status_code == 200
@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from app.rule_index import Automaton, RuleIndex
+from app.tenants import default_rules, tenants
+
+ITEM_INTENTS = ('order', 'add_to_cart', 'remove')
+
+
+def items_in(text, menu):
+    return [{"name": item['name'], "quantity": 1}
+            for cat_items in menu.values() for item in cat_items
+            if any(term.lower() in text for term in [item['name']] + item.get('aliases', []))]
+
+
+def naive_classify(text, rules, menu):
+    """The substring loops the rule index replaced."""
+    text = text.lower()
+    results = []
+    for u in rules.utterances:
+        if u['utterance'].lower() in text:
+            intent, items = u['intent'], []
+            if intent in ITEM_INTENTS:
+                items = items_in(text, menu)
+                if intent == 'order' and items:
+                    intent = 'add_to_cart'
+            results.append({"intent": intent, "items": items})
+    if results:
+        return results
+    for intent, kws in rules.actions.items():
+        for kw in kws:
+            if kw.lower() in text:
+                items = items_in(text, menu) if intent in ITEM_INTENTS else []
+                if intent == 'order' and items:
+                    intent = 'add_to_cart'
+                return [{"intent": intent, "items": items}]
+    return []
+
+
+def test_automaton_finds_overlapping_and_nested_patterns():
+    automaton = Automaton([("he", 0), ("she", 1), ("his", 2), ("hers", 3), ("", 4)])
+    assert automaton.findall("ushers") == {0, 1, 3, 4}
+    assert automaton.findall("ahis") == {2, 4}
+    assert automaton.findall("xyz") == {4}
+
+
+def test_automaton_matches_substring_search():
+    rng = random.Random(7)
+    patterns = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(40)]
+    automaton = Automaton([(p, i) for i, p in enumerate(patterns)])
+    for _ in range(200):
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 20)))
+        assert automaton.findall(text) == {i for i, p in enumerate(patterns) if p in text}
+
+
+@pytest.mark.parametrize("text", [
+    "ciao", "vorrei una margherita", "aggiungi una diavola e una coca",
+    "togli la capricciosa", "mi fai vedere il menu?", "quanto costa il tiramisù",
+    "voglio ordinare", "grazie mille", "qual è l'indirizzo", "asdfgh", "",
+] + [u['utterance'] for u in default_rules.utterances[:60]])
+def test_classify_matches_the_substring_loops(text):
+    menu = tenants.default.catalog().menu
+    index = RuleIndex(default_rules.utterances, default_rules.actions, menu)
+    assert index.classify(text) == naive_classify(text, default_rules, menu)
+
+
+def test_utterances_win_over_keywords_and_orders_with_items_become_add_to_cart():
+    menu = {"Pizze": [{"name": "Margherita", "aliases": ["marghe"]}]}
+    index = RuleIndex(
+        [{"utterance": "vorrei", "intent": "order"}],
+        {"menu": ["menu"], "remove": ["togli"]},
+        menu,
+    )
+    assert index.classify("vorrei il menu") == [{"intent": "order", "items": []}]
+    assert index.classify("vorrei una marghe") == [{"intent": "add_to_cart", "items": [{"name": "Margherita", "quantity": 1}]}]
+    assert index.classify("togli la margherita") == [{"intent": "remove", "items": [{"name": "Margherita", "quantity": 1}]}]
+    assert index.scan("Menu con MARGHERITA") == ([], "menu", ["Margherita"])
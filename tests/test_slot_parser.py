@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from app.config import MENU_PATH
+from app.slot_parser import SlotParser, plural
+from app.tenants import default_rules
+
+
+@pytest.fixture(scope="module")
+def parser():
+    with open(MENU_PATH, encoding="utf-8") as f:
+        return SlotParser(json.load(f), default_rules.quantifiers)
+
+
+def add(*items):
+    return [{"intent": "add_to_cart", "items": [{"name": n, "quantity": q} for n, q in items]}]
+
+
+def test_plural():
+    assert plural("margherita") == "margherite"
+    assert plural("cannolo") == "cannoli"
+    assert plural("coca") == "coche"
+    assert plural("coca-cola") == "coca-cola"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("due margherite e tre coca", add(("Margherita", 2), ("Coca-Cola", 3))),
+    ("vorrei 3 diavole", add(("Diavola", 3))),
+    ("una birra x2", add(("Birra artigianale", 2))),
+    ("margherita", add(("Margherita", 1))),
+    ("quattro stagioni e un tiramisù", add(("Quattro Stagioni", 1), ("Tiramisù", 1))),
+    ("prendo due cannoli", add(("Cannolo Siciliano", 2))),
+])
+def test_quantities_and_plurals(parser, text, expected):
+    assert parser.parse(text) == expected
+
+
+def test_typos(parser):
+    assert parser.parse("due margeritta") == add(("Margherita", 2))
+    assert parser.parse("una capriciosa") == add(("Capricciosa", 1))
+
+
+def test_removals_and_negation(parser):
+    assert parser.parse("togli una diavola") == [{"intent": "remove", "items": [{"name": "Diavola", "quantity": 1}]}]
+    assert parser.parse("non voglio più la diavola") == [{"intent": "remove", "items": [{"name": "Diavola", "quantity": 1}]}]
+    assert parser.parse("aggiungi una coca e togli la napoli") == [
+        {"intent": "add_to_cart", "items": [{"name": "Coca-Cola", "quantity": 1}]},
+        {"intent": "remove", "items": [{"name": "Napoli", "quantity": 1}]},
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    "quando arriva l'ordine della diavola?",
+    "quando arriva l'ordine della diavola",
+    "vorrei due margherite?",
+    "quanto costa la margherita?",
+    "portami il conto",
+    "la margherita ha il basilico",
+    "ciao",
+])
+def test_questions_and_other_messages_are_not_orders(parser, text):
+    assert parser.parse(text) is None
+
+
+def test_carry_verbs_add_only_before_an_item(parser):
+    assert parser.parse("portami due birre") == add(("Birra artigianale", 2))
+    assert parser.parse("ordino una bufalina") == add(("Bufalina", 1))
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from flask import session
+
+from app.app import app
+from app.cart_logic import Cart
+from app.config import SESSION_REFRESH_AFTER
+from app.metrics import registry
+from app.state_handler import get_state, set_state, flush_state, session_key
+
+
+def counter(name):
+    return registry.collect().get((name, ()), 0)
+
+
+def stored_state(last_active):
+    """Request context whose session already holds a state, as loaded from storage."""
+    ctx = app.test_request_context("/chat", method="POST")
+    ctx.push()
+    session[session_key()] = {"step": "start", "cart": Cart(), "history": [], "last_active": last_active}
+    session.modified = False
+    return ctx
+
+
+def stores_session():
+    return app.session_interface.should_set_storage(app, session)
+
+
+def test_changed_state_is_written_once():
+    flushes = counter("hungergod_state_flushes_total")
+    with app.test_request_context("/chat", method="POST"):
+        state = get_state()
+        for step in ("menu", "order", "confirm"):
+            state["step"] = step
+            set_state(state)
+        flush_state(None)
+        assert stores_session()
+        assert session[session_key()]["step"] == "confirm"
+    assert counter("hungergod_state_flushes_total") == flushes + 1
+
+
+def test_unchanged_state_leaves_the_session_unwritten():
+    skipped = counter("hungergod_session_writes_skipped_total")
+    ctx = stored_state(datetime.now())
+    try:
+        assert get_state()["step"] == "start"
+        flush_state(None)
+        assert not stores_session()
+    finally:
+        ctx.pop()
+    assert counter("hungergod_session_writes_skipped_total") == skipped + 1
+
+
+def test_old_state_is_written_again_before_it_expires():
+    ctx = stored_state(datetime.now() - timedelta(seconds=SESSION_REFRESH_AFTER + 1))
+    try:
+        get_state()
+        flush_state(None)
+        assert stores_session()
+        assert datetime.now() - session[session_key()]["last_active"] < timedelta(seconds=5)
+    finally:
+        ctx.pop()
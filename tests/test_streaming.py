@@ -0,0 +1,129 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from app import app as app_module, llm, openai_funcs
+from app.app import app
+from app.breaker import CircuitBreaker
+from app.budget import BudgetExceeded
+from app.cart_logic import Cart
+from app.llm import LLMUnavailable
+from app.metrics import registry, timed_stream
+from benchmarks import stub_openai
+from benchmarks.fake_openai import DEFAULT_REPLY
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # install() swaps the client module; put the real one back afterwards
+    monkeypatch.setattr(llm, "openai", llm.openai)
+    monkeypatch.setattr(llm, "_sync_client", (None, None))
+    monkeypatch.setattr(llm, "breaker", CircuitBreaker(failures=1, cooldown=60))
+    yield stub_openai.install()
+    llm._loop_resources.clear()
+
+
+def value(name, **labels):
+    return registry.collect().get((name, tuple(sorted(labels.items()))), 0)
+
+
+def observations(stage):
+    hist = value("hungergod_stage_seconds", stage=stage, path="none")
+    return sum(hist[:-1]) if hist else 0
+
+
+def events(response):
+    """(event, data) pairs of a server-sent event stream."""
+    out = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        if block:
+            event, data = block.split("\n")
+            out.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return out
+
+
+def test_stream_completion_yields_the_reply_and_counts_tokens(stub):
+    tokens = value("hungergod_llm_tokens_total", kind="chat", stage="function_result_llm", type="completion")
+    chunks = list(llm.stream_completion(stage="function_result_llm", messages=[{"role": "user", "content": "ciao"}]))
+    assert len(chunks) > 1
+    assert "".join(chunks) == DEFAULT_REPLY
+    assert value("hungergod_llm_tokens_total", kind="chat", stage="function_result_llm",
+                 type="completion") == tokens + len(chunks)
+
+
+def test_stream_cut_off_midway_is_unavailable(stub):
+    def cut_off(**kwargs):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Cer"))], usage=None)
+        raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    stub._chat = cut_off
+
+    chunks = llm.stream_completion(messages=[])
+    assert next(chunks) == "Cer"
+    with pytest.raises(LLMUnavailable):
+        next(chunks)
+    assert llm.breaker.state == "open"
+
+
+def test_timed_stream_records_first_token_and_total():
+    first, total = observations("streamed_first_token"), observations("streamed")
+    assert list(timed_stream("streamed", iter(["a", "b"]))) == ["a", "b"]
+    assert (observations("streamed_first_token"), observations("streamed")) == (first + 1, total + 1)
+    # Nothing sent: no first token, but the stage still ends
+    assert list(timed_stream("streamed", iter([]))) == []
+    assert (observations("streamed_first_token"), observations("streamed")) == (first + 1, total + 2)
+
+
+def cut(chunks, error):
+    yield from chunks
+    raise error
+
+
+def test_rephrase_falls_back_to_the_result_only_before_it_starts():
+    assert list(openai_funcs._rephrase_stream("risultato", cut([], BudgetExceeded("x")))) == ["risultato"]
+    chunks = openai_funcs._rephrase_stream("risultato", cut(["Cer"], BudgetExceeded("x")))
+    assert next(chunks) == "Cer"
+    with pytest.raises(BudgetExceeded):
+        next(chunks)
+
+
+def test_stream_or_fallback_keeps_what_was_sent():
+    with app.test_request_context("/chat/stream", method="POST"):
+        fallback = list(app_module._stream_or_fallback(cut([], BudgetExceeded("x"))))
+        assert fallback == [app_module._budget_fallback()]
+        degraded = list(app_module._stream_or_fallback(cut([], LLMUnavailable("x"))))
+        assert degraded == [app_module._degraded_reply()]
+        assert list(app_module._stream_or_fallback(cut(["Cer"], BudgetExceeded("x")))) == ["Cer"]
+
+
+def test_function_result_is_rephrased_as_a_stream(stub, monkeypatch):
+    state = {"step": "start", "cart": Cart(), "history": []}
+    with app.test_request_context("/chat/stream", method="POST"):
+        # Final functions answer with their own result
+        assert isinstance(openai_funcs.handle_function_call_stream("dove siete?", state), str)
+        monkeypatch.setattr(openai_funcs, "final_results", set())
+        reply = openai_funcs.handle_function_call_stream("dove siete?", state)
+        assert not isinstance(reply, str)
+        assert "".join(reply) == DEFAULT_REPLY
+
+
+def test_chat_stream_sends_deltas_then_the_whole_reply(monkeypatch):
+    monkeypatch.setattr(app_module, "respond_stream", lambda text: ["Aggiunto!", iter(["Certo", ", ecco"])])
+    response = app.test_client().post("/chat/stream", json={"message": "ciao"})
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    sent = events(response)
+    assert sent[:-1] == [("delta", {"text": "Aggiunto!"}), ("delta", {"text": "\n\nCerto"}),
+                         ("delta", {"text": ", ecco"})]
+    event, payload = sent[-1]
+    assert event == "done"
+    assert payload["response"] == "Aggiunto!\n\nCerto, ecco"
+    assert payload["cart"]["count"] == 0
+
+
+def test_chat_stream_failure_sends_what_was_written(monkeypatch):
+    monkeypatch.setattr(app_module, "respond_stream", lambda text: [cut(["Cer"], RuntimeError("boom"))])
+    sent = events(app.test_client().post("/chat/stream", json={"message": "ciao"}))
+    assert sent == [("delta", {"text": "Cer"}), ("error", {"response": "Cer"})]
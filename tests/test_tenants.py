@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from app.app import app
+from app.tenants import tenants
+
+
+@pytest.fixture
+def roma(tmp_path, monkeypatch):
+    """A second tenant, "roma", whose menu has neither the default's pizzas nor its prices."""
+    directory = tmp_path / "roma"
+    directory.mkdir()
+    menu = {"Pizze": [{"name": "Carbonara", "price": 9.0}, {"name": "Margherita", "price": 7.0}]}
+    (directory / "menu.json").write_text(json.dumps(menu), encoding="utf-8")
+    monkeypatch.setattr(tenants, "directory", str(tmp_path))
+    monkeypatch.setattr(tenants, "_hosts", None)
+    tenants._tenants.clear()
+    yield
+    tenants._tenants.clear()
+
+
+def chat(client, prefix, message):
+    response = client.post(f"{prefix}/chat", json={"message": message})
+    assert response.status_code == 200
+    return response.get_json()["cart"]
+
+
+def items(cart):
+    return {i["name"]: (i["quantity"], i["price"]) for i in cart["items"]}
+
+
+def test_switching_tenant_keeps_each_cart(roma):
+    client = app.test_client()
+    chat(client, "", "!welcome")
+    assert items(chat(client, "", "due diavole")) == {"Diavola": (2, 7.5)}
+    chat(client, "/t/roma", "!welcome")
+    assert items(chat(client, "/t/roma", "una carbonara e una margherita")) == {
+        "Carbonara": (1, 9.0), "Margherita": (1, 7.0),
+    }
+    # Each cart is priced from its own tenant's menu, never dropped by the other's
+    cart = chat(client, "", "una margherita")
+    assert items(cart) == {"Diavola": (2, 7.5), "Margherita": (1, 6.0)}
+    assert cart["unavailable"] == []
+    assert items(chat(client, "/t/roma", "una carbonara")) == {"Carbonara": (2, 9.0), "Margherita": (1, 7.0)}
+
+
+def test_items_missing_from_menu_are_flagged_not_dropped(roma):
+    from app.cart_logic import Cart
+    import pickle
+
+    with app.test_request_context("/t/roma/chat"):
+        cart = pickle.loads(pickle.dumps(Cart({"Carbonara": 1, "Diavola": 2}, "roma")))
+        assert cart.counts == {"Carbonara": 1}
+        assert cart.unavailable == {"Diavola": 2}
+        # Saved again as it was, should the item come back on the menu
+        assert pickle.loads(pickle.dumps(cart))._saved == {"Diavola": 2, "Carbonara": 1}